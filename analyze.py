@@ -31,16 +31,23 @@ from __future__ import print_function
 
 import argparse
 import common as co
+import gzip
+import hashlib
 import mptcp
 import os
 import os.path
+import shutil
+import signal
 import subprocess
 import sys
 import tcp
 import threading
+import time
 import traceback
 
 from multiprocessing import Process
+from multiprocessing import Queue
+from Queue import Empty
 
 
 ##################################################
@@ -56,6 +63,23 @@ DEF_TRACE_DIR = 'traces'
 DEF_GRAPH_DIR = 'graphs'
 # The default number of threads
 DEF_NB_THREADS = 1
+# Size of the buffer used to uncompress traces in the background
+STAGE_BUFFER_SIZE = 1024 * 1024
+# The default file with the durations of previous analyses
+DEF_COSTS_FILE = 'costs'
+# The default manifest file, with the traces already analyzed
+DEF_MANIFEST_FILE = 'manifest'
+# Size of the chunks read to hash input files
+HASH_CHUNK_SIZE = 1024 * 1024
+# Maximal number of traces sent to a worker of the pool and not reported yet
+POOL_QUEUE_FACTOR = 2
+# Delay (in seconds) between two checks of the workers of the pool
+POOL_POLL_DELAY = 1.0
+# Messages sent by the workers of the pool to the main process
+POOL_START = 'start'
+POOL_END = 'end'
+POOL_ERROR = 'error'
+POOL_TIMEOUT = 'timeout'
 
 ##################################################
 ##                   ARGUMENTS                  ##
@@ -116,6 +140,40 @@ parser.add_argument("-L",
                     "--light", help="don't process RTT or throughput in detail to save time", action="store_true")
 parser.add_argument("-U",
                     "--tcpcsm", help="use tcpcsm to give more info about retransmissions", action="store_true")
+parser.add_argument("-w",
+                    "--pool", help="process the analyse with a pool of -j long-lived worker processes instead of threads",
+                    action="store_true")
+parser.add_argument("-y",
+                    "--stage", type=int, help="uncompress at most the given number of traces in advance (at least -j) "
+                    + "while analyzing the previous ones, and use not compressed traces in place (unless -c)", default=0)
+parser.add_argument("-e",
+                    "--longest-first", help="analyze first the traces expected to be the longest to analyze, based on "
+                    + "their size and the durations of previous analyses", action="store_true")
+parser.add_argument("-E",
+                    "--costs", help="file where the durations of analyses are stored for -e", default=DEF_COSTS_FILE)
+parser.add_argument("-n",
+                    "--incremental", help="skip traces already analyzed with the same options and tools, according to the "
+                    + "manifest file", action="store_true")
+parser.add_argument("-N",
+                    "--manifest", help="manifest file where analyzed traces are stored for -n", default=DEF_MANIFEST_FILE)
+parser.add_argument("-S",
+                    "--shards", type=int, help="analyze the packets of each trace with the given number of processes, "
+                    + "each of them with a part of the connections", default=1)
+parser.add_argument("-O",
+                    "--overlap-tools", help="run the external tools analyzing each trace (mptcptrace, tstat and tcpcsm) at the "
+                    + "same time, with up to 4 processes per trace", action="store_true")
+parser.add_argument("-Z",
+                    "--scratch", help="directory of the temporary files of mptcptrace (by default " + co.DEF_SCRATCH_DIR
+                    + " if it has enough free space, the current directory otherwise)", default=None)
+parser.add_argument("-K",
+                    "--rtt-sketch", help="estimate the percentiles of the RTT of MPTCP connections with a sketch of bounded "
+                    + "size (with a relative error of 1%%) and store it instead of all RTT samples", action="store_true")
+parser.add_argument("-B",
+                    "--streaming", help="forget the state of TCP connections closed or idle for long while analyzing packets, to "
+                    + "bound the memory used by very long traces", action="store_true")
+parser.add_argument("-o",
+                    "--timeout", type=float, help="with -w, kill the analyse of a trace after the given number of seconds",
+                    default=None)
 
 args = parser.parse_args()
 
@@ -130,6 +188,8 @@ rtt_subflow_dir_exp = co.get_dir_from_arg(args.rtt_subflow, args.pcap[0])
 failed_conns_dir_exp = co.get_dir_from_arg(args.failed_conns, args.pcap[0])
 acksize_dir_exp = co.get_dir_from_arg(args.acksize, args.pcap[0])
 acksize_tcp_dir_exp = acksize_dir_exp + '_tcp'
+costs_filepath_exp = co.get_dir_from_arg(args.costs, args.pcap[0])
+manifest_filepath_exp = co.get_dir_from_arg(args.manifest, args.pcap[0])
 
 if os.path.isdir(in_dir_exp):
     # add the basename of the input dir
@@ -150,12 +210,100 @@ if args.stderr:
 else:
     print_out = sys.stdout
 
+##################################################
+##             INCREMENTAL ANALYSIS             ##
+##################################################
+
+
+def hash_file(filepath):
+    """ Return the SHA-1 digest (in hex) of the content of the file """
+    sha = hashlib.sha1()
+    hashed_file = open(filepath, 'rb')
+    chunk = hashed_file.read(HASH_CHUNK_SIZE)
+    while chunk:
+        sha.update(chunk)
+        chunk = hashed_file.read(HASH_CHUNK_SIZE)
+    hashed_file.close()
+    return sha.hexdigest()
+
+
+def get_tool_id(tool):
+    """ Return an identifier of the version of the tool (hash of its executable) or None if not found """
+    for path in os.environ.get('PATH', '').split(os.pathsep):
+        tool_path = os.path.join(path, tool)
+        if os.path.isfile(tool_path) and os.access(tool_path, os.X_OK):
+            return hash_file(tool_path)
+    return None
+
+
+def get_analysis_id():
+    """ Return an identifier of the options and tools having an impact on the results of the analysis """
+    tools = ['tstat', 'mptcptrace']
+    if args.tcpcsm:
+        tools.append('tcpcsm')
+    options = [args.light, args.tcpcsm, args.cwin, args.is_mptcp, args.is_tcp, args.rtt_sketch, args.streaming]
+    return repr(options) + ''.join([tool + ':' + str(get_tool_id(tool)) for tool in tools])
+
+
+def get_trace_key(input_filepath):
+    """ Return the key of the manifest for the analysis of the input file with the current options and tools """
+    return hashlib.sha1(hash_file(input_filepath) + analysis_id).hexdigest()
+
+
+def get_stat_filepath(pcap_filepath):
+    """ Return the path of the stat file saved by co.save_data for pcap_filepath """
+    return os.path.join(stat_dir_exp, os.path.splitext(os.path.basename(pcap_filepath))[0])
+
+
+def is_already_analyzed(pcap_filepath, key):
+    """ Return True if pcap_filepath was analyzed with the same input, options and tools and its stats still exist """
+    return manifest.get(os.path.basename(pcap_filepath), None) == key and os.path.isfile(get_stat_filepath(pcap_filepath))
+
+
+def save_manifest(manifest_filepath, manifest, durations):
+    """ Update the manifest with the traces analyzed without error now (the ones in durations) and save it """
+    for pcap_filepath in durations:
+        if os.path.isfile(get_stat_filepath(pcap_filepath)):
+            manifest[os.path.basename(pcap_filepath)] = trace_keys[pcap_filepath]
+    co.save_object(manifest, manifest_filepath)
+
+
+if args.incremental:
+    analysis_id = get_analysis_id()
+    manifest = co.load_object(manifest_filepath_exp) if os.path.isfile(manifest_filepath_exp) else {}
+
+# pcap_filepath -> key of its analysis in the manifest
+trace_keys = {}
+
 ##################################################
 ##                 PREPROCESSING                ##
 ##################################################
 
 
-def uncompress_file(filename, dirpath):
+def copy_file_in_background(filename, dirpath, output_filepath):
+    """ Uncompress (or copy) the file without launching any process
+        Because other threads fork processes meanwhile, a subprocess launched here could never return, as
+        forked processes would inherit the pipe used by subprocess to check that the command was launched
+    """
+    input_filepath = os.path.join(dirpath, filename)
+    try:
+        if filename.endswith('.gz'):
+            input_file = gzip.open(input_filepath, 'rb')
+            output = open(output_filepath, 'wb')
+            shutil.copyfileobj(input_file, output, STAGE_BUFFER_SIZE)
+            output.close()
+            input_file.close()
+        else:
+            shutil.copyfile(input_filepath, output_filepath)
+        return True
+    except (IOError, OSError) as e:
+        print(str(e) + ": error when uncompressing or copying " + filename, file=sys.stderr)
+        if os.path.exists(output_filepath):
+            os.remove(output_filepath)
+        return False
+
+
+def uncompress_file(filename, dirpath, in_place=False, background=False):
     if any(match in filename for match in args.pcap):
         # Files from UI tests will be compressed; unzip them
         if filename.endswith('.pcap.gz'):
@@ -167,6 +315,8 @@ def uncompress_file(filename, dirpath):
                 return output_filepath
             else:
                 print("Uncompressing " + filename + " to " + trace_dir_exp, file=print_out)
+                if background:
+                    return copy_file_in_background(filename, dirpath, output_filepath) and output_filepath
                 output = open(output_filepath, 'w')
                 cmd = ['gunzip', '-c', '-9', os.path.join(dirpath, filename)]
                 if args.keep:
@@ -177,6 +327,8 @@ def uncompress_file(filename, dirpath):
                 else:
                     output.close()
                     return output_filepath
+        elif filename.endswith('.pcap') and in_place:
+            return os.path.join(dirpath, filename)
         elif filename.endswith('.pcap'):
             output_filepath = os.path.join(trace_dir_exp, filename)
             # if args.not_correct:
@@ -187,6 +339,8 @@ def uncompress_file(filename, dirpath):
             else:
                 # Move the file to out_dir_exp
                 print("Copying " + filename + " to " + trace_dir_exp, file=print_out)
+                if background:
+                    return copy_file_in_background(filename, dirpath, output_filepath) and output_filepath
                 cmd = ['cp', os.path.join(dirpath, filename), output_filepath]
                 if subprocess.call(cmd, stdout=print_out) != 0:
                     print("Error when moving " + filename, file=sys.stderr)
@@ -197,24 +351,191 @@ def uncompress_file(filename, dirpath):
     return False
 
 
+def is_staged(pcap_filepath):
+    """ Return True if pcap_filepath was uncompressed or copied in the traces directory """
+    return os.path.dirname(pcap_filepath) == trace_dir_exp
+
+
+def get_trace_filepath(filename, dirpath, in_place=False):
+    """ Return the path of the trace that uncompress_file will give for filename, or False if it is not a valid one """
+    if not any(match in filename for match in args.pcap):
+        return False
+    if filename.endswith('.pcap.gz'):
+        return os.path.join(trace_dir_exp, filename[:-3])
+    elif filename.endswith('.pcap') and in_place:
+        return os.path.join(dirpath, filename)
+    elif filename.endswith('.pcap'):
+        return os.path.join(trace_dir_exp, filename)
+    print(filename + ": not in a valid format, skipped", file=sys.stderr)
+    return False
+
+
+class TraceStager(threading.Thread):
+
+    """ Uncompress traces in the background while the previous ones are analyzed
+        At most window traces are uncompressed (or copied) and not analyzed yet; traces that do not need
+        to be uncompressed are used in place
+        It replaces pcap_list: pop() waits for the next trace and raises IndexError when there is no more trace
+    """
+
+    def __init__(self, inputs, window, in_place):
+        super(TraceStager, self).__init__()
+        self.daemon = True
+        # List of (filename, dirpath, pcap_filepath), the next one to stage at the end
+        self.inputs = inputs
+        self.in_place = in_place
+        self.slots = threading.Semaphore(window)
+        self.staged = []
+        self.remaining = len(inputs)
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        """ Number of traces that were not popped yet """
+        return self.remaining
+
+    def add(self, filename, dirpath, pcap_filepath):
+        """ Add a trace to uncompress, must be called before start() """
+        self.inputs.append((filename, dirpath, pcap_filepath))
+        self.remaining += 1
+
+    def sort(self, key):
+        self.inputs.sort(key=lambda trace: key(trace[2]))
+
+    def reverse(self):
+        self.inputs.reverse()
+
+    def run(self):
+        while self.inputs:
+            filename, dirpath, pcap_filepath = self.inputs.pop()
+            if is_staged(pcap_filepath):
+                self.slots.acquire()
+            if not uncompress_file(filename, dirpath, in_place=self.in_place, background=True):
+                self.release(pcap_filepath)
+                pcap_filepath = None
+            with self.cond:
+                if pcap_filepath:
+                    self.staged.append(pcap_filepath)
+                else:
+                    self.remaining -= 1
+                self.cond.notify_all()
+
+    def is_ready(self):
+        """ Return True if pop() will not wait """
+        with self.cond:
+            return len(self.staged) > 0 or self.remaining == 0
+
+    def pop(self):
+        with self.cond:
+            while not self.staged:
+                if self.remaining == 0:
+                    raise IndexError("pop from empty TraceStager")
+                self.cond.wait(POOL_POLL_DELAY)
+            self.remaining -= 1
+            return self.staged.pop(0)
+
+    def release(self, pcap_filepath):
+        """ Indicate that the analysis of pcap_filepath is over, so that another trace can be uncompressed """
+        if is_staged(pcap_filepath):
+            self.slots.release()
+
+
 def add_if_valid(list, item):
     if item:
         list.append(item)
 
-pcap_list = []
+
+def add_trace(filename, dirpath):
+    """ Uncompress the file if needed (unless with -y) and add it to pcap_list, remembering the size of the input
+        With -n, skip it if it was already analyzed
+    """
+    if args.incremental:
+        pcap_filepath = get_trace_filepath(filename, dirpath, in_place=args.stage and not args.clean)
+        if not pcap_filepath:
+            return
+        key = get_trace_key(os.path.join(dirpath, filename))
+        if is_already_analyzed(pcap_filepath, key):
+            print(filename + ": already analyzed, skipped", file=print_out)
+            return
+        trace_keys[pcap_filepath] = key
+
+    if args.stage:
+        pcap_filepath = get_trace_filepath(filename, dirpath, in_place=not args.clean)
+        if pcap_filepath:
+            pcap_list.add(filename, dirpath, pcap_filepath)
+    else:
+        pcap_filepath = uncompress_file(filename, dirpath)
+        add_if_valid(pcap_list, pcap_filepath)
+    if pcap_filepath:
+        input_sizes[pcap_filepath] = (os.path.getsize(os.path.join(dirpath, filename)), filename.endswith('.gz'))
+
+# With -y, traces are uncompressed in the background by pcap_list itself
+pcap_list = TraceStager([], args.stage, not args.clean) if args.stage else []
+# pcap_filepath -> (size of the input file, True if the input is compressed)
+input_sizes = {}
 co.check_directory_exists(trace_dir_exp)
 if not args.dir_input:
     if os.path.isdir(in_dir_exp):
         for dirpath, dirnames, filenames in os.walk(in_dir_exp):
             for filename in filenames:
-                add_if_valid(pcap_list, uncompress_file(filename, dirpath))
+                add_trace(filename, dirpath)
     else:
-        add_if_valid(pcap_list, uncompress_file(os.path.basename(in_dir_exp),
-                                                os.path.dirname(in_dir_exp)))
+        add_trace(os.path.basename(in_dir_exp), os.path.dirname(in_dir_exp))
 
 pcap_list_len = len(pcap_list)
 
 
+##################################################
+##                  COST MODEL                  ##
+##################################################
+
+
+def load_costs(costs_filepath):
+    """ Return the costs of previous analyses, as a dictionary pcap_fname -> (input_size, is_compressed, duration) """
+    if not os.path.isfile(costs_filepath):
+        return {}
+    try:
+        return co.load_object(costs_filepath)
+    except Exception as e:
+        print(str(e) + ': ignore costs file ' + costs_filepath, file=sys.stderr)
+        return {}
+
+
+def save_costs(costs_filepath, costs, durations):
+    """ Update costs with the durations (in seconds) of the traces analyzed now and save them """
+    for pcap_filepath, duration in durations.iteritems():
+        input_size, is_compressed = input_sizes[pcap_filepath]
+        costs[os.path.basename(pcap_filepath)] = (input_size, is_compressed, duration)
+    co.save_object(costs, costs_filepath)
+
+
+def sort_longest_first(pcap_list, costs):
+    """ Sort pcap_list such that pop() returns the trace expected to be the longest to analyze
+        A trace that did not change since its previous analysis is expected to take the same time
+        Otherwise, its input size is weighted by the average duration per byte of previous analyses
+        of inputs of the same kind (compressed or not)
+    """
+    sizes = {True: 0, False: 0}
+    durations = {True: 0.0, False: 0.0}
+    for input_size, is_compressed, duration in costs.values():
+        sizes[is_compressed] += input_size
+        durations[is_compressed] += duration
+
+    rates = {}
+    for is_compressed in [True, False]:
+        if sizes[is_compressed] > 0:
+            rates[is_compressed] = durations[is_compressed] / sizes[is_compressed]
+    # Without history, the size of the input is the only available information
+    default_rate = rates.get(True, rates.get(False, 1.0))
+
+    def get_cost(pcap_filepath):
+        input_size, is_compressed = input_sizes[pcap_filepath]
+        previous = costs.get(os.path.basename(pcap_filepath), None)
+        if previous and previous[0] == input_size and previous[1] == is_compressed:
+            return previous[2]
+        return input_size * rates.get(is_compressed, default_rate)
+
+    pcap_list.sort(key=get_cost)
+
 ##################################################
 ##                  FETCH DB                    ##
 ##################################################
@@ -235,8 +556,27 @@ if args.use_db:
 ##                   THREADS                    ##
 ##################################################
 
-def launch_analyze_pcap(pcap_filepath, clean, correct, graph, purge, cwin):
+class AnalyzeError(Exception):
+    pass
+
+
+def run_analyze(target, args, kwargs, fork):
+    """ Call target with args and kwargs, in a new process if fork is True
+        Return False if that process did not end successfully (without fork, errors are raised as usual)
+    """
+    if fork:
+        p = Process(target=target, args=args, kwargs=kwargs)
+        p.start()
+        p.join()
+        return p.exitcode == 0
+    else:
+        target(*args, **kwargs)
+        return True
+
+
+def launch_analyze_pcap(pcap_filepath, clean, correct, graph, purge, cwin, fork=True):
     pcap_filename = os.path.basename(pcap_filepath)
+    success = True
     # Cleaning, if needed (in future pcap, tcpdump should do the job)
     if clean:
         co.clean_loopback_pcap(pcap_filepath, print_out=print_out)
@@ -244,30 +584,36 @@ def launch_analyze_pcap(pcap_filepath, clean, correct, graph, purge, cwin):
     if args.is_mptcp or pcap_filename.startswith('mptcp'):
         # if correct:
         #    tcp.correct_trace(pcap_filepath, print_out=print_out)
-        # we need to change dir, do that in a new process
+        # we need to change dir, do that in a new process (if we are not already in a worker of the pool)
         if graph:
-            p = Process(target=mptcp.process_trace, args=(
-                pcap_filepath, graph_dir_exp, stat_dir_exp, aggl_dir_exp, rtt_dir_exp, rtt_subflow_dir_exp, failed_conns_dir_exp, acksize_dir_exp, acksize_tcp_dir_exp, cwin, args.tcpcsm,), kwargs={'min_bytes': args.min_bytes, 'light': args.light})
-            p.start()
-            p.join()
+            success = run_analyze(mptcp.process_trace, (pcap_filepath, graph_dir_exp, stat_dir_exp, aggl_dir_exp, rtt_dir_exp, rtt_subflow_dir_exp, failed_conns_dir_exp, acksize_dir_exp, acksize_tcp_dir_exp, cwin, args.tcpcsm,),
+                                  {'min_bytes': args.min_bytes, 'light': args.light, 'nb_shards': args.shards,
+                                   'overlap_tools': args.overlap_tools, 'scratch_dir': args.scratch, 'rtt_sketch': args.rtt_sketch,
+                                   'streaming': args.streaming},
+                                  fork)
     elif args.is_tcp or pcap_filename.startswith('tcp'):
         #if correct:
         #    tcp.correct_trace(pcap_filepath, print_out=print_out)
         if graph:
-            p = Process(target=tcp.process_trace, args=(pcap_filepath, graph_dir_exp, stat_dir_exp, failed_conns_dir_exp, acksize_tcp_dir_exp, args.tcpcsm,), kwargs={'print_out': print_out, 'light': args.light})
-            p.start()
-            p.join()
+            success = run_analyze(tcp.process_trace, (pcap_filepath, graph_dir_exp, stat_dir_exp, failed_conns_dir_exp, acksize_tcp_dir_exp, args.tcpcsm,),
+                                  {'print_out': print_out, 'light': args.light, 'nb_shards': args.shards,
+                                   'overlap_tools': args.overlap_tools, 'streaming': args.streaming}, fork)
     else:
         print(pcap_filepath + ": don't know the protocol used; skipped", file=sys.stderr)
         print("Note: if your traces contains MPTCP, please specify the -M option", file=sys.stderr)
 
     print('End for file ' + pcap_filepath, file=print_out)
-    if purge and graph:  # if we just want to correct traces, do not remove them
+    # if we just want to correct traces, do not remove them; never remove traces used in place
+    if purge and graph and is_staged(pcap_filepath):
         os.remove(pcap_filepath)
+    # Its old stats (if any) must not be considered as the result of this analysis
+    if not success:
+        raise AnalyzeError("Analysis process of " + pcap_filepath + " ended with an error")
 
 
 def thread_launch(thread_id, clean, correct, graph, purge, cwin):
     global pcap_list
+    global durations
     while True:
         try:
             pcap_filepath = pcap_list.pop()
@@ -276,12 +622,170 @@ def thread_launch(thread_id, clean, correct, graph, purge, cwin):
         analyze_no = str(pcap_list_len - len(pcap_list)) + "/" + str(pcap_list_len)
         print("Thread " + str(thread_id) + ": Analyze: " + pcap_filepath + " (" + analyze_no + ")", file=print_out)
         try:
+            start_time = time.time()
             launch_analyze_pcap(pcap_filepath, clean, correct, graph, purge, cwin)
+            durations[pcap_filepath] = time.time() - start_time
         except:
             print(traceback.format_exc(), file=sys.stderr)
             print('Error when analyzing ' + pcap_filepath + ': skip', file=sys.stderr)
+        if args.stage:
+            pcap_list.release(pcap_filepath)
     print("Thread " + str(thread_id) + ": End", file=print_out)
 
+##################################################
+##                     POOL                     ##
+##################################################
+
+
+def pool_worker(worker_id, task_queue, result_queue, clean, correct, graph, purge, cwin):
+    """ Body of a long-lived worker process of the pool
+        Analyze the traces received on its own task_queue until None is received, and report each of them on result_queue
+    """
+    # Own process group, to be able to kill the external tools launched for a trace with the worker
+    os.setpgrp()
+    while True:
+        pcap_filepath = task_queue.get()
+        if pcap_filepath is None:
+            break
+        start_time = time.time()
+        result_queue.put((POOL_START, worker_id, pcap_filepath, start_time))
+        try:
+            launch_analyze_pcap(pcap_filepath, clean, correct, graph, purge, cwin, fork=False)
+            result_queue.put((POOL_END, worker_id, pcap_filepath, time.time() - start_time))
+        except:
+            print(traceback.format_exc(), file=sys.stderr)
+            print('Error when analyzing ' + pcap_filepath + ': skip', file=sys.stderr)
+            result_queue.put((POOL_ERROR, worker_id, pcap_filepath, time.time() - start_time))
+
+
+def kill_pool_worker(worker):
+    """ Kill the worker and all processes it launched """
+    try:
+        os.killpg(worker.pid, signal.SIGKILL)
+    except OSError:
+        # Already dead
+        pass
+    worker.join()
+
+
+def pool_launch(nb_workers, clean, correct, graph, purge, cwin, timeout=None):
+    """ Analyze all traces of pcap_list with a pool of nb_workers long-lived worker processes
+        If timeout is given, the analyse of a trace lasting more than timeout seconds is killed with
+        its worker, that is replaced by a new one
+        Return a dictionary with, for each trace, a tuple (status, duration in seconds)
+    """
+    global pcap_list
+    results = {}
+    if not pcap_list:
+        return results
+
+    result_queue = Queue()
+    workers = {}
+    # worker_id -> queue of the traces sent to the worker
+    task_queues = {}
+    # worker_id -> traces sent to the worker and not reported yet, in the order they were sent
+    # The first one is the trace the worker is analyzing (or will analyze next), even before it reports its start
+    assigned = {}
+    # worker_id -> (pcap_filepath, start_time) of the trace currently analyzed by the worker
+    running = {}
+    # Traces sent to a worker that was killed or died before taking them, to send to other workers (in pop order)
+    requeued = []
+    worker_args = (result_queue, clean, correct, graph, purge, cwin)
+
+    def start_worker(worker_id):
+        task_queues[worker_id] = Queue()
+        assigned[worker_id] = []
+        workers[worker_id] = Process(target=pool_worker, args=(worker_id, task_queues[worker_id]) + worker_args)
+        workers[worker_id].start()
+
+    def stop_worker(worker_id):
+        kill_pool_worker(workers.pop(worker_id))
+        running.pop(worker_id, None)
+        task_queues.pop(worker_id)
+        # The first trace was taken by the worker, the other ones are still waiting
+        requeued.extend(reversed(assigned.pop(worker_id)[1:]))
+
+    def end_task(pcap_filepath, status, duration):
+        results[pcap_filepath] = (status, duration)
+        if args.stage:
+            pcap_list.release(pcap_filepath)
+
+    for worker_id in range(nb_workers):
+        start_worker(worker_id)
+    next_worker_id = nb_workers
+
+    try:
+        while pcap_list or requeued or [worker_id for worker_id in assigned if assigned[worker_id]]:
+            # Send traces to the least loaded workers, without waiting for traces being uncompressed
+            while pcap_list or requeued:
+                worker_id = min(assigned.keys(), key=lambda worker_id: len(assigned[worker_id]))
+                if len(assigned[worker_id]) >= POOL_QUEUE_FACTOR:
+                    break
+                if requeued:
+                    pcap_filepath = requeued.pop()
+                elif args.stage and not pcap_list.is_ready():
+                    break
+                else:
+                    pcap_filepath = pcap_list.pop()
+                assigned[worker_id].append(pcap_filepath)
+                task_queues[worker_id].put(pcap_filepath)
+
+            # Collect all reports of the workers before checking them
+            try:
+                status, worker_id, pcap_filepath, value = result_queue.get(timeout=POOL_POLL_DELAY)
+                while True:
+                    if status == POOL_START:
+                        running[worker_id] = (pcap_filepath, value)
+                        analyze_no = str(len(results) + len(running)) + "/" + str(pcap_list_len)
+                        print("Worker " + str(worker_id) + ": Analyze: " + pcap_filepath + " (" + analyze_no + ")", file=print_out)
+                    else:
+                        running.pop(worker_id, None)
+                        if pcap_filepath in assigned.get(worker_id, []):
+                            assigned[worker_id].remove(pcap_filepath)
+                        if pcap_filepath not in results:
+                            end_task(pcap_filepath, status, value)
+                        else:
+                            # Report of a trace that was considered as too long or lost
+                            results[pcap_filepath] = (status, value)
+                    status, worker_id, pcap_filepath, value = result_queue.get_nowait()
+            except Empty:
+                pass
+
+            # Replace workers that died or lasted too long on their trace
+            for worker_id in workers.keys():
+                pcap_filepath, start_time = running.get(worker_id, (None, None))
+                if pcap_filepath and timeout and time.time() - start_time > timeout:
+                    print("Worker " + str(worker_id) + ": timeout when analyzing " + pcap_filepath + ": kill it", file=sys.stderr)
+                    end_task(pcap_filepath, POOL_TIMEOUT, time.time() - start_time)
+                elif workers[worker_id].is_alive():
+                    continue
+                elif assigned[worker_id]:
+                    # Without report, the trace is lost even if the worker died before reporting its start
+                    pcap_filepath = assigned[worker_id][0]
+                    print("Worker " + str(worker_id) + ": died when analyzing " + pcap_filepath, file=sys.stderr)
+                    end_task(pcap_filepath, POOL_ERROR, time.time() - start_time if start_time else 0.0)
+                stop_worker(worker_id)
+                start_worker(next_worker_id)
+                next_worker_id += 1
+
+        # Stop the workers
+        for worker_id in workers:
+            task_queues[worker_id].put(None)
+        for worker in workers.values():
+            worker.join()
+    finally:
+        for worker in workers.values():
+            if worker.is_alive():
+                kill_pool_worker(worker)
+
+    nb_ok = len([pcap for pcap in results if results[pcap][0] == POOL_END])
+    print("Pool: " + str(nb_ok) + "/" + str(pcap_list_len) + " traces analyzed without error", file=print_out)
+    for pcap_filepath in sorted(results.keys()):
+        if not results[pcap_filepath][0] == POOL_END:
+            print("Pool: " + results[pcap_filepath][0] + " for " + pcap_filepath, file=sys.stderr)
+
+    return results
+
 ##################################################
 ##                     MAIN                     ##
 ##################################################
@@ -300,12 +804,28 @@ co.check_directory_exists(failed_conns_dir_exp)
 co.check_directory_exists(acksize_dir_exp)
 co.check_directory_exists(acksize_tcp_dir_exp)
 # If file is a .pcap, use it for (mp)tcptrace
-pcap_list.reverse()  # we will use pop: use the natural order
+if args.longest_first:
+    costs = load_costs(costs_filepath_exp)
+    sort_longest_first(pcap_list, costs)
+else:
+    pcap_list.reverse()  # we will use pop: use the natural order
+
+if args.stage:
+    pcap_list.start()
+
+# Duration (in seconds) of the analyses that ended without error
+durations = {}
 
 if not args.dir_input:
     threads = []
     args.threads = min(args.threads, pcap_list_len)
-    if args.threads > 1:
+    if args.pool:
+        results = pool_launch(args.threads, args.clean, not args.not_correct, not args.not_graph, not args.not_purge, args.cwin,
+                              timeout=args.timeout)
+        for pcap_filepath, (status, duration) in results.iteritems():
+            if status == POOL_END:
+                durations[pcap_filepath] = duration
+    elif args.threads > 1:
         # Launch new thread
         for thread_id in range(args.threads):
             thread = threading.Thread(target=thread_launch,
@@ -319,6 +839,11 @@ if not args.dir_input:
     else:
         thread_launch(0, args.clean, not args.not_correct, not args.not_graph, not args.not_purge, args.cwin)
 
+    if args.longest_first:
+        save_costs(costs_filepath_exp, costs, durations)
+    if args.incremental:
+        save_manifest(manifest_filepath_exp, manifest, durations)
+
 else:
     # p = Process(target=mptcp.process_trace, args=(
     #             in_dir_exp, graph_dir_exp, stat_dir_exp, aggl_dir_exp, rtt_dir_exp, rtt_subflow_dir_exp, failed_conns_dir_exp, acksize_dir_exp, acksize_tcp_dir_exp, cwin,), kwargs={'min_bytes': args.min_bytes, 'light': args.light})
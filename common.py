@@ -23,6 +23,10 @@ from __future__ import print_function
 #                    IMPORTS                     #
 ##################################################
 
+from datetime import timedelta
+
+import gc
+import math
 import os
 import matplotlib
 # Do not use any X11 backend
@@ -30,22 +34,33 @@ matplotlib.use('Agg')
 matplotlib.rcParams['pdf.fonttype'] = 42
 matplotlib.rcParams['ps.fonttype'] = 42
 import matplotlib.pyplot as plt
+import collections
+import cPickle
+import mmap
 import numpy as np
 import pickle
 from scipy.stats import gaussian_kde
 import shutil
+import struct
 import subprocess
 import sys
 import tempfile
 import threading
 import traceback
 
+from itertools import izip
+from multiprocessing import cpu_count
 from multiprocessing import Process
+from multiprocessing import Queue
+from Queue import Empty
 
 ##################################################
 #                COMMON CLASSES                  #
 ##################################################
 
+# Default relative accuracy of the quantiles given by a QuantileSketch
+SKETCH_REL_ACCURACY = 0.01
+
 
 class cd:
 
@@ -61,6 +76,75 @@ class cd:
     def __exit__(self, etype, value, traceback):
         os.chdir(self.savedPath)
 
+
+class gc_paused:
+
+    """ Context manager disabling the garbage collector, when building many objects that are kept anyway """
+
+    def __enter__(self):
+        self.wasEnabled = gc.isenabled()
+        gc.disable()
+
+    def __exit__(self, etype, value, traceback):
+        if self.wasEnabled:
+            gc.enable()
+
+
+class QuantileSketch:
+
+    """ Summary of a (possibly huge) set of positive values, with a bounded size, giving its quantiles with a relative
+        error of at most rel_accuracy
+        Values are counted in buckets of exponentially increasing sizes (as in DDSketch); values <= 0 in a
+        separate bucket
+    """
+
+    def __init__(self, rel_accuracy=SKETCH_REL_ACCURACY):
+        self.gamma = (1.0 + rel_accuracy) / (1.0 - rel_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.sum = 0.0
+        self.sum_squares = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, values):
+        """ Add the values of the array values to the sketch """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+
+        positives = values[values > 0.0]
+        indexes, counts = np.unique(np.ceil(np.log(positives) / self.log_gamma).astype(np.int64), return_counts=True)
+        for index, count in izip(indexes.tolist(), counts.tolist()):
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += len(values) - len(positives)
+        self.count += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.sum += values.sum()
+        self.sum_squares += np.dot(values, values)
+
+    def mean(self):
+        return self.sum / self.count
+
+    def std(self):
+        return math.sqrt(max(self.sum_squares / self.count - self.mean() ** 2, 0.0))
+
+    def percentiles(self, percents):
+        """ Return an array with the estimations of the given percentiles (as np.percentile) """
+        indexes = sorted(self.buckets.keys())
+        # Middle of buckets, such that the relative error is at most rel_accuracy
+        values = np.append([0.0], 2.0 * np.power(self.gamma, indexes) / (self.gamma + 1.0))
+        cumul_counts = np.cumsum([self.zero_count] + [self.buckets[index] for index in indexes])
+        ranks = np.asarray(percents, dtype=np.float64) / 100.0 * (self.count - 1)
+        estimations = values[np.searchsorted(cumul_counts, ranks, side='right')]
+        return np.clip(estimations, self.min, self.max)
+
 ##################################################
 #               COMMON EXCEPTIONS                #
 ##################################################
@@ -69,6 +153,10 @@ class cd:
 class TSharkError(Exception):
     pass
 
+
+class PcapError(Exception):
+    pass
+
 ##################################################
 #                COMMON CONSTANTS                #
 ##################################################
@@ -93,6 +181,10 @@ DEF_FAILED_CONNS_DIR = 'failed_conns'
 DEF_ACKSIZE_DIR = 'acksize'
 # The default interface to analyse
 DEF_IFACE = 'any'
+# The default directory of temporary files written by external tools (in memory), if it has enough free space
+DEF_SCRATCH_DIR = '/dev/shm'
+# Free space needed in DEF_SCRATCH_DIR to use it for a trace, as a factor of the size of the trace
+SCRATCH_SIZE_FACTOR = 4
 
 # The time sequence and throughput graphs directory
 TSG_THGPT_DIR = 'tsg_thgpt'
@@ -291,7 +383,6 @@ RETRANS_DSS = 'retrans_dss'
 
 if os.path.isfile('config.py'):
     import config as conf
-    import collections
     if isinstance(conf.IP_PROXY, collections.Iterable) and not isinstance(conf.IP_PROXY, str):
         IP_PROXY = list(conf.IP_PROXY)
     else:
@@ -309,10 +400,196 @@ if os.path.isfile('config.py'):
 ##################################################
 
 
-class BasicFlow(object):
+class AttrSchema(object):
+
+    """ Numbering of the keys of the AttrRecords of the same kind (e.g. directions of flows), given by get_attr_schema """
+
+    def __init__(self, name):
+        self.name = name
+        self.indexes = {}
+
+    def __reduce__(self):
+        return (get_attr_schema, (self.name,))
+
+
+# AttrSchemas by name
+attr_schemas = {}
+
+
+def get_attr_schema(name):
+    """ Return the AttrSchema with the given name (the same object for the same name) """
+    if name not in attr_schemas:
+        attr_schemas[name] = AttrSchema(name)
+    return attr_schemas[name]
+
+
+# Value of keys of the schema not in an AttrRecord
+_MISSING = object()
+
+
+class AttrRecord(object):
+
+    """ Dictionary of attributes with the keys of its AttrSchema: values are kept in the list fields, indexed by the number of
+        their key in the schema, which is much smaller than a dict if there are a lot of records with the same keys
+        It has the same methods as a dict (and is considered as a MutableMapping)
+    """
+    __slots__ = ('schema', 'fields')
+
+    def __init__(self, schema, items=()):
+        self.schema = schema
+        items = dict(items)
+        indexes = schema.indexes
+        for key in items:
+            if key not in indexes:
+                indexes[key] = len(indexes)
+        # Fill all fields at once (loading stats creates a lot of records)
+        self.fields = [_MISSING] * (max([indexes[key] for key in items]) + 1 if items else 0)
+        for key, value in items.iteritems():
+            self.fields[indexes[key]] = value
+
+    def __reduce__(self):
+        return (AttrRecord, (self.schema,), None, None, self.iteritems())
+
+    def __getitem__(self, key):
+        try:
+            value = self.fields[self.schema.indexes[key]]
+        except (KeyError, IndexError):
+            raise KeyError(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        index = self.schema.indexes.get(key, None)
+        if index is None:
+            index = self.schema.indexes[key] = len(self.schema.indexes)
+        if index >= len(self.fields):
+            self.fields.extend([_MISSING] * (index + 1 - len(self.fields)))
+        self.fields[index] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.fields[self.schema.indexes[key]] = _MISSING
+
+    def __contains__(self, key):
+        index = self.schema.indexes.get(key, None)
+        return index is not None and index < len(self.fields) and self.fields[index] is not _MISSING
+
+    has_key = __contains__
+
+    def __len__(self):
+        return len(self.fields) - self.fields.count(_MISSING)
+
+    def __eq__(self, other):
+        return isinstance(other, (dict, AttrRecord)) and dict(self.iteritems()) == dict(other.iteritems())
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+    def iteritems(self):
+        for key, index in self.schema.indexes.items():
+            if index < len(self.fields) and self.fields[index] is not _MISSING:
+                yield key, self.fields[index]
+
+    def iterkeys(self):
+        for key, value in self.iteritems():
+            yield key
+
+    __iter__ = iterkeys
+
+    def itervalues(self):
+        for key, value in self.iteritems():
+            yield value
+
+    def items(self):
+        return list(self.iteritems())
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self and default:
+            return default[0]
+        value = self[key]
+        del self[key]
+        return value
+
+    def update(self, items=(), **kwargs):
+        for key, value in (items.iteritems() if isinstance(items, (dict, AttrRecord)) else items):
+            self[key] = value
+        for key, value in kwargs.iteritems():
+            self[key] = value
+
+    def copy(self):
+        return AttrRecord(self.schema, self.iteritems())
+
+
+collections.MutableMapping.register(AttrRecord)
+
+
+def compact_attr(attr, schema_name):
+    """ Return the attr dictionary of a flow or connection as an AttrRecord, as well as the ones of its directions """
+    attr = dict(attr)
+    for direction in DIRECTIONS:
+        if isinstance(attr.get(direction, None), (dict, AttrRecord)):
+            attr[direction] = AttrRecord(get_attr_schema(schema_name + '_' + direction), attr[direction])
+    return AttrRecord(get_attr_schema(schema_name), attr)
+
+
+def expand_attr(attr):
+    """ Return the attr of a flow or connection as a dictionary, as well as the ones of its directions """
+    return dict([(key, dict(value.iteritems()) if key in DIRECTIONS and isinstance(value, AttrRecord) else value)
+                 for key, value in attr.iteritems()])
+
+
+class CompactObject(object):
+
+    """ Object whose attributes are in __slots__, pickled as a dictionary of them (as it would be without __slots__)
+        Its attr (if any) is kept as an AttrRecord once unpickled (e.g. when loading stats)
+    """
+    __slots__ = ()
+
+    def __getstate__(self):
+        state = {}
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+        if 'attr' in state:
+            state['attr'] = expand_attr(state['attr'])
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            if name == 'attr':
+                value = compact_attr(value, type(self).__name__)
+            setattr(self, name, value)
+
+
+class BasicFlow(CompactObject):
 
     """ Represent a flow between two hosts at transport layer """
-    attr = {C2S: {}, S2C: {}}
+    __slots__ = ('attr',)
 
     def __init__(self):
         self.attr = {C2S: {}, S2C: {}}
@@ -342,11 +619,10 @@ class BasicFlow(object):
             self.attr[TYPE] = IPv6
 
 
-class BasicConnection(object):
+class BasicConnection(CompactObject):
 
     """ Represent a connection between two hosts at high level """
-    conn_id = ""
-    attr = {C2S: {}, S2C: {}}
+    __slots__ = ('conn_id', 'attr')
 
     def __init__(self, cid):
         self.conn_id = cid
@@ -372,6 +648,300 @@ def load_object(fname):
     file.close()
     return obj
 
+##################################################
+#              COLUMNAR STATS STORE              #
+##################################################
+
+# Directory with the columns of a stat file, next to it
+COLUMNS_EXT = '.columns'
+# Directory with the cached derived metrics of a stat file (see common_graph), next to it
+METRICS_EXT = '.metrics'
+# File describing the columns of the tables
+COLUMNS_SCHEMA = 'schema'
+# One row per connection
+CONN_TABLE = 'conn'
+# One row per (sub)flow of a connection
+FLOW_TABLE = 'flow'
+# Column of the conn table, True for the MPTCP connections
+IS_MPTCP = 'is_mptcp'
+# Version of the layout of the stores, increase it when write_columns changes to rebuild the stores already written
+COLUMNS_VERSION = 1
+# Kinds of values that can be stored in columns, with their dtype and the value used when missing
+# Timedeltas are stored in seconds
+COLUMN_KINDS = {
+    'bool': (np.bool_, False),
+    'int': (np.int64, 0),
+    'float': (np.float64, float('nan')),
+    'timedelta': (np.float64, float('nan')),
+    'str': (None, ''),
+}
+
+
+def get_column_name(attr, direction=None):
+    """ Return the name of the column of attr (in direction, if given) """
+    if direction:
+        return direction + '.' + attr
+    return attr
+
+
+def get_column_kind(value):
+    """ Return the kind of column that can store value, None if it cannot be stored in a column """
+    if isinstance(value, bool):
+        return 'bool'
+    elif isinstance(value, (int, long)):
+        return 'int'
+    elif isinstance(value, float):
+        return 'float'
+    elif isinstance(value, timedelta):
+        return 'timedelta'
+    elif isinstance(value, basestring):
+        return 'str'
+    return None
+
+
+def get_attr_names():
+    """ Return the set of attributes that can be stored in columns, the ones defined as constants here """
+    return set([value for name, value in globals().iteritems() if name.isupper() and isinstance(value, str)])
+
+
+def add_row_values(row, attr, attr_names):
+    """ Add to row (dictionary column name -> value) the scalar values of attr and of its directions """
+    for key, value in attr.iteritems():
+        if key in DIRECTIONS:
+            for dir_key, dir_value in value.iteritems():
+                if dir_key in attr_names and get_column_kind(dir_value):
+                    row[get_column_name(dir_key, key)] = dir_value
+        elif key in attr_names and get_column_kind(value):
+            row[key] = value
+
+
+def get_table_rows(connections):
+    """ Return a dictionary with the rows (list of dictionaries column name -> value) of each table for connections """
+    attr_names = get_attr_names()
+    conn_rows = []
+    flow_rows = []
+    for conn_id in sorted(connections.keys()):
+        conn = connections[conn_id]
+        conn_row = {CONN_ID: conn_id, IS_MPTCP: hasattr(conn, 'flows')}
+        add_row_values(conn_row, conn.attr, attr_names)
+        conn_rows.append(conn_row)
+        flows = sorted(conn.flows.items()) if hasattr(conn, 'flows') else [(0, conn.flow)]
+        for flow_id, flow in flows:
+            flow_row = {CONN_ID: conn_id, FLOW_ID: flow_id}
+            add_row_values(flow_row, flow.attr, attr_names)
+            flow_rows.append(flow_row)
+
+    return {CONN_TABLE: conn_rows, FLOW_TABLE: flow_rows}
+
+
+def get_table_columns(rows, columns=None):
+    """ Return a dictionary with, for each attribute (in columns, if given) found in rows that can be stored in a column,
+        a tuple with its kind, the array of its values and the array telling which rows miss it
+    """
+    kinds = {}
+    for row in rows:
+        for column, value in row.iteritems():
+            if columns is not None and column not in columns:
+                continue
+            kind = get_column_kind(value)
+            if column not in kinds:
+                kinds[column] = kind
+            elif kinds[column] != kind:
+                # Integers and floats can share a column, other kinds cannot
+                kinds[column] = 'float' if set([kinds[column], kind]) == set(['int', 'float']) else None
+
+    table_columns = {}
+    for column, kind in kinds.iteritems():
+        if not kind:
+            continue
+        dtype, missing = COLUMN_KINDS[kind]
+        values = [row.get(column, missing) for row in rows]
+        if kind == 'timedelta':
+            values = [value.total_seconds() if isinstance(value, timedelta) else value for value in values]
+        try:
+            array = np.array(values, dtype=dtype)
+        except OverflowError:
+            continue
+        mask = np.array([column not in row for row in rows], dtype=np.bool_)
+        table_columns[column] = (kind, array, mask)
+
+    return table_columns
+
+
+def save_table_columns(columns_dir, table, rows):
+    """ Save one column per attribute found in rows (list of dictionaries) in columns_dir
+        Return the schema of the table
+    """
+    schema = {'rows': len(rows), 'columns': {}}
+    for column, (kind, array, mask) in get_table_columns(rows).iteritems():
+        np.save(os.path.join(columns_dir, table + '.' + column + '.npy'), array)
+        if mask.any():
+            np.save(os.path.join(columns_dir, table + '.' + column + '.mask.npy'), mask)
+        schema['columns'][column] = (kind, mask.any())
+
+    return schema
+
+
+def write_columns(stat_filepath, connections):
+    """ Save the scalar attributes of connections (as saved in stat_filepath) in a columnar store next to it
+        Graph scripts can then load (and memory-map) only the columns they use with load_columns
+    """
+    columns_dir = stat_filepath + COLUMNS_EXT
+    if os.path.isdir(columns_dir):
+        shutil.rmtree(columns_dir)
+    os.makedirs(columns_dir)
+
+    rows = get_table_rows(connections)
+    schema = {CONN_TABLE: save_table_columns(columns_dir, CONN_TABLE, rows[CONN_TABLE]),
+              FLOW_TABLE: save_table_columns(columns_dir, FLOW_TABLE, rows[FLOW_TABLE]),
+              'version': COLUMNS_VERSION}
+    # Saved last, the store is not valid without it
+    save_object(schema, os.path.join(columns_dir, COLUMNS_SCHEMA))
+
+
+def is_columns_up_to_date(stat_filepath):
+    """ Return True if the columnar store of stat_filepath exists, is not older than it and has the current layout """
+    schema_filepath = os.path.join(stat_filepath + COLUMNS_EXT, COLUMNS_SCHEMA)
+    if not os.path.isfile(schema_filepath) or os.path.getmtime(schema_filepath) < os.path.getmtime(stat_filepath):
+        return False
+    return load_object(schema_filepath).get('version', None) == COLUMNS_VERSION
+
+
+def load_columns(stat_filepath, columns=None, table=CONN_TABLE):
+    """ Return a dictionary with the columns (all if None) of table in the columnar store of stat_filepath
+        Arrays are memory-mapped; columns with missing values are masked arrays (fully masked if not in the store)
+        Raise IOError if there is no store
+    """
+    columns_dir = stat_filepath + COLUMNS_EXT
+    schema = load_object(os.path.join(columns_dir, COLUMNS_SCHEMA))[table]
+    result = {}
+    for column in (schema['columns'].keys() if columns is None else columns):
+        if column not in schema['columns']:
+            result[column] = np.ma.masked_all((schema['rows'],))
+            continue
+        kind, masked = schema['columns'][column]
+        result[column] = np.load(os.path.join(columns_dir, table + '.' + column + '.npy'), mmap_mode='r')
+        if masked:
+            mask = np.load(os.path.join(columns_dir, table + '.' + column + '.mask.npy'), mmap_mode='r')
+            result[column] = np.ma.array(result[column], mask=mask)
+
+    return result
+
+
+def get_columns(connections, columns=None, table=CONN_TABLE):
+    """ Return a dictionary with the columns (all if None) of table for connections, as load_columns returns them from
+        their columnar store
+        Useful to share code between graphs using loaded connections and graphs using columnar stores
+    """
+    rows = get_table_rows(connections)[table]
+    table_columns = get_table_columns(rows, columns=columns)
+    result = {}
+    for column in (table_columns.keys() if columns is None else columns):
+        if column not in table_columns:
+            result[column] = np.ma.masked_all((len(rows),))
+            continue
+        kind, array, mask = table_columns[column]
+        result[column] = np.ma.array(array, mask=mask) if mask.any() else array
+
+    return result
+
+
+def skip_columns_dirs(dirnames):
+    """ Remove the columnar stores and the caches of derived metrics from dirnames (given by os.walk), to only walk
+        stat files
+    """
+    dirnames[:] = [dirname for dirname in dirnames if not dirname.endswith(COLUMNS_EXT) and not dirname.endswith(METRICS_EXT)]
+
+##################################################
+#          PARALLEL LOADING OF STAT FILES        #
+##################################################
+
+# Number of stat files that each loading process can have loaded and not consumed yet
+STATS_WINDOW_PER_PROCESS = 2
+# Time (in seconds) between two checks of the loading processes
+STATS_POLL_DELAY = 1.0
+
+
+def list_stat_files(dir_exp, dirs=None):
+    """ Return the list of (fname, stat_filepath) of the stat files in dir_exp
+        If dirs is given, only the stat files in directories with a name in dirs are kept
+    """
+    stat_files = []
+    for dirpath, dirnames, filenames in os.walk(dir_exp):
+        skip_columns_dirs(dirnames)
+        if not dirs or os.path.basename(dirpath) in dirs:
+            for fname in sorted(filenames):
+                stat_files.append((fname, os.path.join(dirpath, fname)))
+    return stat_files
+
+
+def load_stat_files_worker(task_queue, result_queue, process_data):
+    """ Body of a process loading stat files
+        Load the stat files received on task_queue until None is received and put (fname, data) on result_queue,
+        data being None if the stat file cannot be loaded
+    """
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        fname, stat_filepath = task
+        try:
+            stat_file = open(stat_filepath, 'rb')
+            data = cPickle.load(stat_file)
+            stat_file.close()
+            if process_data:
+                data = process_data(fname, data)
+        except IOError as e:
+            print(str(e) + ': skip stat file ' + fname, file=sys.stderr)
+            data = None
+        except:
+            print(traceback.format_exc(), file=sys.stderr)
+            print('Error when loading ' + stat_filepath + ': skip', file=sys.stderr)
+            data = None
+        result_queue.put((fname, data))
+
+
+def iter_stat_files(stat_files, process_data=None, nb_processes=None):
+    """ Yield (fname, data) for each (fname, stat_filepath) of stat_files, as soon as it is loaded by one of the
+        nb_processes processes (one per CPU by default)
+        If given, process_data(fname, data) is called in the loading process and its return value is yielded instead of
+        data (e.g. to filter connections before sending them)
+        Only a few stat files per process are loaded in advance, the memory used is bounded by what the caller keeps
+    """
+    if not stat_files:
+        return
+    nb_processes = min(nb_processes or cpu_count(), len(stat_files))
+    task_queue = Queue()
+    for task in stat_files:
+        task_queue.put(task)
+    for i in range(nb_processes):
+        task_queue.put(None)
+    result_queue = Queue(maxsize=STATS_WINDOW_PER_PROCESS * nb_processes)
+    processes = [Process(target=load_stat_files_worker, args=(task_queue, result_queue, process_data))
+                 for i in range(nb_processes)]
+    for process in processes:
+        process.start()
+
+    try:
+        nb_loaded = 0
+        while nb_loaded < len(stat_files):
+            try:
+                fname, data = result_queue.get(timeout=STATS_POLL_DELAY)
+            except Empty:
+                if not any([process.is_alive() for process in processes]):
+                    print("Loading processes died, " + str(len(stat_files) - nb_loaded) + " stat files not loaded",
+                          file=sys.stderr)
+                    break
+                continue
+            nb_loaded += 1
+            if data is not None:
+                yield fname, data
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
 ##################################################
 #                COMMON FUNCTIONS                #
 ##################################################
@@ -401,6 +971,24 @@ def get_dir_from_arg(directory, end=''):
     return os.path.abspath(os.path.expanduser(directory)) + end
 
 
+def get_scratch_dir(pcap_filepath, scratch_dir=None):
+    """ Return the directory where the temporary files of the analysis of pcap_filepath can be written
+        This is scratch_dir if given, DEF_SCRATCH_DIR if it has SCRATCH_SIZE_FACTOR times the size of the trace of free
+        space, or the current directory
+    """
+    if scratch_dir:
+        return os.path.abspath(os.path.expanduser(scratch_dir))
+
+    try:
+        stats = os.statvfs(DEF_SCRATCH_DIR)
+        if os.access(DEF_SCRATCH_DIR, os.W_OK) and stats.f_bavail * stats.f_frsize >= SCRATCH_SIZE_FACTOR * os.path.getsize(pcap_filepath):
+            return DEF_SCRATCH_DIR
+    except OSError:
+        pass
+
+    return os.getcwd()
+
+
 def is_number(s):
     """ Check if the str s is a number """
     try:
@@ -469,6 +1057,139 @@ def long_ipv6_address(ip):
 #                    PCAP                        #
 ##################################################
 
+NS_PER_SEC = 1000000000
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+PCAP_HDR_LEN = 24
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_IDB = 1
+PCAPNG_EPB = 6
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+PCAPNG_OPT_END = 0
+PCAPNG_OPT_TSRESOL = 9
+
+
+class PcapReader(object):
+
+    """ Read the packets of a pcap (with micro or nanosecond timestamps) or pcapng file mapped in memory
+        Iterating over it gives (ts, buf) as dpkt.pcap.Reader, where buf is a buffer on the mapped file (no copy)
+        records gives timestamps as integer numbers of nanoseconds
+        Buffers are only valid until close is called
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.file = open(filepath, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error) as e:
+            self.file.close()
+            raise PcapError(str(e) + ": cannot map " + filepath)
+
+        self.is_pcapng = len(self.map) >= 4 and struct.unpack_from('<I', self.map, 0)[0] == PCAPNG_SHB
+        if self.is_pcapng:
+            self.linktype = None
+            for block_type, body, body_len, endian in self._pcapng_blocks():
+                if block_type == PCAPNG_IDB:
+                    self.linktype = self._pcapng_interface(body, body_len, endian)[0]
+                    break
+        else:
+            self.endian = None
+            for endian in ('<', '>'):
+                if len(self.map) >= PCAP_HDR_LEN and struct.unpack_from(endian + 'I', self.map, 0)[0] in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+                    self.endian = endian
+            if self.endian is None:
+                self.close()
+                raise PcapError("Invalid pcap header for " + filepath)
+
+            magic, self.linktype = struct.unpack_from(self.endian + 'I16xI', self.map, 0)
+            self.frac_ns = 1000 if magic == PCAP_MAGIC_USEC else 1
+
+    def datalink(self):
+        """ Return the link type of the packets (of the first interface for pcapng) """
+        return self.linktype
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __iter__(self):
+        for ts, buf, wire_len in self.records():
+            yield ts // NS_PER_SEC + (ts % NS_PER_SEC) / 1E9, buf
+
+    def records(self):
+        """ Generate (ts, buf, wire_len) for each packet, where ts is in nanoseconds and wire_len is the length of the
+            packet on the wire
+        """
+        if self.is_pcapng:
+            return self._pcapng_records()
+        return self._pcap_records()
+
+    def _pcap_records(self):
+        record_hdr = struct.Struct(self.endian + 'IIII')
+        size = len(self.map)
+        offset = PCAP_HDR_LEN
+        while offset < size:
+            if offset + record_hdr.size > size:
+                print("Truncated packet header in " + self.filepath, file=sys.stderr)
+                return
+            sec, frac, cap_len, wire_len = record_hdr.unpack_from(self.map, offset)
+            offset += record_hdr.size
+            if offset + cap_len > size:
+                print("Truncated packet in " + self.filepath, file=sys.stderr)
+                return
+            yield sec * NS_PER_SEC + frac * self.frac_ns, buffer(self.map, offset, cap_len), wire_len
+            offset += cap_len
+
+    def _pcapng_blocks(self):
+        """ Generate (block_type, body_offset, body_len, endian) for each block """
+        size = len(self.map)
+        offset = 0
+        endian = '<'
+        while offset + 12 <= size:
+            block_type = struct.unpack_from(endian + 'I', self.map, offset)[0]
+            if block_type == PCAPNG_SHB:
+                # Each section can have its own byte order
+                endian = '<' if struct.unpack_from('<I', self.map, offset + 8)[0] == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            block_len = struct.unpack_from(endian + 'I', self.map, offset + 4)[0]
+            if block_len < 12 or offset + block_len > size:
+                print("Truncated block in " + self.filepath, file=sys.stderr)
+                return
+            yield block_type, offset + 8, block_len - 12, endian
+            offset += block_len
+
+    def _pcapng_interface(self, body, body_len, endian):
+        """ Return (linktype, units), where units is the number of timestamp units per second of the interface """
+        linktype = struct.unpack_from(endian + 'H', self.map, body)[0]
+        units = 10 ** 6
+        offset = body + 8
+        while offset + 4 <= body + body_len:
+            code, length = struct.unpack_from(endian + 'HH', self.map, offset)
+            if code == PCAPNG_OPT_END:
+                break
+            if code == PCAPNG_OPT_TSRESOL and length >= 1:
+                tsresol = ord(self.map[offset + 4])
+                units = 2 ** (tsresol & 0x7f) if tsresol & 0x80 else 10 ** tsresol
+            offset += 4 + (length + 3) // 4 * 4
+        return linktype, units
+
+    def _pcapng_records(self):
+        # Only Enhanced Packet Blocks are considered, other packet blocks have no reliable timestamp
+        interfaces = []
+        for block_type, body, body_len, endian in self._pcapng_blocks():
+            if block_type == PCAPNG_SHB:
+                interfaces = []
+            elif block_type == PCAPNG_IDB:
+                interfaces.append(self._pcapng_interface(body, body_len, endian))
+            elif block_type == PCAPNG_EPB:
+                if_id, ts_high, ts_low, cap_len, wire_len = struct.unpack_from(endian + 'IIIII', self.map, body)
+                if if_id >= len(interfaces):
+                    print("Packet of unknown interface in " + self.filepath, file=sys.stderr)
+                    continue
+                units = interfaces[if_id][1]
+                ticks = (ts_high << 32) | ts_low
+                yield ticks * NS_PER_SEC // units, buffer(self.map, body + 20, min(cap_len, body_len - 20)), wire_len
+
 
 def save_data(filepath, dir_exp, data):
     """ Using the name pcap_fname, save data in a file with filename fname in dir dir_exp """
@@ -482,6 +1203,16 @@ def save_data(filepath, dir_exp, data):
         print(str(e) + ': no data file for ' + filepath, file=sys.stderr)
 
 
+def save_columns(filepath, dir_exp, connections):
+    """ Using the name pcap_fname, save the columns of connections next to their stat file in dir dir_exp """
+    path_name = os.path.join(
+        dir_exp, os.path.splitext(os.path.basename(filepath))[0])
+    try:
+        write_columns(path_name, connections)
+    except (IOError, OSError) as e:
+        print(str(e) + ': no columns for ' + filepath, file=sys.stderr)
+
+
 def clean_loopback_pcap(pcap_filepath, print_out=sys.stdout):
     """ Remove noisy traffic (port 1984), see netstat """
     tmp_pcap = tempfile.mkstemp(suffix='.pcap')[1]
@@ -560,6 +1291,55 @@ def sort_and_aggregate(aggr_list):
     return return_list
 
 
+# Maximal number of points of a plotted CDF (None to plot all of them)
+CDF_MAX_POINTS = 1000
+
+
+def downsample_cdf(xvals, yvals, max_points=CDF_MAX_POINTS):
+    """ Return xvals and yvals (as returned by get_cdf, without ccdf) reduced to at most max_points points, taken on
+        evenly spaced quantiles (the first and last points are always kept)
+    """
+    if max_points is None or len(xvals) <= max_points:
+        return xvals, yvals
+
+    indexes = np.searchsorted(yvals, np.linspace(yvals[0], yvals[-1], max_points - 1))
+    indexes = np.unique(np.append(indexes, len(yvals) - 1))
+    return xvals[indexes], yvals[indexes]
+
+
+def get_cdf(sample, weights=None, ccdf=False, max_points=CDF_MAX_POINTS):
+    """ Return the points (xvals, yvals) to plot the CDF of sample, with a last point (max of sample, 1.0)
+        If weights (list of same length as sample) is given, compute the weighted CDF, where the value of a point is
+        the fraction of the total weight of elements lower or equal to it (e.g. weights=sample)
+        If ccdf is True, yvals are those of the complementary CDF (1 - CDF)
+        If there are more than max_points points (if not None), the CDF is downsampled with downsample_cdf
+        Empty arrays are returned if sample is empty or if the total weight is null
+    """
+    sample = np.asarray(sample)
+    if weights is None:
+        xvals = np.sort(sample)
+        yvals = np.arange(len(xvals)) / float(max(len(xvals), 1))
+    else:
+        order = np.argsort(sample, kind='mergesort')
+        xvals = sample[order]
+        yvals = np.cumsum(np.asarray(weights, dtype=float)[order])
+        if len(yvals) == 0 or yvals[-1] == 0.0:
+            return np.array([]), np.array([])
+        yvals /= yvals[-1]
+
+    if len(xvals) == 0:
+        return xvals, yvals
+
+    # Add a last point
+    xvals = np.append(xvals, xvals[-1])
+    yvals = np.append(yvals, 1.0)
+    xvals, yvals = downsample_cdf(xvals, yvals, max_points=max_points)
+
+    if ccdf:
+        yvals = 1.0 - yvals
+    return xvals, yvals
+
+
 # Initialize lock semaphore for matplotlib
 # This is needed to avoid race conditions inside matplotlib
 plt_lock = threading.Lock()
@@ -754,15 +1534,9 @@ def plot_cdfs(aggl_res, color, xlabel, base_graph_fname, ylim=None, xlim=None):
 
         for cond in aggl_res.keys():
             try:
-                sample = np.array(sorted(aggl_res[cond][element]))
-
-                sorted_array = np.sort(sample)
-                yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
+                sorted_array, yvals = get_cdf(aggl_res[cond][element])
 
                 if len(sorted_array) > 0:
-                    # Add a last point
-                    sorted_array = np.append(sorted_array, sorted_array[-1])
-                    yvals = np.append(yvals, 1.0)
                     plt.plot(sorted_array, yvals, linewidth=2, color=color[aggl_res[cond].keys().index(element)], label=element)
             except ZeroDivisionError as e:
                 print(str(e))
@@ -808,21 +1582,14 @@ def plot_cdfs_natural(aggl_res, color, xlabel, base_graph_fname, xlim=None, ylim
             cond_list = label_order
         for element in cond_list:
             try:
-                sample = np.array(sorted(aggl_res[cond][element]))
                 # f = open(os.path.splitext(base_graph_fname)[0] + '_' + cond + '_' + element, 'w')
-                # for i in range(len(sample)):
-                #     f.write(str(sample[i]) + "\n")
+                # for i in range(len(aggl_res[cond][element])):
+                #     f.write(str(aggl_res[cond][element][i]) + "\n")
                 # f.close()
 
-                sorted_array = np.sort(sample)
-                yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
+                sorted_array, yvals = get_cdf(aggl_res[cond][element], ccdf=ccdf)
 
                 if len(sorted_array) > 0:
-                    # Add a last point
-                    sorted_array = np.append(sorted_array, sorted_array[-1])
-                    yvals = np.append(yvals, 1.0)
-                    if ccdf:
-                        yvals = 1.0 - yvals
                     ax.plot(sorted_array, yvals, color=color[aggl_res[cond].keys().index(element)], label=element)
             except ZeroDivisionError as e:
                 print(str(e))
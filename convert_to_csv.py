@@ -289,6 +289,7 @@ def convert_to_csv(fname, connections):
 
 
 for dirpath, dirnames, filenames in os.walk(stat_dir_exp):
+    co.skip_columns_dirs(dirnames)
     for fname in filenames:
         try:
             stat_file = open(os.path.join(dirpath, fname), 'r')
@@ -38,6 +38,8 @@ import sys
 import tcp
 import tempfile
 
+from itertools import izip
+
 ##################################################
 #                   CONSTANTS                    #
 ##################################################
@@ -58,6 +60,18 @@ MPTCP_ACKSIZE_FNAME = '_acksize_'
 MPTCP_ADDADDR_FNAME = 'add_addr_'
 # mptcptrace file identifier in csv filename for rmaddr information
 MPTCP_RMADDR_FNAME = 'rm_addr_'
+# Columns of the seq csv files used by process_csv (lines with less fields are ignored)
+SEQ_TS = 0
+SEQ_START = 1
+SEQ_FLOW = 2
+SEQ_TYPE = 3
+SEQ_END = 4
+SEQ_REINJ_FLOW = 5
+SEQ_NB_FIELDS = 6
+# Type of the lines of seq csv files for mappings
+SEQ_TYPE_MAP = 1
+# Integers in seq csv files are parsed as floats by parse_seq_csv, exact below this value
+SEQ_MAX_EXACT_INT = 2**53
 
 
 ##################################################
@@ -76,7 +90,7 @@ class MPTCPTraceError(Exception):
 class MPTCPSubFlow(co.BasicFlow):
 
     """ Represent a MPTCP subflow """
-    subflow_id = ""
+    __slots__ = ('subflow_id',)
 
     def __init__(self, sid):
         super(MPTCPSubFlow, self).__init__()
@@ -86,7 +100,7 @@ class MPTCPSubFlow(co.BasicFlow):
 class MPTCPConnection(co.BasicConnection):
 
     """ Represent a MPTCP connection """
-    flows = {}
+    __slots__ = ('flows',)
 
     def __init__(self, cid):
         super(MPTCPConnection, self).__init__(cid)
@@ -96,22 +110,20 @@ class MPTCPConnection(co.BasicConnection):
 def convert_MPTCPConnections_to_dict(mptcp_connections):
     mptcp_dict = {}
     for key in mptcp_connections:
-        mptcp_dict[key] = vars(mptcp_connections[key])
+        mptcp_dict[key] = mptcp_connections[key].__getstate__()
         # If we want a full dict, we need to convert the MPTCPSubFlows to dict total_seconds
-        for mptcp_subflow_key in mptcp_connections[key]["flows"]:
-            mptcp_dict[key]["flows"][mptcp_subflow_key] = vars(mptcp_connections[key]["flows"][mptcp_subflow_key])
+        mptcp_dict[key]["flows"] = {}
+        for mptcp_subflow_key in mptcp_connections[key].flows:
+            mptcp_dict[key]["flows"][mptcp_subflow_key] = mptcp_connections[key].flows[mptcp_subflow_key].__getstate__()
 
     return mptcp_dict
 
 
 def extract_flow_data(out_file):
-    """ Given an (open) file, return a dictionary of as many elements as there are mptcp flows """
-    # Return at the beginning of the file
-    out_file.seek(0)
-    data = out_file.readlines()
+    """ Given an (open) file or pipe, return a dictionary of as many elements as there are mptcp flows """
     connections = {}
     current_connection = False
-    for line in data:
+    for line in out_file:
         # Case 1: line start with MPTCP connection
         if line.startswith("MPTCP connection"):
             # A typical line: MPTCP connection 0 with id 2
@@ -191,38 +203,140 @@ def process_mptcptrace_cmd(cmd, pcap_filepath):
         about connections of the pcap file analyzed
         Raise a MPTCPTraceError if mptcptrace encounters problems
     """
-    pcap_flow_data_path = pcap_filepath[:-5] + '.out'
-    flow_data_file = open(pcap_flow_data_path, 'w+')
-    if subprocess.call(cmd, stdout=flow_data_file) != 0:
+    mptcptrace = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    connections = extract_flow_data(mptcptrace.stdout)
+    mptcptrace.stdout.close()
+    if mptcptrace.wait() != 0:
         raise MPTCPTraceError("Error of mptcptrace with " + pcap_filepath)
 
-    connections = extract_flow_data(flow_data_file)
-    # Don't forget to close and remove pcap_flow_data
-    flow_data_file.close()
-    os.remove(pcap_flow_data_path)
     return connections
 
 
+def merge_mptcptrace_outputs(src_dir, dst_dir):
+    """ Move the files generated by mptcptrace in src_dir to dst_dir and remove src_dir
+        Files with the same name in dst_dir are kept, as if both runs of mptcptrace were done in dst_dir, the one
+        of src_dir first
+    """
+    for fname in os.listdir(src_dir):
+        if not os.path.exists(os.path.join(dst_dir, fname)):
+            shutil.move(os.path.join(src_dir, fname), os.path.join(dst_dir, fname))
+    shutil.rmtree(src_dir)
+
+
 ##################################################
 #                 GRAPH RELATED                  #
 ##################################################
 
 
-def process_csv(csv_fname, connections, conn_id, is_reversed):
-    """ Process the csv given in argument """
-    if conn_id not in connections:
-        # Not a real connection; skip it
-        return
+def parse_csv(data, nb_fields):
+    """ Parse data (content of a csv file with numbers) in one call
+        Return an array with the first nb_fields fields of each line having at least nb_fields fields, and the offsets of
+        the beginning and the end of those lines in data
+        Return None if data cannot be parsed this way (lines with different numbers of fields or not numbers); it has
+        then to be parsed line by line
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(buf == ord('\n'))
+    if not data.endswith('\n'):
+        ends = np.append(ends, len(data))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    commas = np.flatnonzero(buf == ord(','))
+    lines_nb_fields = np.searchsorted(commas, ends) - np.searchsorted(commas, starts) + 1
+
+    valid = lines_nb_fields >= nb_fields
+    starts, ends, lines_nb_fields = starts[valid], ends[valid], lines_nb_fields[valid]
+    if len(lines_nb_fields) == 0:
+        return np.zeros((0, nb_fields)), starts, ends
+    if not np.all(lines_nb_fields == lines_nb_fields[0]):
+        return None
+
+    if valid.all():
+        lines = data[:ends[-1]]
+    else:
+        lines = '\n'.join([data[start:end] for start, end in izip(starts, ends)])
+    values = np.fromstring(lines.replace('\n', ','), dtype=np.float64, sep=',')
+    if len(values) != len(lines_nb_fields) * lines_nb_fields[0]:
+        return None
+
+    return values.reshape(len(lines_nb_fields), lines_nb_fields[0])[:, :nb_fields], starts, ends
+
+
+def parse_seq_csv(data):
+    """ Parse data (content of a seq csv file) with parse_csv, with SEQ_NB_FIELDS fields
+        Return None if data cannot be parsed exactly this way (see parse_csv, or too large integers)
+    """
+    parsed = parse_csv(data, SEQ_NB_FIELDS)
+    if parsed is None:
+        return None
 
-    try:
-        csv_file = open(csv_fname)
-        data = csv_file.readlines()
-        csv_file.close()
-    except IOError as e:
-        print(str(e), file=sys.stderr)
-        print('IOError for ' + csv_fname + ': no data extracted from csv', file=sys.stderr)
-        return
+    ints = parsed[0][:, SEQ_START:]
+    with np.errstate(invalid='ignore'):
+        if not np.all(np.abs(ints) < SEQ_MAX_EXACT_INT) or not np.all(ints == np.floor(ints)):
+            return None
+
+    return parsed
+
+
+def get_seq_info(data, nb_flows):
+    """ Return the bursts and reinjection information of the seq csv with content data, whose connection has nb_flows
+        subflows, computed on arrays (see get_seq_info_from_lines for the returned values)
+        Return None if data cannot be parsed by parse_seq_csv
+    """
+    parsed = parse_seq_csv(data)
+    if parsed is None:
+        return None
+
+    values, starts, ends = parsed
+    maps = values[:, SEQ_TYPE] == SEQ_TYPE_MAP
+    values, starts = values[maps], starts[maps]
+    timestamps = values[:, SEQ_TS]
+    flows = values[:, SEQ_FLOW].astype(np.int64) - 1
+    seq_starts = values[:, SEQ_START].astype(np.int64)
+    seq_ends = values[:, SEQ_END].astype(np.int64)
+    reinj_flows = values[:, SEQ_REINJ_FLOW].astype(np.int64) - 1
+    sizes = (seq_ends - seq_starts) % 2**32
+
+    # A burst is a run of mappings on the same subflow (runs without a valid subflow are not kept)
+    bursts = []
+    if len(flows) > 0:
+        firsts = np.flatnonzero(np.concatenate(([True], flows[1:] != flows[:-1])))
+        lasts = np.append(firsts[1:], len(flows)) - 1
+        keep = flows[firsts] >= 0
+        bursts = zip(flows[firsts][keep].tolist(), np.add.reduceat(sizes, firsts)[keep].tolist(),
+                     (lasts - firsts + 1)[keep].tolist(), (timestamps[lasts] - timestamps[firsts])[keep].tolist(),
+                     timestamps[firsts][keep].tolist())
 
+    reinject_offsets = {}
+    reinject_nb = {}
+    reinject_ts = {}
+    reinject = {}
+    is_reinjection = {}
+    # Mappings reinjected from one of the subflows
+    reinjected = (reinj_flows >= 0) & (reinj_flows < nb_flows)
+    for i in range(0, nb_flows):
+        from_flow = reinjected & (reinj_flows == i)
+        reinject_offsets[i] = int(sizes[from_flow].sum())
+        reinject_nb[i] = int(from_flow.sum())
+        reinject_ts[i] = timestamps[from_flow].tolist()
+        reinject[i] = {}
+        is_reinjection[i] = {}
+
+    # Reinjections are usually few, dictionaries indexed by their values are filled line by line
+    for index in np.flatnonzero(reinjected):
+        timestamp = data[starts[index]:data.index(',', starts[index])]
+        is_reinjection[int(flows[index])][timestamp] = int(sizes[index])
+        packet_seqs = (int(seq_ends[index]), int(seq_starts[index]))
+        reinj_flow = int(reinj_flows[index])
+        reinject[reinj_flow][packet_seqs] = reinject[reinj_flow].get(packet_seqs, 0) + 1
+
+    return bursts, reinject_nb, reinject_offsets, reinject_ts, reinject, is_reinjection
+
+
+def get_seq_info_from_lines(lines, nb_flows):
+    """ Return the bursts and reinjection information of the seq csv with lines, whose connection has nb_flows subflows
+        This is a tuple (bursts, reinject_nb, reinject_offsets, reinject_ts, reinject, is_reinjection), where all
+        elements except bursts are dictionaries with subflow ids as keys
+    """
     reinject_offsets = {}
     reinject_nb = {}
     reinject_ts = {}
@@ -234,14 +348,14 @@ def process_csv(csv_fname, connections, conn_id, is_reversed):
     count_pkt_burst = 0
     begin_time_burst_on_flow = 0.0
     last_time_burst_on_flow = 0.0
-    for i in range(0, len(connections[conn_id].flows)):
+    for i in range(0, nb_flows):
         reinject[i] = {}
         is_reinjection[i] = {}
         reinject_offsets[i] = 0
         reinject_nb[i] = 0
         reinject_ts[i] = []
 
-    for line in data:
+    for line in lines:
         split_line = line.split(',')
         if len(split_line) < 6:
             continue
@@ -285,6 +399,30 @@ def process_csv(csv_fname, connections, conn_id, is_reversed):
         duration = last_time_burst_on_flow - begin_time_burst_on_flow
         bursts.append((current_flow, count_seq_burst, count_pkt_burst, duration, begin_time_burst_on_flow))
 
+    return bursts, reinject_nb, reinject_offsets, reinject_ts, reinject, is_reinjection
+
+
+def process_csv(csv_fname, connections, conn_id, is_reversed):
+    """ Process the csv given in argument """
+    if conn_id not in connections:
+        # Not a real connection; skip it
+        return
+
+    try:
+        csv_file = open(csv_fname)
+        data = csv_file.read()
+        csv_file.close()
+    except IOError as e:
+        print(str(e), file=sys.stderr)
+        print('IOError for ' + csv_fname + ': no data extracted from csv', file=sys.stderr)
+        return
+
+    nb_flows = len(connections[conn_id].flows)
+    seq_info = get_seq_info(data, nb_flows)
+    if seq_info is None:
+        seq_info = get_seq_info_from_lines(data.split('\n'), nb_flows)
+    bursts, reinject_nb, reinject_offsets, reinject_ts, reinject, is_reinjection = seq_info
+
     direction = co.S2C if is_reversed else co.C2S
     connections[conn_id].attr[direction][co.BURSTS] = bursts
     for i in range(0, len(connections[conn_id].flows)):
@@ -295,45 +433,77 @@ def process_csv(csv_fname, connections, conn_id, is_reversed):
         connections[conn_id].flows[i].attr[direction][co.IS_REINJ] = is_reinjection[i]
 
 
-def process_rtt_csv(csv_fname, rtt_all, connections, conn_id, is_reversed):
-    """ Process the csv with rtt given in argument """
+# Percentiles of the RTT stored in the attributes of connections
+RTT_PERCENTILES = [(25, co.RTT_25P), (50, co.RTT_MED), (75, co.RTT_75P), (90, co.RTT_90P), (95, co.RTT_95P),
+                   (97, co.RTT_97P), (98, co.RTT_98P), (99, co.RTT_99P)]
+# Number of bytes of the rtt csv read at once when summarizing it in a sketch
+RTT_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def get_rtts(data):
+    """ Return an array with the rtts (second field) of the lines of data (content of a rtt csv file) """
+    parsed = parse_csv(data, 2)
+    nb_lines = data.count('\n') + (1 if data and not data.endswith('\n') else 0)
+    if parsed is not None and len(parsed[0]) == nb_lines:
+        return parsed[0][:, 1]
+
+    # Fallback: parse it line by line
+    return np.array([float(line.split(',')[1]) for line in data.splitlines()])
+
+
+def get_rtts_sketch(csv_file):
+    """ Return a co.QuantileSketch summarizing the rtts of the (opened) rtt csv file csv_file, read by chunks """
+    sketch = co.QuantileSketch()
+    lines = csv_file.readlines(RTT_CHUNK_SIZE)
+    while lines:
+        sketch.add(get_rtts(''.join(lines)))
+        lines = csv_file.readlines(RTT_CHUNK_SIZE)
+
+    return sketch
+
+
+def process_rtt_csv(csv_fname, rtt_all, connections, conn_id, is_reversed, sketch=False):
+    """ Process the csv with rtt given in argument
+        If sketch is True, rtts are not kept but summarized in a co.QuantileSketch (with a bounded size), stored in
+        rtt_all instead of the rtts and used to estimate their percentiles
+    """
     if conn_id not in connections:
         print(conn_id, "not in connections", file=sys.stderr)
         return
     try:
         csv_file = open(csv_fname)
-        data = csv_file.readlines()
+        if sketch:
+            rtts = get_rtts_sketch(csv_file)
+        else:
+            rtts = get_rtts(csv_file.read())
         csv_file.close()
     except IOError:
         print('IOError for ' + csv_fname + ': no data extracted from csv', file=sys.stderr)
         return
 
-    rtt_data = []
-
-    for line in data:
-        split_line = line.split(',')
-        # All data is good
-        rtt_data.append(float(split_line[1]))
-
     direction = co.S2C if is_reversed else co.C2S
-    connections[conn_id].attr[direction][co.RTT_SAMPLES] = len(rtt_data)
-    if not rtt_data:
+    connections[conn_id].attr[direction][co.RTT_SAMPLES] = len(rtts)
+    if not len(rtts):
         return
-    connections[conn_id].attr[direction][co.RTT_MIN] = np.min(rtt_data)
-    connections[conn_id].attr[direction][co.RTT_MAX] = np.max(rtt_data)
-    connections[conn_id].attr[direction][co.RTT_AVG] = np.mean(rtt_data)
-    connections[conn_id].attr[direction][co.RTT_STDEV] = np.std(rtt_data)
-    rtt_all[direction][conn_id] = rtt_data
-    np_rtts = np.array(rtt_data)
+    if sketch:
+        connections[conn_id].attr[direction][co.RTT_MIN] = rtts.min
+        connections[conn_id].attr[direction][co.RTT_MAX] = rtts.max
+        connections[conn_id].attr[direction][co.RTT_AVG] = rtts.mean()
+        connections[conn_id].attr[direction][co.RTT_STDEV] = rtts.std()
+        rtt_all[direction][conn_id] = rtts
+        percentiles = rtts.percentiles([percent for percent, _ in RTT_PERCENTILES])
+    else:
+        connections[conn_id].attr[direction][co.RTT_MIN] = np.min(rtts)
+        connections[conn_id].attr[direction][co.RTT_MAX] = np.max(rtts)
+        connections[conn_id].attr[direction][co.RTT_AVG] = np.mean(rtts)
+        connections[conn_id].attr[direction][co.RTT_STDEV] = np.std(rtts)
+        rtt_all[direction][conn_id] = rtts.tolist()
+        # All percentiles with only one sort of the rtts
+        percentiles = np.percentile(rtts, [percent for percent, _ in RTT_PERCENTILES])
+
     # Those are stored in the MPTCP connection itself because app delay at MPTCP level (not at its flows)
-    connections[conn_id].attr[direction][co.RTT_99P] = np.percentile(np_rtts, 99)
-    connections[conn_id].attr[direction][co.RTT_98P] = np.percentile(np_rtts, 98)
-    connections[conn_id].attr[direction][co.RTT_97P] = np.percentile(np_rtts, 97)
-    connections[conn_id].attr[direction][co.RTT_95P] = np.percentile(np_rtts, 95)
-    connections[conn_id].attr[direction][co.RTT_90P] = np.percentile(np_rtts, 90)
-    connections[conn_id].attr[direction][co.RTT_75P] = np.percentile(np_rtts, 75)
-    connections[conn_id].attr[direction][co.RTT_MED] = np.percentile(np_rtts, 50)
-    connections[conn_id].attr[direction][co.RTT_25P] = np.percentile(np_rtts, 25)
+    for (_, key), value in izip(RTT_PERCENTILES, percentiles):
+        connections[conn_id].attr[direction][key] = value
 
 
 ##################################################
@@ -552,144 +722,168 @@ def process_rm_addr_csv(csv_fname, connections, conn_id):
     csv_file.close()
 
 
-def process_trace(pcap_filepath, graph_dir_exp, stat_dir_exp, aggl_dir_exp, rtt_dir_exp, rtt_subflow_dir_exp, failed_conns_dir_exp, acksize_dir_exp, acksize_tcp_dir_exp, plot_cwin, tcpcsm, min_bytes=0, light=False, return_dict=False):
+def process_trace(pcap_filepath, graph_dir_exp, stat_dir_exp, aggl_dir_exp, rtt_dir_exp, rtt_subflow_dir_exp, failed_conns_dir_exp, acksize_dir_exp, acksize_tcp_dir_exp, plot_cwin, tcpcsm, min_bytes=0, light=False, return_dict=False, nb_shards=1, overlap_tools=False, scratch_dir=None, rtt_sketch=False, streaming=False):
     """ Process a mptcp pcap file and generate graphs of its subflows
         Notice that we can't change dir per thread, we should use processes
+        If overlap_tools is True, the external tools of the TCP processing analyze the trace at the same time as mptcptrace
+        Files generated by mptcptrace are written in scratch_dir (see co.get_scratch_dir)
+        If rtt_sketch is True, percentiles of RTT are estimated with a sketch, stored instead of the RTT samples
+        streaming is given to tcp.process_trace
     """
     # if not check_mptcp_joins(pcap_filepath):
     #     print("WARNING: no mptcp joins on " + pcap_filepath, file=sys.stderr)
-    csv_tmp_dir = tempfile.mkdtemp(dir=os.getcwd())
-    connections = None
-    do_tcp_processing = False
+    # tstat and tcpcsm only need the trace, their outputs are used once the MPTCP processing is done
+    tcp_tools = tcp.launch_tools(pcap_filepath, tcpcsm) if overlap_tools else None
+    # True once tcp.process_trace returned: it waited for the tools (or stopped them) itself
+    tools_used = False
     try:
-        with co.cd(csv_tmp_dir):
-            # TODO uncomment here for xpl plots (attention, seulement MPTCP)
-            # If segmentation faults, remove the -S option
-            cmd = ['mptcptrace', '-f', pcap_filepath, '-s', '-S', '-t', '5000', '-w', '0']
-            if True:  # not light:
-                cmd += ['-G', '250', '-r', '2', '-F', '3', '-a']
-            # connections = process_mptcptrace_cmd(cmd, pcap_filepath)
-            #
-            # # Useful to count the number of reinjected bytes
-            # cmd = ['mptcptrace', '-f', pcap_filepath, '-s', '-a', '-t', '5000', '-w', '2']
-            # if not light:
-            #     cmd += ['-G', '250', '-r', '2', '-F', '3']
-            # devnull = open(os.devnull, 'w')
-            # if subprocess.call(cmd, stdout=devnull) != 0:
-            #     raise MPTCPTraceError("Error of mptcptrace with " + pcap_filepath)
-            # devnull.close()
-            #
-            # cmd = ['mptcptrace', '-f', pcap_filepath, '-r', '2', '-t', '5000', '-w', '2']
-            # if not light:
-            #     cmd += ['-G', '250', '-r', '2', '-F', '3']
-            devnull = open(os.devnull, 'w')
-            if subprocess.call(cmd, stdout=devnull) != 0:
-                raise MPTCPTraceError("Error of mptcptrace with " + pcap_filepath)
-            devnull.close()
-
-            cmd = ['mptcptrace', '-f', pcap_filepath, '-s', '-S', '-a', '-A', '-R', '-r', '2', '-t', '5000', '-w', '2']
-            connections = process_mptcptrace_cmd(cmd, pcap_filepath)
-
-            # The mptcptrace call will generate .xpl files to cope with
-            # First see all xpl files, to detect the relative 0 of all connections
-            # Also, compute the duration and number of bytes of the MPTCP connection
-            first_pass_on_files(connections)
-            rtt_all = {co.C2S: {}, co.S2C: {}}
-            acksize_all = {co.C2S: {}, co.S2C: {}}
-
-            # Then really process xpl files
-            if return_dict:
-                for xpl_fname in glob.glob(os.path.join('*.xpl')):
-                    try:
-                        os.remove(xpl_fname)
-                    except IOError as e:
-                        print(str(e), file=sys.stderr)
-            else:
-                for xpl_fname in glob.glob(os.path.join('*.xpl')):
+        csv_tmp_dir = tempfile.mkdtemp(dir=co.get_scratch_dir(pcap_filepath, scratch_dir=scratch_dir))
+        connections = None
+        do_tcp_processing = False
+        try:
+            with co.cd(csv_tmp_dir):
+                # TODO uncomment here for xpl plots (attention, seulement MPTCP)
+                # If segmentation faults, remove the -S option
+                cmd = ['mptcptrace', '-f', pcap_filepath, '-s', '-S', '-t', '5000', '-w', '0']
+                if True:  # not light:
+                    cmd += ['-G', '250', '-r', '2', '-F', '3', '-a']
+                # connections = process_mptcptrace_cmd(cmd, pcap_filepath)
+                #
+                # # Useful to count the number of reinjected bytes
+                # cmd = ['mptcptrace', '-f', pcap_filepath, '-s', '-a', '-t', '5000', '-w', '2']
+                # if not light:
+                #     cmd += ['-G', '250', '-r', '2', '-F', '3']
+                # devnull = open(os.devnull, 'w')
+                # if subprocess.call(cmd, stdout=devnull) != 0:
+                #     raise MPTCPTraceError("Error of mptcptrace with " + pcap_filepath)
+                # devnull.close()
+                #
+                # cmd = ['mptcptrace', '-f', pcap_filepath, '-r', '2', '-t', '5000', '-w', '2']
+                # if not light:
+                #     cmd += ['-G', '250', '-r', '2', '-F', '3']
+                # The xpl files (-w 0) and the csv files with the connections summary (-w 2) cannot be produced by the
+                # same run of mptcptrace, so both runs are launched at the same time, in separate directories
+                xpl_tmp_dir = tempfile.mkdtemp(dir=csv_tmp_dir)
+                devnull = open(os.devnull, 'w')
+                xpl_process = subprocess.Popen(cmd, stdout=devnull, cwd=xpl_tmp_dir)
+                try:
+                    cmd = ['mptcptrace', '-f', pcap_filepath, '-s', '-S', '-a', '-A', '-R', '-r', '2', '-t', '5000', '-w', '2']
+                    connections = process_mptcptrace_cmd(cmd, pcap_filepath)
+                finally:
+                    xpl_returncode = xpl_process.wait()
+                    devnull.close()
+
+                if xpl_returncode != 0:
+                    raise MPTCPTraceError("Error of mptcptrace with " + pcap_filepath)
+                merge_mptcptrace_outputs(xpl_tmp_dir, csv_tmp_dir)
+
+                # The mptcptrace call will generate .xpl files to cope with
+                # First see all xpl files, to detect the relative 0 of all connections
+                # Also, compute the duration and number of bytes of the MPTCP connection
+                first_pass_on_files(connections)
+                rtt_all = {co.C2S: {}, co.S2C: {}}
+                acksize_all = {co.C2S: {}, co.S2C: {}}
+
+                # Then really process xpl files
+                if return_dict:
+                    for xpl_fname in glob.glob(os.path.join('*.xpl')):
+                        try:
+                            os.remove(xpl_fname)
+                        except IOError as e:
+                            print(str(e), file=sys.stderr)
+                else:
+                    for xpl_fname in glob.glob(os.path.join('*.xpl')):
+                        try:
+                            directory = co.DEF_RTT_DIR if MPTCP_RTT_FNAME in xpl_fname else co.TSG_THGPT_DIR
+                            shutil.move(xpl_fname, os.path.join(
+                                graph_dir_exp, directory, os.path.basename(pcap_filepath[:-5]) + "_" + os.path.basename(xpl_fname)))
+                        except IOError as e:
+                            print(str(e), file=sys.stderr)
+
+                # And by default, save only seq csv files
+                for csv_fname in glob.glob(os.path.join('*.csv')):
+                    if True: # not light:
+                        if MPTCP_GPUT_FNAME in os.path.basename(csv_fname):
+                            process_gput_csv(csv_fname, connections)
                     try:
-                        directory = co.DEF_RTT_DIR if MPTCP_RTT_FNAME in xpl_fname else co.TSG_THGPT_DIR
-                        shutil.move(xpl_fname, os.path.join(
-                            graph_dir_exp, directory, os.path.basename(pcap_filepath[:-5]) + "_" + os.path.basename(xpl_fname)))
-                    except IOError as e:
-                        print(str(e), file=sys.stderr)
+                        if os.path.basename(csv_fname).startswith(MPTCP_ADDADDR_FNAME):
+                            conn_id = get_connection_id(os.path.basename(csv_fname))
+                            if conn_id not in connections:
+                                # Not a real connection; skip it
+                                continue
 
-            # And by default, save only seq csv files
-            for csv_fname in glob.glob(os.path.join('*.csv')):
-                if True: # not light:
-                    if MPTCP_GPUT_FNAME in os.path.basename(csv_fname):
-                        process_gput_csv(csv_fname, connections)
-                try:
-                    if os.path.basename(csv_fname).startswith(MPTCP_ADDADDR_FNAME):
-                        conn_id = get_connection_id(os.path.basename(csv_fname))
-                        if conn_id not in connections:
-                            # Not a real connection; skip it
-                            continue
-
-                        process_add_addr_csv(csv_fname, connections, conn_id)
-                        os.remove(csv_fname)
-
-                    elif os.path.basename(csv_fname).startswith(MPTCP_RMADDR_FNAME):
-                        conn_id = get_connection_id(os.path.basename(csv_fname))
-                        if conn_id not in connections:
-                            # Not a real connection; skip it
-                            continue
-
-                        process_rm_addr_csv(csv_fname, connections, conn_id)
-                        os.remove(csv_fname)
-
-                    elif MPTCP_RTT_FNAME in os.path.basename(csv_fname):
-                        conn_id = get_connection_id(os.path.basename(csv_fname))
-                        if conn_id not in connections:
-                            # Not a real connection; skip it
-                            continue
-
-                        is_reversed = is_reverse_connection(os.path.basename(csv_fname))
-                        process_rtt_csv(csv_fname, rtt_all, connections, conn_id, is_reversed)
-                        os.remove(csv_fname)
-                        # co.move_file(csv_fname, os.path.join(
-                        #    graph_dir_exp, co.DEF_RTT_DIR, os.path.basename(pcap_filepath[:-5]) + "_" + csv_fname))
-                    elif MPTCP_SEQ_FNAME in os.path.basename(csv_fname):
-                        conn_id = get_connection_id(os.path.basename(csv_fname))
-                        if conn_id not in connections:
-                            # Not a real connection; skip it
-                            continue
-
-                        is_reversed = is_reverse_connection(os.path.basename(csv_fname))
-                        process_csv(csv_fname, connections, conn_id, is_reversed)
-                        if return_dict:
-                            try:
-                                os.remove(csv_fname)
-                            except Exception:
-                                pass
-                        else:
-                            co.move_file(csv_fname, os.path.join(
-                                graph_dir_exp, co.TSG_THGPT_DIR, os.path.basename(pcap_filepath[:-5]) + "_" + os.path.basename(csv_fname)))
-                    elif MPTCP_ACKSIZE_FNAME in os.path.basename(csv_fname):
-                        collect_acksize_csv(csv_fname, connections, acksize_all)
-                        os.remove(csv_fname)
-                    else:
-                        if not light and not return_dict:
-                            co.move_file(csv_fname, os.path.join(
-                                graph_dir_exp, co.TSG_THGPT_DIR, os.path.basename(pcap_filepath[:-5]) + "_" + os.path.basename(csv_fname)))
-                        else:
+                            process_add_addr_csv(csv_fname, connections, conn_id)
                             os.remove(csv_fname)
-                except IOError as e:
-                    print(str(e), file=sys.stderr)
 
-            do_tcp_processing = True
+                        elif os.path.basename(csv_fname).startswith(MPTCP_RMADDR_FNAME):
+                            conn_id = get_connection_id(os.path.basename(csv_fname))
+                            if conn_id not in connections:
+                                # Not a real connection; skip it
+                                continue
 
-    except MPTCPTraceError as e:
-        print(str(e) + "; skip mptcp process", file=sys.stderr)
+                            process_rm_addr_csv(csv_fname, connections, conn_id)
+                            os.remove(csv_fname)
 
-    shutil.rmtree(csv_tmp_dir)
+                        elif MPTCP_RTT_FNAME in os.path.basename(csv_fname):
+                            conn_id = get_connection_id(os.path.basename(csv_fname))
+                            if conn_id not in connections:
+                                # Not a real connection; skip it
+                                continue
 
-    # This will save the mptcp connections
-    if connections and do_tcp_processing:
-        dicts = tcp.process_trace(pcap_filepath, graph_dir_exp, stat_dir_exp, failed_conns_dir_exp, acksize_tcp_dir_exp, tcpcsm, mptcp_connections=connections, light=light, return_dict=return_dict)
-        if return_dict:
-            tcp_connections, acksize_all_tcp = dicts
-            return connections, tcp_connections, rtt_all, acksize_all, acksize_all_tcp
-        else:
-            co.save_data(pcap_filepath, acksize_dir_exp, acksize_all)
-            co.save_data(pcap_filepath, rtt_dir_exp, rtt_all)
-            co.save_data(pcap_filepath, stat_dir_exp, connections)
+                            is_reversed = is_reverse_connection(os.path.basename(csv_fname))
+                            process_rtt_csv(csv_fname, rtt_all, connections, conn_id, is_reversed, sketch=rtt_sketch)
+                            os.remove(csv_fname)
+                            # co.move_file(csv_fname, os.path.join(
+                            #    graph_dir_exp, co.DEF_RTT_DIR, os.path.basename(pcap_filepath[:-5]) + "_" + csv_fname))
+                        elif MPTCP_SEQ_FNAME in os.path.basename(csv_fname):
+                            conn_id = get_connection_id(os.path.basename(csv_fname))
+                            if conn_id not in connections:
+                                # Not a real connection; skip it
+                                continue
+
+                            is_reversed = is_reverse_connection(os.path.basename(csv_fname))
+                            process_csv(csv_fname, connections, conn_id, is_reversed)
+                            if return_dict:
+                                try:
+                                    os.remove(csv_fname)
+                                except Exception:
+                                    pass
+                            else:
+                                co.move_file(csv_fname, os.path.join(
+                                    graph_dir_exp, co.TSG_THGPT_DIR, os.path.basename(pcap_filepath[:-5]) + "_" + os.path.basename(csv_fname)))
+                        elif MPTCP_ACKSIZE_FNAME in os.path.basename(csv_fname):
+                            collect_acksize_csv(csv_fname, connections, acksize_all)
+                            os.remove(csv_fname)
+                        else:
+                            if not light and not return_dict:
+                                co.move_file(csv_fname, os.path.join(
+                                    graph_dir_exp, co.TSG_THGPT_DIR, os.path.basename(pcap_filepath[:-5]) + "_" + os.path.basename(csv_fname)))
+                            else:
+                                os.remove(csv_fname)
+                    except IOError as e:
+                        print(str(e), file=sys.stderr)
+
+                do_tcp_processing = True
+
+        except MPTCPTraceError as e:
+            print(str(e) + "; skip mptcp process", file=sys.stderr)
+        finally:
+            shutil.rmtree(csv_tmp_dir)
+
+        # This will save the mptcp connections
+        if connections and do_tcp_processing:
+            dicts = tcp.process_trace(pcap_filepath, graph_dir_exp, stat_dir_exp, failed_conns_dir_exp, acksize_tcp_dir_exp, tcpcsm, mptcp_connections=connections, light=light, return_dict=return_dict, nb_shards=nb_shards,
+                                      overlap_tools=overlap_tools, tools=tcp_tools, streaming=streaming)
+            tools_used = True
+            if return_dict:
+                tcp_connections, acksize_all_tcp = dicts
+                return connections, tcp_connections, rtt_all, acksize_all, acksize_all_tcp
+            else:
+                co.save_data(pcap_filepath, acksize_dir_exp, acksize_all)
+                co.save_data(pcap_filepath, rtt_dir_exp, rtt_all)
+                co.save_data(pcap_filepath, stat_dir_exp, connections)
+                co.save_columns(pcap_filepath, stat_dir_exp, connections)
+    finally:
+        # Do not leave the tools running, nor their outputs, if an error occurred before they were used
+        if tcp_tools and not tools_used:
+            tcp.kill_tools(pcap_filepath, tcp_tools)
@@ -19,13 +19,13 @@
 #  MA 02110-1301, USA.
 
 import argparse
+import common as co
 import matplotlib
 # Do not use any X11 backend
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 import os
-import pcapy
 import statsmodels.api as sm
 
 parser = argparse.ArgumentParser(
@@ -34,15 +34,9 @@ parser.add_argument("pcap", help="path to the pcap to compute CDF")
 
 args = parser.parse_args()
 
-reader = pcapy.open_offline(args.pcap)
-sizes = []
-
-while True:
-    try:
-        (header, payload) = reader.next()
-        sizes.append(header.getlen())
-    except pcapy.PcapError:
-        break
+reader = co.PcapReader(args.pcap)
+sizes = [wire_len for ts, buf, wire_len in reader.records()]
+reader.close()
 
 plt.figure()
 plt.clf()
@@ -66,27 +66,43 @@ print('-s dir is', args.stat, 'and -S dir is', args.sums)
 ##                 GET THE DATA                 ##
 ##################################################
 
-connections = cog.fetch_valid_data(stat_dir_exp, args)
-# multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
+# Addresses and ports are scalar attributes, loaded from the columnar stores
+ADDR_COLUMNS = [co.CONN_ID, co.SOCKS_PORT, co.SOCKS_DADDR, co.SADDR]
+conn_columns = cog.fetch_valid_columns(stat_dir_exp, args, ADDR_COLUMNS)
+flow_columns = cog.fetch_valid_columns(stat_dir_exp, args, ADDR_COLUMNS + [co.FLOW_ID], table=co.FLOW_TABLE)
 
 ##################################################
 ##               PLOTTING RESULTS               ##
 ##################################################
 
+
+def get_value(attr, conns, conn_index, flows, flow_index):
+    """ Return the value of attr of the first subflow (at flow_index, if any) or else of the connection (at conn_index),
+        None if both miss it
+    """
+    for columns, index in ((flows, flow_index), (conns, conn_index)):
+        if index is not None and columns[attr][index] is not np.ma.masked:
+            return columns[attr][index]
+    return None
+
+
 ip_addrs = {}
 saddrs = {}
 
-for fname, conns in connections.iteritems():
-    for conn_id, conn in conns.iteritems():
-        port = conn.flows[0].attr.get(co.SOCKS_PORT, conn.attr.get(co.SOCKS_PORT, None))
+for fname, conns in conn_columns.iteritems():
+    flows = flow_columns[fname]
+    first_flows = dict([(conn_id, i) for i, conn_id in enumerate(flows[co.CONN_ID].tolist()) if flows[co.FLOW_ID][i] == 0])
+    for conn_index, conn_id in enumerate(conns[co.CONN_ID].tolist()):
+        flow_index = first_flows.get(conn_id, None)
+        port = get_value(co.SOCKS_PORT, conns, conn_index, flows, flow_index)
         # Apache JServ Port
         if port and port == 8009:
-            ip_addr = conn.flows[0].attr.get(co.SOCKS_DADDR, conn.attr.get(co.SOCKS_DADDR, None))
+            ip_addr = get_value(co.SOCKS_DADDR, conns, conn_index, flows, flow_index)
             if ip_addr not in ip_addrs:
                 ip_addrs[ip_addr] = 1
             else:
                 ip_addrs[ip_addr] += 1
-            saddr = conn.flows[0].attr.get(co.SADDR, conn.attr.get(co.SADDR, None))
+            saddr = get_value(co.SADDR, conns, conn_index, flows, flow_index)
             if saddr not in saddrs:
                 saddrs[saddr] = 1
             else:
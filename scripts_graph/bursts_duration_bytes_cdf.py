@@ -33,8 +33,8 @@ import numpy as np
 import os
 import sys
 
-# Add root directory in Python path and be at the root
-ROOT_DIR = os.path.abspath(os.path.join(".", os.pardir))
+# Add root directory in Python path and be at the root (nothing changes when imported by launch_graphs)
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 os.chdir(ROOT_DIR)
 sys.path.append(ROOT_DIR)
 
@@ -44,91 +44,42 @@ import mptcp
 import tcp
 
 ##################################################
-##                  ARGUMENTS                   ##
+##               PLOTTING RESULTS               ##
 ##################################################
 
-parser = argparse.ArgumentParser(
-    description="Summarize stat files generated by analyze")
-parser.add_argument("-s",
-                    "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
-parser.add_argument('-S',
-                    "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
-parser.add_argument("-d",
-                    "--dirs", help="list of directories to aggregate", nargs="+")
-
-args = parser.parse_args()
-stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
-sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
-co.check_directory_exists(sums_dir_exp)
-print('-s dir is', args.stat, 'and -S dir is', args.sums)
+# Derived metrics used by plot, computed (or checked in their cache) once by launch_graphs for all its graphs
+PLOT_METRICS = [cog.BURST_SPLITS]
 
-##################################################
-##                 GET THE DATA                 ##
-##################################################
 
-connections = cog.fetch_valid_data(stat_dir_exp, args)
-multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
-
-##################################################
-##               PLOTTING RESULTS               ##
-##################################################
-
-TINY = '0B-10KB'
-SMALL = '10KB-100KB'
-MEDIUM = '100KB-1MB'
-LARGE = '>=1MB'
-
-results_duration_bytes = {co.C2S: {TINY: [], SMALL: [], MEDIUM: [], LARGE: []}, co.S2C: {TINY: [], SMALL: [], MEDIUM: [], LARGE: []}}
-results_pkts = {co.C2S: {TINY: [], SMALL: [], MEDIUM: [], LARGE: []}, co.S2C: {TINY: [], SMALL: [], MEDIUM: [], LARGE: []}}
-min_duration = 0.001
-for fname, conns in multiflow_connections.iteritems():
-    for conn_id, conn in conns.iteritems():
-        # Restrict to only 2SFs, but we can also see with more than 2
-        if co.START in conn.attr and len(conn.flows) >= 2:
-            # Rely here on MPTCP duration, maybe should be duration at TCP level?
-            # Also rely on the start time of MPTCP; again, should it be the TCP one?
-            conn_start_time = conn.attr[co.START].total_seconds()
-            conn_start_time_int = long(conn_start_time)
-            conn_start_time_dec = float('0.' + str(conn_start_time - conn_start_time_int).split('.')[1])
-            conn_duration = float(conn.attr[co.DURATION])
-            if conn_duration < min_duration:
-                continue
+def plot(connections, multiflow_connections, sums_dir_exp, burst_splits=None):
+    """ Plot the graphs of the bursts of connections, or of burst_splits if it is given (see cog.BURST_SPLITS) """
+    TINY = '0B-10KB'
+    SMALL = '10KB-100KB'
+    MEDIUM = '100KB-1MB'
+    LARGE = '>=1MB'
 
+    results_duration_bytes = {co.C2S: {TINY: [], SMALL: [], MEDIUM: [], LARGE: []}, co.S2C: {TINY: [], SMALL: [], MEDIUM: [], LARGE: []}}
+    results_pkts = {co.C2S: {TINY: [], SMALL: [], MEDIUM: [], LARGE: []}, co.S2C: {TINY: [], SMALL: [], MEDIUM: [], LARGE: []}}
+    if burst_splits is None:
+        burst_splits = cog.get_metric(cog.BURST_SPLITS, connections)
+    for fname, conns in burst_splits.iteritems():
+        for conn_id, (conn_duration, directions) in conns.iteritems():
             for direction in co.DIRECTIONS:
                 tot_packs = 0
                 to_add_pkts = []
-                # First count all bytes sent (including retransmissions)
-                tcp_conn_bytes = 0
-                for flow_id, flow in conn.flows.iteritems():
-                    tcp_conn_bytes += flow.attr[direction].get(co.BYTES_DATA, 0)
-                # To cope with unseen TCP connections
-                conn_bytes = max(conn.attr[direction][co.BYTES_MPTCPTRACE], tcp_conn_bytes)
-                for flow_id, bytes, pkts, burst_duration, burst_start_time in conn.attr[direction][co.BURSTS]:
-                    frac_bytes = (bytes + 0.0) / conn_bytes
-                    if frac_bytes > 1.1:
-                        print(frac_bytes, bytes, pkts, conn_bytes, direction, conn_id, flow_id)
-                        continue
-                    if frac_bytes < 0:
-                        print(frac_bytes, bytes, pkts, conn_bytes, direction, conn_id, flow_id)
-                        continue
-                    burst_start_time_int = long(burst_start_time)
-                    burst_start_time_dec = float('0.' + str(burst_start_time - burst_start_time_int).split('.')[1])
-                    relative_time_int = burst_start_time_int - conn_start_time_int
-                    relative_time_dec = burst_start_time_dec - conn_start_time_dec
-                    relative_time = relative_time_int + relative_time_dec
-                    frac_duration = relative_time / conn_duration
-                    if frac_duration >= 0.0 and frac_duration <= 2.0:
-                        if conn_bytes < 10000:
-                            label = TINY
-                        elif conn_bytes < 100000:
-                            label = SMALL
-                        elif conn_bytes < 1000000:
-                            label = MEDIUM
-                        else:
-                            label = LARGE
-                        results_duration_bytes[direction][label].append((frac_duration, frac_bytes))
-                        to_add_pkts.append(pkts)
-                        tot_packs += pkts
+                conn_bytes, bursts = directions[direction]
+                for flow_id, frac_duration, frac_bytes, pkts in bursts:
+                    if conn_bytes < 10000:
+                        label = TINY
+                    elif conn_bytes < 100000:
+                        label = SMALL
+                    elif conn_bytes < 1000000:
+                        label = MEDIUM
+                    else:
+                        label = LARGE
+                    results_duration_bytes[direction][label].append((frac_duration, frac_bytes))
+                    to_add_pkts.append(pkts)
+                    tot_packs += pkts
 
                 if conn_bytes < 10000:
                     label = TINY
@@ -143,108 +94,122 @@ for fname, conns in multiflow_connections.iteritems():
                     results_pkts[direction][label].append(p * 1.0 / tot_packs)
 
 
-base_graph_name = 'bursts_'
-color = {TINY: 'red', SMALL: 'blue', MEDIUM: 'green', LARGE: 'orange'}
-ls = {TINY: ':', SMALL: '-.', MEDIUM: '--', LARGE: '-'}
-for direction in co.DIRECTIONS:
-    plt.figure()
-    plt.clf()
-    fig, ax = plt.subplots()
-    graph_fname = os.path.splitext(base_graph_name)[0] + "duration_cdf_" + direction + ".pdf"
-    graph_full_path = os.path.join(sums_dir_exp, graph_fname)
-
-    for label in [TINY, SMALL, MEDIUM, LARGE]:
-        x_val = [x[0] for x in results_duration_bytes[direction][label]]
-
-        sample = np.array(sorted(x_val))
-        sorted_array = np.sort(sample)
-        yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
-        if len(sorted_array) > 0:
-            # Add a last point
-            sorted_array = np.append(sorted_array, sorted_array[-1])
-            yvals = np.append(yvals, 1.0)
-            ax.plot(sorted_array, yvals, color=color[label], linestyle=ls[label], linewidth=2, label=label)
-
-            # Shrink current axis's height by 10% on the top
-            # box = ax.get_position()
-            # ax.set_position([box.x0, box.y0,
-            #                  box.width, box.height * 0.9])
-
-            # ax.set_xscale('log')
-
-            # Put a legend above current axis
-            # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
-    ax.legend(loc='lower right')
-    plt.xlabel('Fraction of connection duration', fontsize=24)
-    plt.ylabel("CDF", fontsize=24)
-    plt.savefig(graph_full_path)
-    plt.close('all')
-
-    plt.figure()
-    plt.clf()
-    fig, ax = plt.subplots()
-    graph_fname = os.path.splitext(base_graph_name)[0] + "bytes_cdf_" + direction + ".pdf"
-    graph_full_path = os.path.join(sums_dir_exp, graph_fname)
-
-    for label in [TINY, SMALL, MEDIUM, LARGE]:
-        y_val = [x[1] for x in results_duration_bytes[direction][label]]
-
-        sample = np.array(sorted(y_val))
-        sorted_array = np.sort(sample)
-        yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
-        if len(sorted_array) > 0:
-            # Add a last point
-            sorted_array = np.append(sorted_array, sorted_array[-1])
-            yvals = np.append(yvals, 1.0)
-            ax.plot(sorted_array, yvals, color=color[label], linestyle=ls[label], linewidth=2, label=label)
-
-            # Shrink current axis's height by 10% on the top
-            # box = ax.get_position()
-            # ax.set_position([box.x0, box.y0,
-            #                  box.width, box.height * 0.9])
-
-            # ax.set_xscale('log')
-
-            # Put a legend above current axis
-            # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
-
-    ax.legend(loc='lower right')
-    plt.xlim(0.0, 1.0)
-    plt.xlabel('Fraction of connection bytes', fontsize=24)
-    plt.ylabel("CDF", fontsize=24)
-    plt.savefig(graph_full_path)
-    plt.close('all')
-
-
-    plt.figure()
-    plt.clf()
-    fig, ax = plt.subplots()
-    graph_fname = os.path.splitext(base_graph_name)[0] + "pkts_cdf_" + direction + ".pdf"
-    graph_full_path = os.path.join(sums_dir_exp, graph_fname)
-
-    for label in [TINY, SMALL, MEDIUM, LARGE]:
-        sample = np.array(sorted(results_pkts[direction][label]))
-        sorted_array = np.sort(sample)
-        yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
-        if len(sorted_array) > 0:
-            # Add a last point
-            sorted_array = np.append(sorted_array, sorted_array[-1])
-            yvals = np.append(yvals, 1.0)
-            ax.plot(sorted_array, yvals, color=color[label], linestyle=ls[label], linewidth=2, label=label)
-
-            # Shrink current axis's height by 10% on the top
-            # box = ax.get_position()
-            # ax.set_position([box.x0, box.y0,
-            #                  box.width, box.height * 0.9])
-
-            # ax.set_xscale('log')
-
-            # Put a legend above current axis
-            # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
-
-    ax.legend(loc='lower right')
-    plt.xlim(0.0, 1.0)
-    plt.xlabel('Fraction of connection packets', fontsize=24)
-    plt.ylabel("CDF", fontsize=24)
-    plt.savefig(graph_full_path)
-    plt.close('all')
+    base_graph_name = 'bursts_'
+    color = {TINY: 'red', SMALL: 'blue', MEDIUM: 'green', LARGE: 'orange'}
+    ls = {TINY: ':', SMALL: '-.', MEDIUM: '--', LARGE: '-'}
+    for direction in co.DIRECTIONS:
+        plt.figure()
+        plt.clf()
+        fig, ax = plt.subplots()
+        graph_fname = os.path.splitext(base_graph_name)[0] + "duration_cdf_" + direction + ".pdf"
+        graph_full_path = os.path.join(sums_dir_exp, graph_fname)
+
+        for label in [TINY, SMALL, MEDIUM, LARGE]:
+            x_val = [x[0] for x in results_duration_bytes[direction][label]]
+
+            sorted_array, yvals = co.get_cdf(x_val)
+            if len(sorted_array) > 0:
+                ax.plot(sorted_array, yvals, color=color[label], linestyle=ls[label], linewidth=2, label=label)
+
+                # Shrink current axis's height by 10% on the top
+                # box = ax.get_position()
+                # ax.set_position([box.x0, box.y0,
+                #                  box.width, box.height * 0.9])
+
+                # ax.set_xscale('log')
+
+                # Put a legend above current axis
+                # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
+        ax.legend(loc='lower right')
+        plt.xlabel('Fraction of connection duration', fontsize=24)
+        plt.ylabel("CDF", fontsize=24)
+        plt.savefig(graph_full_path)
+        plt.close('all')
+
+        plt.figure()
+        plt.clf()
+        fig, ax = plt.subplots()
+        graph_fname = os.path.splitext(base_graph_name)[0] + "bytes_cdf_" + direction + ".pdf"
+        graph_full_path = os.path.join(sums_dir_exp, graph_fname)
+
+        for label in [TINY, SMALL, MEDIUM, LARGE]:
+            y_val = [x[1] for x in results_duration_bytes[direction][label]]
+
+            sorted_array, yvals = co.get_cdf(y_val)
+            if len(sorted_array) > 0:
+                ax.plot(sorted_array, yvals, color=color[label], linestyle=ls[label], linewidth=2, label=label)
+
+                # Shrink current axis's height by 10% on the top
+                # box = ax.get_position()
+                # ax.set_position([box.x0, box.y0,
+                #                  box.width, box.height * 0.9])
+
+                # ax.set_xscale('log')
+
+                # Put a legend above current axis
+                # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
+
+        ax.legend(loc='lower right')
+        plt.xlim(0.0, 1.0)
+        plt.xlabel('Fraction of connection bytes', fontsize=24)
+        plt.ylabel("CDF", fontsize=24)
+        plt.savefig(graph_full_path)
+        plt.close('all')
+
+
+        plt.figure()
+        plt.clf()
+        fig, ax = plt.subplots()
+        graph_fname = os.path.splitext(base_graph_name)[0] + "pkts_cdf_" + direction + ".pdf"
+        graph_full_path = os.path.join(sums_dir_exp, graph_fname)
+
+        for label in [TINY, SMALL, MEDIUM, LARGE]:
+            sorted_array, yvals = co.get_cdf(results_pkts[direction][label])
+            if len(sorted_array) > 0:
+                ax.plot(sorted_array, yvals, color=color[label], linestyle=ls[label], linewidth=2, label=label)
+
+                # Shrink current axis's height by 10% on the top
+                # box = ax.get_position()
+                # ax.set_position([box.x0, box.y0,
+                #                  box.width, box.height * 0.9])
+
+                # ax.set_xscale('log')
+
+                # Put a legend above current axis
+                # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
+
+        ax.legend(loc='lower right')
+        plt.xlim(0.0, 1.0)
+        plt.xlabel('Fraction of connection packets', fontsize=24)
+        plt.ylabel("CDF", fontsize=24)
+        plt.savefig(graph_full_path)
+        plt.close('all')
+
+##################################################
+##                     MAIN                     ##
+##################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize stat files generated by analyze")
+    parser.add_argument("-s",
+                        "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument('-S',
+                        "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument("-d",
+                        "--dirs", help="list of directories to aggregate", nargs="+")
+
+    args = parser.parse_args()
+    stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
+    sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
+    co.check_directory_exists(sums_dir_exp)
+    print('-s dir is', args.stat, 'and -S dir is', args.sums)
+
+    # Only the bursts of the connections are needed: the stat files are not loaded if they are cached
+    burst_splits = cog.fetch_metric(stat_dir_exp, args, cog.BURST_SPLITS)
+    plot(None, None, sums_dir_exp, burst_splits=burst_splits)
+
+
+if __name__ == '__main__':
+    main()
@@ -33,8 +33,8 @@ import numpy as np
 import os
 import sys
 
-# Add root directory in Python path and be at the root
-ROOT_DIR = os.path.abspath(os.path.join(".", os.pardir))
+# Add root directory in Python path and be at the root (nothing changes when imported by launch_graphs)
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 os.chdir(ROOT_DIR)
 sys.path.append(ROOT_DIR)
 
@@ -44,109 +44,104 @@ import mptcp
 import tcp
 
 ##################################################
-##                  ARGUMENTS                   ##
+##               PLOTTING RESULTS               ##
 ##################################################
 
-parser = argparse.ArgumentParser(
-    description="Summarize stat files generated by analyze")
-parser.add_argument("-s",
-                    "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
-parser.add_argument('-S',
-                    "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
-parser.add_argument("-d",
-                    "--dirs", help="list of directories to aggregate", nargs="+")
-
-args = parser.parse_args()
-stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
-sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
-co.check_directory_exists(sums_dir_exp)
-print('-s dir is', args.stat, 'and -S dir is', args.sums)
+
+def plot(connections, multiflow_connections, sums_dir_exp):
+    # results_duration_bytes = {co.C2S: {'0B-10KB': [], '10KB-100KB': [], '100KB-1MB': [], '>=1MB': []}, co.S2C: {'0B-10KB': [], '10KB-100KB': [], '100KB-1MB': [], '>=1MB': []}}
+    bursts_size = {co.C2S: [], co.S2C: []}
+    bursts_pkt_size = {co.C2S: [], co.S2C: []}
+    min_duration = 0.001
+    for fname, conns in multiflow_connections.iteritems():
+        for conn_id, conn in conns.iteritems():
+            for direction in co.DIRECTIONS:
+                if co.BURSTS in conn.attr[direction]:
+                    for flow_id, count_seq_burst, count_pkt_burst, duration, begin_time_burst_on_flow in conn.attr[direction][co.BURSTS]:
+                        bursts_size[direction].append(count_seq_burst)
+                        bursts_pkt_size[direction].append(count_pkt_burst)
+
+    base_graph_name = 'bursts_size'
+    color = {'0B-10KB': 'red', '10KB-100KB': 'blue', '100KB-1MB': 'green', '>=1MB': 'orange'}
+    ls = {'0B-10KB': ':', '10KB-100KB': '-.', '100KB-1MB': '--', '>=1MB': '-'}
+    for direction in co.DIRECTIONS:
+        plt.figure()
+        plt.clf()
+        fig, ax = plt.subplots()
+        graph_fname = os.path.splitext(base_graph_name)[0] + "_cdf_" + direction + ".pdf"
+        graph_full_path = os.path.join(sums_dir_exp, graph_fname)
+
+        sorted_array, yvals = co.get_cdf(bursts_size[direction])
+        if len(sorted_array) > 0:
+            ax.plot(sorted_array, yvals, color='red', linestyle='-', linewidth=2, label='Bursts')
+
+            # Shrink current axis's height by 10% on the top
+            # box = ax.get_position()
+            # ax.set_position([box.x0, box.y0,
+            #                  box.width, box.height * 0.9])
+
+            # ax.set_xscale('log')
+
+            # Put a legend above current axis
+            # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
+        ax.legend(loc='lower right')
+        ax.set_xscale('log')
+        plt.xlabel('Burst size [Byte]', fontsize=24)
+        plt.ylabel("CDF", fontsize=24)
+        plt.savefig(graph_full_path)
+        plt.close('all')
+
+        plt.figure()
+        plt.clf()
+        fig, ax = plt.subplots()
+        graph_fname = os.path.splitext(base_graph_name)[0] + "_cdf_pkt_" + direction + ".pdf"
+        graph_full_path = os.path.join(sums_dir_exp, graph_fname)
+
+        sorted_array, yvals = co.get_cdf(bursts_pkt_size[direction])
+        if len(sorted_array) > 0:
+            ax.plot(sorted_array, yvals, color='red', linestyle='-', linewidth=2, label='Bursts')
+
+            # Shrink current axis's height by 10% on the top
+            # box = ax.get_position()
+            # ax.set_position([box.x0, box.y0,
+            #                  box.width, box.height * 0.9])
+
+            # ax.set_xscale('log')
+
+            # Put a legend above current axis
+            # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
+        ax.legend(loc='lower right')
+        ax.set_xscale('log')
+        plt.xlabel('Burst size [# Packets]', fontsize=24)
+        plt.ylabel("CDF", fontsize=24)
+        plt.savefig(graph_full_path)
+        plt.close('all')
 
 ##################################################
-##                 GET THE DATA                 ##
+##                     MAIN                     ##
 ##################################################
 
-connections = cog.fetch_valid_data(stat_dir_exp, args)
-multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
 
-##################################################
-##               PLOTTING RESULTS               ##
-##################################################
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize stat files generated by analyze")
+    parser.add_argument("-s",
+                        "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument('-S',
+                        "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument("-d",
+                        "--dirs", help="list of directories to aggregate", nargs="+")
+
+    args = parser.parse_args()
+    stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
+    sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
+    co.check_directory_exists(sums_dir_exp)
+    print('-s dir is', args.stat, 'and -S dir is', args.sums)
+
+    connections = cog.fetch_valid_data(stat_dir_exp, args)
+    multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
+    plot(connections, multiflow_connections, sums_dir_exp)
+
 
-# results_duration_bytes = {co.C2S: {'0B-10KB': [], '10KB-100KB': [], '100KB-1MB': [], '>=1MB': []}, co.S2C: {'0B-10KB': [], '10KB-100KB': [], '100KB-1MB': [], '>=1MB': []}}
-bursts_size = {co.C2S: [], co.S2C: []}
-bursts_pkt_size = {co.C2S: [], co.S2C: []}
-min_duration = 0.001
-for fname, conns in multiflow_connections.iteritems():
-    for conn_id, conn in conns.iteritems():
-        for direction in co.DIRECTIONS:
-            if co.BURSTS in conn.attr[direction]:
-                for flow_id, count_seq_burst, count_pkt_burst, duration, begin_time_burst_on_flow in conn.attr[direction][co.BURSTS]:
-                    bursts_size[direction].append(count_seq_burst)
-                    bursts_pkt_size[direction].append(count_pkt_burst)
-
-base_graph_name = 'bursts_size'
-color = {'0B-10KB': 'red', '10KB-100KB': 'blue', '100KB-1MB': 'green', '>=1MB': 'orange'}
-ls = {'0B-10KB': ':', '10KB-100KB': '-.', '100KB-1MB': '--', '>=1MB': '-'}
-for direction in co.DIRECTIONS:
-    plt.figure()
-    plt.clf()
-    fig, ax = plt.subplots()
-    graph_fname = os.path.splitext(base_graph_name)[0] + "_cdf_" + direction + ".pdf"
-    graph_full_path = os.path.join(sums_dir_exp, graph_fname)
-
-    sample = np.array(sorted(bursts_size[direction]))
-    sorted_array = np.sort(sample)
-    yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
-    if len(sorted_array) > 0:
-        # Add a last point
-        sorted_array = np.append(sorted_array, sorted_array[-1])
-        yvals = np.append(yvals, 1.0)
-        ax.plot(sorted_array, yvals, color='red', linestyle='-', linewidth=2, label='Bursts')
-
-        # Shrink current axis's height by 10% on the top
-        # box = ax.get_position()
-        # ax.set_position([box.x0, box.y0,
-        #                  box.width, box.height * 0.9])
-
-        # ax.set_xscale('log')
-
-        # Put a legend above current axis
-        # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
-    ax.legend(loc='lower right')
-    ax.set_xscale('log')
-    plt.xlabel('Burst size [Byte]', fontsize=24)
-    plt.ylabel("CDF", fontsize=24)
-    plt.savefig(graph_full_path)
-    plt.close('all')
-
-    plt.figure()
-    plt.clf()
-    fig, ax = plt.subplots()
-    graph_fname = os.path.splitext(base_graph_name)[0] + "_cdf_pkt_" + direction + ".pdf"
-    graph_full_path = os.path.join(sums_dir_exp, graph_fname)
-
-    sample = np.array(sorted(bursts_pkt_size[direction]))
-    sorted_array = np.sort(sample)
-    yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
-    if len(sorted_array) > 0:
-        # Add a last point
-        sorted_array = np.append(sorted_array, sorted_array[-1])
-        yvals = np.append(yvals, 1.0)
-        ax.plot(sorted_array, yvals, color='red', linestyle='-', linewidth=2, label='Bursts')
-
-        # Shrink current axis's height by 10% on the top
-        # box = ax.get_position()
-        # ax.set_position([box.x0, box.y0,
-        #                  box.width, box.height * 0.9])
-
-        # ax.set_xscale('log')
-
-        # Put a legend above current axis
-        # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
-    ax.legend(loc='lower right')
-    ax.set_xscale('log')
-    plt.xlabel('Burst size [# Packets]', fontsize=24)
-    plt.ylabel("CDF", fontsize=24)
-    plt.savefig(graph_full_path)
-    plt.close('all')
+if __name__ == '__main__':
+    main()
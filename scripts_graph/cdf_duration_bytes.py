@@ -33,8 +33,8 @@ import numpy as np
 import os
 import sys
 
-# Add root directory in Python path and be at the root
-ROOT_DIR = os.path.abspath(os.path.join(".", os.pardir))
+# Add root directory in Python path and be at the root (nothing changes when imported by launch_graphs)
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 os.chdir(ROOT_DIR)
 sys.path.append(ROOT_DIR)
 
@@ -43,38 +43,38 @@ import common_graph as cog
 import mptcp
 import tcp
 
-##################################################
-##                  ARGUMENTS                   ##
-##################################################
-
-parser = argparse.ArgumentParser(
-    description="Summarize stat files generated by analyze")
-parser.add_argument("-s",
-                    "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
-parser.add_argument('-S',
-                    "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
-parser.add_argument("-d",
-                    "--dirs", help="list of directories to aggregate", nargs="+")
-
-args = parser.parse_args()
-stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
-sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
-co.check_directory_exists(sums_dir_exp)
-print('-s dir is', args.stat, 'and -S dir is', args.sums)
-
 ##################################################
 ##                 GET THE DATA                 ##
 ##################################################
 
-connections = cog.fetch_valid_data(stat_dir_exp, args)
-multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
+# Only scalar attributes are needed, they are loaded from the columnar stores when launched as a script
+BYTES_MPTCPTRACE_COLUMNS = [co.get_column_name(co.BYTES_MPTCPTRACE, direction) for direction in co.DIRECTIONS]
+BYTES_DATA_COLUMNS = [co.get_column_name(co.BYTES_DATA, direction) for direction in co.DIRECTIONS]
+CONN_COLUMNS = [co.CONN_ID, co.IS_MPTCP, co.DURATION, co.SOCKS_PORT] + BYTES_MPTCPTRACE_COLUMNS
+FLOW_COLUMNS = [co.CONN_ID, co.DURATION] + BYTES_DATA_COLUMNS
 
 ##################################################
 ##               PLOTTING RESULTS               ##
 ##################################################
 
+# Derived metrics used by plot, computed (or checked in their cache) once by launch_graphs for all its graphs
+PLOT_METRICS = [cog.CONN_DATA_PACKS]
+
 
 def plot(connections, multiflow_connections, sums_dir_exp):
+    conn_columns = {}
+    flow_columns = {}
+    for fname, conns in connections.iteritems():
+        conn_columns[fname] = co.get_columns(conns, CONN_COLUMNS)
+        flow_columns[fname] = co.get_columns(conns, FLOW_COLUMNS, table=co.FLOW_TABLE)
+
+    plot_columns(conn_columns, flow_columns, cog.get_metric(cog.CONN_DATA_PACKS, connections), sums_dir_exp)
+
+
+def plot_columns(conn_columns, flow_columns, conn_data_packs, sums_dir_exp):
+    """ Plot from the columns of the valid connections and of their subflows, and the number of packets of the bursts of
+        the connections, for each stat file
+    """
     ALERT_DURATION = 3600
     ALERT_BYTES = 50000000
     data_duration = []
@@ -95,52 +95,46 @@ def plot(connections, multiflow_connections, sums_dir_exp):
     fname_max_bytes = None
     conn_id_max_bytes = None
 
-    for fname, conns in connections.iteritems():
-        for conn_id, conn in conns.iteritems():
-            if isinstance(conn, mptcp.MPTCPConnection) and co.DURATION in conn.attr:
-                duration = float(conn.attr[co.DURATION])
-                bytes = 0
-                data_pkts = 0
-                for direction in co.DIRECTIONS:
-                    bytes += conn.attr[direction][co.BYTES_MPTCPTRACE]
-                    if co.BURSTS in conn.attr[direction]:
-                        for flow_id, seq_burst, pkt_burst, seq_duration, time in conn.attr[direction][co.BURSTS]:
-                            data_pkts += pkt_burst
-
-                if bytes == 11:
-                    if co.SOCKS_PORT in conn.attr:
-                        socks_port = conn.attr[co.SOCKS_PORT]
-                        if socks_port not in ports_11_bytes:
-                            ports_11_bytes[socks_port] = 1
-                        else:
-                            ports_11_bytes[socks_port] += 1
-
-                if duration >= ALERT_DURATION:
-                    print("DURATION", fname, conn_id, duration)
-                if bytes >= ALERT_BYTES:
-                    print("BYTES", fname, conn_id, bytes)
-
-                if duration > max_duration:
-                    max_duration = duration
-                    fname_max_duration = fname
-                    conn_id_max_duration = conn_id
-
-                if bytes > max_bytes:
-                    max_bytes = bytes
-                    fname_max_bytes = fname
-                    conn_id_max_bytes = conn_id
-
-                data_duration.append(duration)
-                data_bytes.append(bytes)
-                data_packets.append(data_pkts)
-
-                for flow_id, flow in conn.flows.iteritems():
-                    if co.DURATION in flow.attr:
-                        subflows_duration.append(flow.attr[co.DURATION])
-                        subflow_bytes = 0
-                        for direction in co.DIRECTIONS:
-                            subflow_bytes += flow.attr[direction][co.BYTES_DATA]
-                        subflows_bytes.append(subflow_bytes)
+    for fname, conns in conn_columns.iteritems():
+        flows = flow_columns[fname]
+        plotted = np.ma.filled(conns[co.IS_MPTCP], False).astype(np.bool_) & ~np.ma.getmaskarray(conns[co.DURATION])
+        has_socks_port = ~np.ma.getmaskarray(conns[co.SOCKS_PORT])
+        for i in np.flatnonzero(plotted):
+            conn_id = int(conns[co.CONN_ID][i])
+            duration = float(conns[co.DURATION][i])
+            bytes = int(sum([conns[column][i] for column in BYTES_MPTCPTRACE_COLUMNS]))
+            data_pkts = conn_data_packs[fname][conn_id]
+
+            if bytes == 11:
+                if has_socks_port[i]:
+                    socks_port = int(conns[co.SOCKS_PORT][i])
+                    if socks_port not in ports_11_bytes:
+                        ports_11_bytes[socks_port] = 1
+                    else:
+                        ports_11_bytes[socks_port] += 1
+
+            if duration >= ALERT_DURATION:
+                print("DURATION", fname, conn_id, duration)
+            if bytes >= ALERT_BYTES:
+                print("BYTES", fname, conn_id, bytes)
+
+            if duration > max_duration:
+                max_duration = duration
+                fname_max_duration = fname
+                conn_id_max_duration = conn_id
+
+            if bytes > max_bytes:
+                max_bytes = bytes
+                fname_max_bytes = fname
+                conn_id_max_bytes = conn_id
+
+            data_duration.append(duration)
+            data_bytes.append(bytes)
+            data_packets.append(data_pkts)
+
+        flow_rows = np.in1d(flows[co.CONN_ID], conns[co.CONN_ID][plotted]) & ~np.ma.getmaskarray(flows[co.DURATION])
+        subflows_duration.extend(np.ma.getdata(flows[co.DURATION])[flow_rows].tolist())
+        subflows_bytes.extend(sum([np.ma.filled(flows[column], 0) for column in BYTES_DATA_COLUMNS])[flow_rows].tolist())
 
 
     # co.plot_cdfs_natural(data_duration, color, 'Seconds [s]', base_graph_path_duration)
@@ -171,13 +165,8 @@ def plot(connections, multiflow_connections, sums_dir_exp):
     fig, ax = plt.subplots()
 
     graph_fname = os.path.splitext(base_graph_path_duration)[0] + "_cdf_log.pdf"
-    sample = np.array(sorted(data_duration))
-    sorted_array = np.sort(sample)
-    yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
+    sorted_array, yvals = co.get_cdf(data_duration)
     if len(sorted_array) > 0:
-        # Add a last point
-        sorted_array = np.append(sorted_array, sorted_array[-1])
-        yvals = np.append(yvals, 1.0)
         ax.plot(sorted_array, yvals, color=color, linewidth=2, label="MPTCP Connections")
 
         # Shrink current axis's height by 10% on the top
@@ -231,13 +220,8 @@ def plot(connections, multiflow_connections, sums_dir_exp):
     fig, ax = plt.subplots()
 
     graph_fname = os.path.splitext(base_graph_path_bytes)[0] + "_cdf_log.pdf"
-    sample = np.array(sorted(data_bytes))
-    sorted_array = np.sort(sample)
-    yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
+    sorted_array, yvals = co.get_cdf(data_bytes)
     if len(sorted_array) > 0:
-        # Add a last point
-        sorted_array = np.append(sorted_array, sorted_array[-1])
-        yvals = np.append(yvals, 1.0)
         ax.plot(sorted_array, yvals, color=color, linewidth=2, label="MPTCP Connections")
 
         # Shrink current axis's height by 10% on the top
@@ -270,4 +254,32 @@ def plot(connections, multiflow_connections, sums_dir_exp):
     plt.savefig(graph_fname)
     plt.close('all')
 
-plot(connections, multiflow_connections, sums_dir_exp)
+##################################################
+##                     MAIN                     ##
+##################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize stat files generated by analyze")
+    parser.add_argument("-s",
+                        "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument('-S',
+                        "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument("-d",
+                        "--dirs", help="list of directories to aggregate", nargs="+")
+
+    args = parser.parse_args()
+    stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
+    sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
+    co.check_directory_exists(sums_dir_exp)
+    print('-s dir is', args.stat, 'and -S dir is', args.sums)
+
+    conn_columns = cog.fetch_valid_columns(stat_dir_exp, args, CONN_COLUMNS)
+    flow_columns = cog.fetch_valid_columns(stat_dir_exp, args, FLOW_COLUMNS, table=co.FLOW_TABLE)
+    conn_data_packs = cog.fetch_metric(stat_dir_exp, args, cog.CONN_DATA_PACKS)
+    plot_columns(conn_columns, flow_columns, conn_data_packs, sums_dir_exp)
+
+
+if __name__ == '__main__':
+    main()
@@ -40,30 +40,44 @@ sys.path.append(ROOT_DIR)
 
 import common as co
 import common_graph as cog
+import cPickle
 import mptcp
 import pickle
 import tcp
 
 
-def check_in_list(dirpath, dirs):
-    """ Check if dirpath is one of the dir in dirs, True if dirs is empty """
-    if not dirs:
-        return True
-    return os.path.basename(dirpath) in dirs
+def iter_data(dir_exp, args, process_data=None):
+    """ Yield (fname, connections) for each stat file of dir_exp in the directories selected by args.dirs, lazily and
+        loaded in parallel (see co.iter_stat_files)
+    """
+    co.check_directory_exists(dir_exp)
+    return co.iter_stat_files(co.list_stat_files(dir_exp, args.dirs), process_data=process_data)
 
 
 def fetch_data(dir_exp, args):
+    return dict(iter_data(dir_exp, args))
+
+
+def update_columns(stat_filepath):
+    """ (Re)build the columnar store of stat_filepath from it if the store is missing or outdated """
+    if not co.is_columns_up_to_date(stat_filepath):
+        stat_file = open(stat_filepath, 'r')
+        co.write_columns(stat_filepath, pickle.load(stat_file))
+        stat_file.close()
+
+
+def fetch_columns(dir_exp, args, columns, table=co.CONN_TABLE):
+    """ Return a dictionary with, for each stat file, the columns of table in its columnar store
+        The store is (re)built from the stat file if it is missing or outdated
+    """
     co.check_directory_exists(dir_exp)
     dico = {}
-    for dirpath, dirnames, filenames in os.walk(dir_exp):
-        if check_in_list(dirpath, args.dirs):
-            for fname in filenames:
-                try:
-                    stat_file = open(os.path.join(dirpath, fname), 'r')
-                    dico[fname] = pickle.load(stat_file)
-                    stat_file.close()
-                except IOError as e:
-                    print(str(e) + ': skip stat file ' + fname, file=sys.stderr)
+    for fname, stat_filepath in co.list_stat_files(dir_exp, args.dirs):
+        try:
+            update_columns(stat_filepath)
+            dico[fname] = co.load_columns(stat_filepath, columns, table=table)
+        except (IOError, OSError) as e:
+            print(str(e) + ': skip stat file ' + fname, file=sys.stderr)
     return dico
 
 
@@ -85,39 +99,115 @@ def get_multiflow_connections(connections):
     return multiflow_connections, singleflow_connections
 
 
-def fetch_valid_data(dir_exp, args):
-    connections = fetch_data(dir_exp, args)
-
-    def ensures_smartphone_to_proxy():
-        for fname in connections.keys():
-            for conn_id in connections[fname].keys():
-                if isinstance(connections[fname][conn_id], mptcp.MPTCPConnection):
-                    inside = True
-                    for flow_id, flow in connections[fname][conn_id].flows.iteritems():
-                        if not [x for x in co.PREFIX_IP_PROXY if flow.attr[co.DADDR].startswith(x)] and not flow.attr[co.DADDR] in co.IP_PROXY:
-                            connections[fname].pop(conn_id, None)
-                            inside = False
-                            break
-                    if inside:
-                        for direction in co.DIRECTIONS:
-                            # This is a fix for wrapping seq num
-                            if connections[fname][conn_id].attr[direction].get(co.BYTES_MPTCPTRACE, -2 ** 32) < -1:
-                                connections[fname][conn_id].attr[direction][co.BYTES_MPTCPTRACE] = 2 ** 32 + connections[fname][conn_id].attr[direction].get(co.BYTES_MPTCPTRACE, -2 ** 32)
-
-    ensures_smartphone_to_proxy()
-
-    # Very strange cases, mptcptrace has difficult to analyze this now
-    if 'dump_20150408_14121313' in connections:
-        connections['dump_20150408_14121313'].pop(25581, None)
-    if 'dump_20150308_21403706' in connections:
-        connections['dump_20150308_21403706'].pop(5154, None)
-        connections['dump_20150308_21403706'].pop(19983, None)
-    if 'dump_20150408_14121302' in connections:
-        connections['dump_20150408_14121302'].pop(7004, None)
+# Very strange cases, mptcptrace has difficult to analyze this now: stat file name -> ids of the connections to skip
+SKIPPED_CONNS = {
+    'dump_20150408_14121313': [25581],
+    'dump_20150308_21403706': [5154, 19983],
+    'dump_20150408_14121302': [7004],
+}
+
+
+def is_proxy_addr(addr):
+    """ Return True if addr is an IP address of the proxy """
+    return addr in co.IP_PROXY or bool([x for x in co.PREFIX_IP_PROXY if addr.startswith(x)])
+
+
+def ensures_smartphone_to_proxy(fname, connections):
+    """ Return the connections of the stat file fname, without the MPTCP connections with a subflow not going to the proxy
+        Called in the loading processes, before sending connections back
+    """
+    for conn_id in connections.keys():
+        if isinstance(connections[conn_id], mptcp.MPTCPConnection):
+            inside = True
+            for flow_id, flow in connections[conn_id].flows.iteritems():
+                if not is_proxy_addr(flow.attr[co.DADDR]):
+                    connections.pop(conn_id, None)
+                    inside = False
+                    break
+            if inside:
+                for direction in co.DIRECTIONS:
+                    # This is a fix for wrapping seq num
+                    if connections[conn_id].attr[direction].get(co.BYTES_MPTCPTRACE, -2 ** 32) < -1:
+                        connections[conn_id].attr[direction][co.BYTES_MPTCPTRACE] = 2 ** 32 + connections[conn_id].attr[direction].get(co.BYTES_MPTCPTRACE, -2 ** 32)
+
+    for conn_id in SKIPPED_CONNS.get(fname, []):
+        connections.pop(conn_id, None)
 
     return connections
 
 
+class ValidConnections(dict):
+
+    """ Connections of the stat file at stat_filepath, as loaded by fetch_valid_data
+        get_metric caches the derived metrics of such dictionaries, but not of the ones built from them (subsets...)
+    """
+
+    def __init__(self, stat_filepath, connections):
+        super(ValidConnections, self).__init__(connections)
+        self.stat_filepath = stat_filepath
+
+
+def iter_valid_data(dir_exp, args):
+    """ Like iter_data, with the connections filtered by ensures_smartphone_to_proxy
+        The connections of a stat file are a ValidConnections, unless several stat files have the same name (only one of
+        them is kept by fetch_valid_data)
+    """
+    co.check_directory_exists(dir_exp)
+    stat_files = co.list_stat_files(dir_exp, args.dirs)
+    fnames = [fname for fname, stat_filepath in stat_files]
+    stat_filepaths = dict([(fname, stat_filepath) for fname, stat_filepath in stat_files if fnames.count(fname) == 1])
+
+    def process_data(fname, connections):
+        connections = ensures_smartphone_to_proxy(fname, connections)
+        if fname in stat_filepaths:
+            return ValidConnections(stat_filepaths[fname], connections)
+        return connections
+
+    return co.iter_stat_files(stat_files, process_data=process_data)
+
+
+def fetch_valid_data(dir_exp, args):
+    return dict(iter_valid_data(dir_exp, args))
+
+
+def load_valid_columns(fname, stat_filepath, columns, table=co.CONN_TABLE):
+    """ Return the columns of table in the columnar store of the stat file fname (at stat_filepath), with only the rows
+        of the connections kept by ensures_smartphone_to_proxy, and the same fix of BYTES_MPTCPTRACE
+    """
+    conns = co.load_columns(stat_filepath, [co.CONN_ID, co.IS_MPTCP])
+    flows = co.load_columns(stat_filepath, [co.CONN_ID, co.DADDR], table=co.FLOW_TABLE)
+    is_mptcp = np.ma.filled(conns[co.IS_MPTCP], False).astype(np.bool_)
+    outside_conn_ids = [conn_id for conn_id, daddr in zip(flows[co.CONN_ID], flows[co.DADDR]) if not is_proxy_addr(daddr)]
+    skipped = (is_mptcp & np.in1d(conns[co.CONN_ID], outside_conn_ids)) | np.in1d(conns[co.CONN_ID], SKIPPED_CONNS.get(fname, []))
+
+    table_columns = co.load_columns(stat_filepath, list(set(columns + [co.CONN_ID])), table=table)
+    rows = np.in1d(table_columns[co.CONN_ID], conns[co.CONN_ID][~skipped])
+    mptcp_rows = np.in1d(table_columns[co.CONN_ID][rows], conns[co.CONN_ID][~skipped & is_mptcp])
+    result = dict([(column, table_columns[column][rows]) for column in columns])
+    for direction in co.DIRECTIONS:
+        column = co.get_column_name(co.BYTES_MPTCPTRACE, direction)
+        if table == co.CONN_TABLE and column in result:
+            # This is a fix for wrapping seq num (missing values become 0, as in ensures_smartphone_to_proxy)
+            values = np.ma.filled(result[column], -2 ** 32)
+            values = np.where(mptcp_rows & (values < -1), 2 ** 32 + values, values)
+            result[column] = np.ma.array(values, mask=np.ma.getmaskarray(result[column]) & ~mptcp_rows)
+
+    return result
+
+
+def fetch_valid_columns(dir_exp, args, columns, table=co.CONN_TABLE):
+    """ Like fetch_columns, with only the rows of the connections kept by fetch_valid_data (see load_valid_columns) """
+    co.check_directory_exists(dir_exp)
+    dico = {}
+    for fname, stat_filepath in co.list_stat_files(dir_exp, args.dirs):
+        try:
+            update_columns(stat_filepath)
+            dico[fname] = load_valid_columns(fname, stat_filepath, columns, table=table)
+        except (IOError, OSError) as e:
+            print(str(e) + ': skip stat file ' + fname, file=sys.stderr)
+    return dico
+
+
 def filter_connections(connections, min_bytes=None, max_bytes=None):
     filtered = {}
 
@@ -132,3 +222,303 @@ def filter_connections(connections, min_bytes=None, max_bytes=None):
     return filtered
 
 # connections = filter_connections(connections)
+
+##################################################
+##               DERIVED METRICS                ##
+##################################################
+
+# Derived metrics, computed for each stat file from its valid connections (see fetch_valid_data)
+CONN_BYTES_DATA = 'conn_bytes_data'
+RTT_DIFF_SFS = 'rtt_diff_sfs'
+HANDOVER_NEW_SF = 'handover_new_sf'
+HANDOVER_LOST_SF = 'handover_lost_sf'
+BURST_SPLITS = 'burst_splits'
+CONN_DATA_PACKS = 'conn_data_packs'
+
+# Minimum number of RTT samples of a subflow to be considered by RTT_DIFF_SFS
+RTT_DIFF_MIN_SAMPLES = 3
+# Minimum duration (in seconds) of a MPTCP connection to be considered by BURST_SPLITS
+BURSTS_MIN_DURATION = 0.001
+
+# (name, stat file path) -> value of the derived metric, for the metrics already obtained by this process
+metric_values = {}
+
+
+def compute_conn_bytes_data(connections):
+    """ For each MPTCP connection, the data bytes (including retransmissions) sent on all its subflows, by direction """
+    conn_bytes_data = {}
+    for conn_id, conn in connections.iteritems():
+        if isinstance(conn, mptcp.MPTCPConnection):
+            conn_bytes_data[conn_id] = {}
+            for direction in co.DIRECTIONS:
+                conn_bytes_data[conn_id][direction] = 0
+                for flow_id, flow in conn.flows.iteritems():
+                    conn_bytes_data[conn_id][direction] += flow.attr[direction].get(co.BYTES_DATA, 0)
+
+    return conn_bytes_data
+
+
+def compute_conn_data_packs(connections):
+    """ For each MPTCP connection, the number of packets of its bursts, in both directions """
+    conn_data_packs = {}
+    for conn_id, conn in connections.iteritems():
+        if isinstance(conn, mptcp.MPTCPConnection):
+            conn_data_packs[conn_id] = 0
+            for direction in co.DIRECTIONS:
+                for flow_id, seq_burst, pkt_burst, seq_duration, time in conn.attr[direction].get(co.BURSTS, []):
+                    conn_data_packs[conn_id] += pkt_burst
+
+    return conn_data_packs
+
+
+def compute_rtt_diff_sfs(connections):
+    """ For each MPTCP connection with at least 2 subflows having RTT_DIFF_MIN_SAMPLES RTT samples (from the server),
+        the difference between the highest and the lowest average RTT of those subflows
+    """
+    rtt_diff = {}
+    for conn_id, conn in connections.iteritems():
+        if isinstance(conn, mptcp.MPTCPConnection):
+            rtts = [flow.attr[co.S2C][co.RTT_AVG] for flow_id, flow in conn.flows.iteritems()
+                    if flow.attr[co.S2C].get(co.RTT_SAMPLES, 0) >= RTT_DIFF_MIN_SAMPLES]
+            if len(rtts) >= 2:
+                rtt_diff[conn_id] = max(rtts) - min(rtts)
+
+    return rtt_diff
+
+
+def get_initial_sf_ts(conn):
+    """ Return the start (in seconds) of the first subflow initiated by the smartphone of conn, inf if there is none """
+    initial_sf_ts = float('inf')
+    for flow_id, flow in conn.flows.iteritems():
+        if co.START in flow.attr and flow.attr[co.SADDR] not in co.IP_PROXY:
+            initial_sf_ts = min(initial_sf_ts, flow.attr[co.START].total_seconds())
+
+    return initial_sf_ts
+
+
+def get_initial_flow_id(conn):
+    """ Return the id of the subflow of conn that started first, None if it is unknown """
+    time_initial_sf = float('inf')
+    flow_id_initial_sf = None
+    for flow_id, flow in conn.flows.iteritems():
+        if co.START in flow.attr and flow.attr[co.START].total_seconds() < time_initial_sf:
+            time_initial_sf = flow.attr[co.START].total_seconds()
+            flow_id_initial_sf = flow_id
+
+    return flow_id_initial_sf if isinstance(flow_id_initial_sf, int) else None
+
+
+def iter_handover_candidates(connections):
+    """ Yield the (conn_id, conn, start of the initial subflow) of the MPTCP connections of connections sending data on at
+        least 2 subflows, with a known subflow initiated by the smartphone
+    """
+    for conn_id, conn in connections.iteritems():
+        if not isinstance(conn, mptcp.MPTCPConnection):
+            continue
+        nb_flows = 0
+        for flow_id, flow in conn.flows.iteritems():
+            if flow.attr[co.C2S].get(co.BYTES, 0) > 0 or flow.attr[co.S2C].get(co.BYTES, 0) > 0:
+                nb_flows += 1
+
+        initial_sf_ts = get_initial_sf_ts(conn)
+        if nb_flows >= 2 and not initial_sf_ts == float('inf'):
+            yield conn_id, conn, initial_sf_ts
+
+
+def get_last_payload(flow):
+    """ Return the time (in seconds) of the last payload sent on flow, -inf if it did not carry any """
+    if flow.attr[co.C2S].get(co.BYTES, 0) > 0 or flow.attr[co.S2C].get(co.BYTES, 0) > 0:
+        return max([flow.attr[direction][co.TIME_LAST_PAYLD_TCP].total_seconds() for direction in co.DIRECTIONS])
+    return 0 - float('inf')
+
+
+def compute_handover_new_sf(connections):
+    """ For each MPTCP connection with a handover, the id of its initial subflow (None if unknown)
+        There is a handover if a subflow, established after the initial one, sent data after the first last ACK of the
+        subflows carrying data
+    """
+    handovers = {}
+    for conn_id, conn, initial_sf_ts in iter_handover_candidates(connections):
+        min_last_ack = float('inf')
+        for flow_id, flow in conn.flows.iteritems():
+            if co.START not in flow.attr or flow.attr[co.SADDR] in co.IP_PROXY:
+                continue
+            flow_bytes = flow.attr[co.C2S].get(co.BYTES_DATA, 0) + flow.attr[co.S2C].get(co.BYTES_DATA, 0)
+            if flow_bytes > 0 and co.TIME_LAST_ACK_TCP in flow.attr[co.S2C] and flow.attr[co.S2C][co.TIME_LAST_ACK_TCP].total_seconds() > 0.0:
+                min_last_ack = min(min_last_ack, flow.attr[co.S2C][co.TIME_LAST_ACK_TCP].total_seconds())
+
+        for flow_id, flow in conn.flows.iteritems():
+            if co.START not in flow.attr or flow.attr[co.SADDR] in co.IP_PROXY:
+                continue
+            if flow.attr[co.START].total_seconds() - initial_sf_ts > 0.0 and get_last_payload(flow) - min_last_ack > 0.0:
+                handovers[conn_id] = get_initial_flow_id(conn)
+                break
+
+    return handovers
+
+
+def compute_handover_lost_sf(connections):
+    """ For each MPTCP connection with a handover, the id of its initial subflow (None if unknown)
+        There is a handover if a subflow sent data after the first last ACK of the subflows carrying data that were not
+        closed (the lost ones), and was still acknowledged after it
+    """
+    handovers = {}
+    for conn_id, conn, initial_sf_ts in iter_handover_candidates(connections):
+        min_last_ack = float('inf')
+        for flow_id, flow in conn.flows.iteritems():
+            if co.START not in flow.attr or flow.attr[co.SADDR] in co.IP_PROXY:
+                continue
+            flow_bytes = flow.attr[co.C2S].get(co.BYTES_DATA, 0) + flow.attr[co.S2C].get(co.BYTES_DATA, 0)
+            if (flow_bytes > 0 and co.TIME_LAST_ACK_TCP in flow.attr[co.S2C] and co.TIME_FIN_ACK_TCP in flow.attr[co.S2C]
+                    and flow.attr[co.S2C][co.TIME_LAST_ACK_TCP].total_seconds() > 0.0 and flow.attr[co.S2C][co.TIME_FIN_ACK_TCP].total_seconds() == 0.0):
+                min_last_ack = min(min_last_ack, flow.attr[co.S2C][co.TIME_LAST_ACK_TCP].total_seconds())
+
+        for flow_id, flow in conn.flows.iteritems():
+            if co.START not in flow.attr or flow.attr[co.SADDR] in co.IP_PROXY:
+                continue
+            if (co.TIME_LAST_ACK_TCP in flow.attr[co.S2C] and flow.attr[co.S2C][co.TIME_LAST_ACK_TCP].total_seconds() > min_last_ack
+                    and get_last_payload(flow) - min_last_ack > 0.0):
+                handovers[conn_id] = get_initial_flow_id(conn)
+                break
+
+    return handovers
+
+
+def compute_burst_splits(connections):
+    """ For each MPTCP connection with at least 2 subflows lasting at least BURSTS_MIN_DURATION, a tuple with its duration
+        and, by direction, a tuple with its bytes (including retransmissions) and the list of (flow_id, fraction of the
+        duration before, fraction of bytes, packets) of its bursts on its subflows
+    """
+    burst_splits = {}
+    for conn_id, conn in connections.iteritems():
+        # Restrict to only 2SFs, but we can also see with more than 2
+        if not isinstance(conn, mptcp.MPTCPConnection) or co.START not in conn.attr or len(conn.flows) < 2:
+            continue
+        # Rely here on MPTCP duration, maybe should be duration at TCP level?
+        # Also rely on the start time of MPTCP; again, should it be the TCP one?
+        conn_start_time = conn.attr[co.START].total_seconds()
+        conn_start_time_int = long(conn_start_time)
+        conn_start_time_dec = float('0.' + str(conn_start_time - conn_start_time_int).split('.')[1])
+        conn_duration = float(conn.attr[co.DURATION])
+        if conn_duration < BURSTS_MIN_DURATION:
+            continue
+
+        burst_splits[conn_id] = (conn_duration, {})
+        for direction in co.DIRECTIONS:
+            # First count all bytes sent (including retransmissions)
+            tcp_conn_bytes = 0
+            for flow_id, flow in conn.flows.iteritems():
+                tcp_conn_bytes += flow.attr[direction].get(co.BYTES_DATA, 0)
+            # To cope with unseen TCP connections
+            conn_bytes = max(conn.attr[direction][co.BYTES_MPTCPTRACE], tcp_conn_bytes)
+            bursts = []
+            for flow_id, bytes, pkts, burst_duration, burst_start_time in conn.attr[direction][co.BURSTS]:
+                frac_bytes = (bytes + 0.0) / conn_bytes
+                if frac_bytes > 1.1 or frac_bytes < 0:
+                    print(frac_bytes, bytes, pkts, conn_bytes, direction, conn_id, flow_id)
+                    continue
+                burst_start_time_int = long(burst_start_time)
+                burst_start_time_dec = float('0.' + str(burst_start_time - burst_start_time_int).split('.')[1])
+                relative_time_int = burst_start_time_int - conn_start_time_int
+                relative_time_dec = burst_start_time_dec - conn_start_time_dec
+                relative_time = relative_time_int + relative_time_dec
+                frac_duration = relative_time / conn_duration
+                if frac_duration >= 0.0 and frac_duration <= 2.0:
+                    bursts.append((flow_id, frac_duration, frac_bytes, pkts))
+
+            burst_splits[conn_id][1][direction] = (conn_bytes, bursts)
+
+    return burst_splits
+
+# Name -> (version, function computing the metric from the connections of a stat file)
+# Increase the version when the function changes, to invalidate the values already cached
+DERIVED_METRICS = {
+    CONN_BYTES_DATA: (1, compute_conn_bytes_data),
+    RTT_DIFF_SFS: (1, compute_rtt_diff_sfs),
+    HANDOVER_NEW_SF: (1, compute_handover_new_sf),
+    HANDOVER_LOST_SF: (1, compute_handover_lost_sf),
+    BURST_SPLITS: (1, compute_burst_splits),
+    CONN_DATA_PACKS: (1, compute_conn_data_packs),
+}
+
+
+def get_metric_key(stat_filepath, name):
+    """ Return the key of the value of the metric name for stat_filepath, with its current content and configuration """
+    return (os.path.getmtime(stat_filepath), DERIVED_METRICS[name][0], co.IP_PROXY, co.PREFIX_IP_PROXY)
+
+
+def load_metric(stat_filepath, name):
+    """ Return the value of the metric name cached for stat_filepath, None if it is not cached or outdated """
+    try:
+        metric_file = open(os.path.join(stat_filepath + co.METRICS_EXT, name), 'rb')
+        key, value = cPickle.load(metric_file)
+        metric_file.close()
+        if key == get_metric_key(stat_filepath, name):
+            return value
+    except (IOError, OSError, EOFError, ValueError, cPickle.UnpicklingError):
+        pass
+    return None
+
+
+def save_metric(stat_filepath, name, value):
+    """ Cache the value of the metric name for stat_filepath
+        The file is replaced atomically, as several plotting processes can save the same metric
+    """
+    metrics_dir = stat_filepath + co.METRICS_EXT
+    metric_filepath = os.path.join(metrics_dir, name)
+    tmp_filepath = metric_filepath + '.' + str(os.getpid())
+    try:
+        if not os.path.isdir(metrics_dir):
+            os.makedirs(metrics_dir)
+        metric_file = open(tmp_filepath, 'wb')
+        cPickle.dump((get_metric_key(stat_filepath, name), value), metric_file, cPickle.HIGHEST_PROTOCOL)
+        metric_file.close()
+        os.rename(tmp_filepath, metric_filepath)
+    except (IOError, OSError) as e:
+        print(str(e) + ': metric ' + name + ' not cached for ' + stat_filepath, file=sys.stderr)
+
+
+def get_metric(name, connections):
+    """ Return a dictionary with, for each stat file of connections, the value of the derived metric name
+        For the connections of a stat file as loaded by fetch_valid_data (a ValidConnections), values are cached next to
+        the stat file and only computed again if the stat file, the version of the metric or the configuration changed
+    """
+    compute = DERIVED_METRICS[name][1]
+    values = {}
+    for fname, conns in connections.iteritems():
+        if not isinstance(conns, ValidConnections):
+            values[fname] = compute(conns)
+            continue
+
+        stat_filepath = conns.stat_filepath
+        if (name, stat_filepath) not in metric_values:
+            value = load_metric(stat_filepath, name)
+            if value is None:
+                value = compute(conns)
+                save_metric(stat_filepath, name, value)
+            metric_values[(name, stat_filepath)] = value
+        values[fname] = metric_values[(name, stat_filepath)]
+
+    return values
+
+
+def fetch_metric(dir_exp, args, name):
+    """ Return a dictionary with, for each stat file of dir_exp in the directories selected by args.dirs, the value of the
+        derived metric name
+        Only the stat files without an up-to-date cached value are loaded (in parallel) to compute it
+    """
+    co.check_directory_exists(dir_exp)
+    values = {}
+    stat_filepaths = {}
+    for fname, stat_filepath in co.list_stat_files(dir_exp, args.dirs):
+        values[fname] = load_metric(stat_filepath, name)
+        if values[fname] is None:
+            stat_filepaths[fname] = stat_filepath
+
+    def compute_and_save(fname, connections):
+        value = DERIVED_METRICS[name][1](ensures_smartphone_to_proxy(fname, connections))
+        save_metric(stat_filepaths[fname], name, value)
+        return value
+
+    values.update(co.iter_stat_files(stat_filepaths.items(), process_data=compute_and_save))
+    return dict([(fname, value) for fname, value in values.iteritems() if value is not None])
@@ -33,8 +33,8 @@ import numpy as np
 import os
 import sys
 
-# Add root directory in Python path and be at the root
-ROOT_DIR = os.path.abspath(os.path.join(".", os.pardir))
+# Add root directory in Python path and be at the root (nothing changes when imported by launch_graphs)
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 os.chdir(ROOT_DIR)
 sys.path.append(ROOT_DIR)
 
@@ -43,33 +43,6 @@ import common_graph as cog
 import mptcp
 import tcp
 
-
-##################################################
-##                  ARGUMENTS                   ##
-##################################################
-
-parser = argparse.ArgumentParser(
-    description="Summarize stat files generated by analyze")
-parser.add_argument("-s",
-                    "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
-parser.add_argument('-S',
-                    "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
-parser.add_argument("-d",
-                    "--dirs", help="list of directories to aggregate", nargs="+")
-
-args = parser.parse_args()
-stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
-sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
-co.check_directory_exists(sums_dir_exp)
-print('-s dir is', args.stat, 'and -S dir is', args.sums)
-
-##################################################
-##                 GET THE DATA                 ##
-##################################################
-
-connections = cog.fetch_valid_data(stat_dir_exp, args)
-multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
-
 ##################################################
 ##               PLOTTING RESULTS               ##
 ##################################################
@@ -201,20 +174,9 @@ def plot(connections, multiflow_connections, sums_dir_exp):
     color = 'red'
     graph_fname = os.path.splitext(base_graph_path)[0] + "_cdf.pdf"
     graph_fname_log = os.path.splitext(base_graph_path)[0] + "_cdf_log.pdf"
-    sample = np.array(sorted(syn_additional_sfs))
-    sorted_array = np.sort(sample)
-    yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
-    sample_2 = np.array(sorted(syn_first_additional_sf))
-    sorted_array_2 = np.sort(sample_2)
-    yvals_2 = np.arange(len(sorted_array_2)) / float(len(sorted_array_2))
+    sorted_array, yvals = co.get_cdf(syn_additional_sfs)
+    sorted_array_2, yvals_2 = co.get_cdf(syn_first_additional_sf)
     if len(sorted_array) > 0:
-        # Add a last point
-        sorted_array = np.append(sorted_array, sorted_array[-1])
-        yvals = np.append(yvals, 1.0)
-
-        sorted_array_2 = np.append(sorted_array_2, sorted_array_2[-1])
-        yvals_2 = np.append(yvals_2, 1.0)
-
         # Log plot
         plt.figure()
         plt.clf()
@@ -323,5 +285,31 @@ def plot(connections, multiflow_connections, sums_dir_exp):
     print(">= 60s second", more_60s_second, more_60s_second * 100.0 / len(syn_first_additional_sf), "%")
     print(">= 3600s second", more_3600s_second, more_3600s_second * 100.0 / len(syn_first_additional_sf), "%")
 
+##################################################
+##                     MAIN                     ##
+##################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize stat files generated by analyze")
+    parser.add_argument("-s",
+                        "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument('-S',
+                        "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument("-d",
+                        "--dirs", help="list of directories to aggregate", nargs="+")
+
+    args = parser.parse_args()
+    stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
+    sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
+    co.check_directory_exists(sums_dir_exp)
+    print('-s dir is', args.stat, 'and -S dir is', args.sums)
+
+    connections = cog.fetch_valid_data(stat_dir_exp, args)
+    multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
+    plot(connections, multiflow_connections, sums_dir_exp)
+
 
-plot(connections, multiflow_connections, sums_dir_exp)
+if __name__ == '__main__':
+    main()
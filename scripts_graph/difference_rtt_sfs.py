@@ -33,8 +33,8 @@ import numpy as np
 import os
 import sys
 
-# Add root directory in Python path and be at the root
-ROOT_DIR = os.path.abspath(os.path.join(".", os.pardir))
+# Add root directory in Python path and be at the root (nothing changes when imported by launch_graphs)
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 os.chdir(ROOT_DIR)
 sys.path.append(ROOT_DIR)
 
@@ -43,79 +43,38 @@ import common_graph as cog
 import mptcp
 import tcp
 
-##################################################
-##                  ARGUMENTS                   ##
-##################################################
-
-parser = argparse.ArgumentParser(
-    description="Summarize stat files generated by analyze")
-parser.add_argument("-s",
-                    "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
-parser.add_argument('-S',
-                    "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
-parser.add_argument("-d",
-                    "--dirs", help="list of directories to aggregate", nargs="+")
-
-args = parser.parse_args()
-stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
-sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
-co.check_directory_exists(sums_dir_exp)
-print('-s dir is', args.stat, 'and -S dir is', args.sums)
-
-##################################################
-##                 GET THE DATA                 ##
-##################################################
-
-connections = cog.fetch_valid_data(stat_dir_exp, args)
-multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
-
 ##################################################
 ##               PLOTTING RESULTS               ##
 ##################################################
 
+# Derived metrics used by plot, computed (or checked in their cache) once by launch_graphs for all its graphs
+PLOT_METRICS = [cog.RTT_DIFF_SFS]
+
 
 def plot(connections, multiflow_connections, sums_dir_exp):
     # Compute here traffic from server to smartphone; the reverse may be done
     log_file = sys.stdout
     min_bytes = 1000000
-    min_samples = 3
     # Computed only on MPTCP connections with at least 2 subflows and at least 3 samples on each considered SF
     diff_rtt = []
     color = 'red'
     graph_fname = "rtt_avg_diff_2sf.pdf"
     graph_full_path = os.path.join(sums_dir_exp, graph_fname)
+    rtt_diff_sfs = cog.get_metric(cog.RTT_DIFF_SFS, connections)
     for fname, data in multiflow_connections.iteritems():
-        for conn_id, conn in data.iteritems():
-            if isinstance(conn, mptcp.MPTCPConnection):
-                count_usable = 0
-                for flow_id, flow in conn.flows.iteritems():
-                    if flow.attr[co.S2C].get(co.RTT_SAMPLES, 0) >= min_samples:
-                        count_usable += 1
-
-                if count_usable < 2:
-                    continue
-
-                rtt_best_sf = float('inf')
-                rtt_worst_sf = -1.0
-                for flow_id, flow in conn.flows.iteritems():
-                    if flow.attr[co.S2C].get(co.RTT_SAMPLES, 0) >= min_samples:
-                        rtt_best_sf = min(rtt_best_sf, flow.attr[co.S2C][co.RTT_AVG])
-                        rtt_worst_sf = max(rtt_worst_sf, flow.attr[co.S2C][co.RTT_AVG])
-                if rtt_worst_sf - rtt_best_sf <= 1.0:
-                    print(conn_id, rtt_worst_sf - rtt_best_sf)
-                diff_rtt.append(rtt_worst_sf - rtt_best_sf)
-
-    sample = np.array(sorted(diff_rtt))
-    sorted_array = np.sort(sample)
-    print("LESS THAN 10ms", len([x for x in sorted_array if x <= 10.0]) * 100.0 / len(sorted_array))
-    print("LESS THAN 100ms", len([x for x in sorted_array if x <= 100.0]) * 100.0 / len(sorted_array))
-    print("MORE THAN 1s", len([x for x in sorted_array if x >= 1000.0]) * 100.0 / len(sorted_array))
-    yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
+        for conn_id, rtt_diff in rtt_diff_sfs[fname].iteritems():
+            if conn_id not in data:
+                continue
+
+            if rtt_diff <= 1.0:
+                print(conn_id, rtt_diff)
+            diff_rtt.append(rtt_diff)
+
+    print("LESS THAN 10ms", len([x for x in diff_rtt if x <= 10.0]) * 100.0 / len(diff_rtt))
+    print("LESS THAN 100ms", len([x for x in diff_rtt if x <= 100.0]) * 100.0 / len(diff_rtt))
+    print("MORE THAN 1s", len([x for x in diff_rtt if x >= 1000.0]) * 100.0 / len(diff_rtt))
+    sorted_array, yvals = co.get_cdf(diff_rtt)
     if len(sorted_array) > 0:
-        # Add a last point
-        sorted_array = np.append(sorted_array, sorted_array[-1])
-        yvals = np.append(yvals, 1.0)
-
         # Log plot
         plt.figure()
         plt.clf()
@@ -139,4 +98,32 @@ def plot(connections, multiflow_connections, sums_dir_exp):
         plt.close('all')
 
 # co.plot_cdfs_natural(results, ['red', 'blue', 'green', 'black'], 'Initial SF AVG RTT - Second SF AVG RTT', os.path.splitext(graph_full_path)[0] + '.pdf')
-plot(connections, multiflow_connections, sums_dir_exp)
+
+##################################################
+##                     MAIN                     ##
+##################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize stat files generated by analyze")
+    parser.add_argument("-s",
+                        "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument('-S',
+                        "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument("-d",
+                        "--dirs", help="list of directories to aggregate", nargs="+")
+
+    args = parser.parse_args()
+    stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
+    sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
+    co.check_directory_exists(sums_dir_exp)
+    print('-s dir is', args.stat, 'and -S dir is', args.sums)
+
+    connections = cog.fetch_valid_data(stat_dir_exp, args)
+    multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
+    plot(connections, multiflow_connections, sums_dir_exp)
+
+
+if __name__ == '__main__':
+    main()
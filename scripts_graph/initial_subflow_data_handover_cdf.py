@@ -79,73 +79,13 @@ nb_bytes = {co.C2S: 0, co.S2C: 0}
 count_handover = 0
 
 results = {co.C2S: {INITIAL_SF: [], INITIAL_SFS: []}, co.S2C: {INITIAL_SF: [], INITIAL_SFS: []}}
+handovers = cog.get_metric(cog.HANDOVER_NEW_SF, connections)
 for fname, conns in multiflow_connections.iteritems():
     for conn_id, conn in conns.iteritems():
-        # Restrict to connections using at least 2 SFs
-        take = False
-
-        nb_flows = 0
-        for flow_id, flow in conn.flows.iteritems():
-            if flow.attr[co.C2S].get(co.BYTES, 0) > 0 or flow.attr[co.S2C].get(co.BYTES, 0) > 0:
-                nb_flows += 1
-
-        if nb_flows >= 2:
-            take = True
-
-        if take:
-            # Detect now if there is handover
-            initial_sf_ts = float('inf')
-            last_acks = []
-            min_time_last_ack = float('inf')
-            for flow_id, flow in conn.flows.iteritems():
-                if co.START not in flow.attr or flow.attr[co.SADDR] in co.IP_PROXY:
-                    continue
-                if flow.attr[co.START].total_seconds() < initial_sf_ts:
-                    initial_sf_ts = flow.attr[co.START].total_seconds()
-                flow_bytes = 0
-                for direction in co.DIRECTIONS:
-                    flow_bytes += flow.attr[direction].get(co.BYTES_DATA, 0)
-                if flow_bytes > 0 and co.TIME_LAST_ACK_TCP in flow.attr[co.S2C] and flow.attr[co.S2C][co.TIME_LAST_ACK_TCP].total_seconds() > 0.0:
-                    last_acks.append(flow.attr[co.S2C][co.TIME_LAST_ACK_TCP].total_seconds())
-                    min_time_last_ack = min(min_time_last_ack, flow.attr[co.S2C][co.TIME_LAST_ACK_TCP].total_seconds())
-
-            if initial_sf_ts == float('inf'):
-                continue
-
-            # Now store the delta and record connections with handover
-            handover_detected = False
-            min_delta = float('inf')
-            for flow_id, flow in conn.flows.iteritems():
-                if handover_detected or co.START not in flow.attr or flow.attr[co.SADDR] in co.IP_PROXY:
-                    continue
-                delta = flow.attr[co.START].total_seconds() - initial_sf_ts
-                min_last_acks = float('inf')
-                if len(last_acks) >= 1:
-                    min_last_acks = min(last_acks)
-
-                max_last_payload = 0 - float('inf')
-                if flow.attr[co.C2S].get(co.BYTES, 0) > 0 or flow.attr[co.S2C].get(co.BYTES, 0) > 0:
-                    max_last_payload = max([flow.attr[direction][co.TIME_LAST_PAYLD_TCP].total_seconds() for direction in co.DIRECTIONS])
-
-                # handover_delta = float(flow.attr[co.START]) + max_last_payload - min_last_acks
-                handover_delta = max_last_payload - min_last_acks
-                if delta > 0.0 and handover_delta > 0.0:
-                    # A subflow is established after the last ack of the client seen --> Handover
-                    count_handover += 1
-                    handover_detected = True
-
-            if handover_detected:
-                conn_bytes_tcp = 0
-                time_initial_sf = float('inf')
-                flow_id_initial_sf = None
-                for flow_id, flow in conn.flows.iteritems():
-                    if co.START in flow.attr and flow.attr[co.START].total_seconds() < time_initial_sf:
-                        time_initial_sf = flow.attr[co.START].total_seconds()
-                        flow_id_initial_sf = flow_id
-
-                if not isinstance(flow_id_initial_sf, int):
-                    continue
-
+        if conn_id in handovers[fname]:
+            count_handover += 1
+            flow_id_initial_sf = handovers[fname][conn_id]
+            if flow_id_initial_sf is not None:
                 # time_second_sf = float('inf')
                 # flow_id_second_sf = None
                 # for flow_id, flow in conn.flows.iteritems():
@@ -186,13 +126,8 @@ for direction in co.DIRECTIONS:
     graph_full_path = os.path.join(sums_dir_exp, graph_fname)
 
     for label in [INITIAL_SF]:
-        sample = np.array(sorted(results[direction][label]))
-        sorted_array = np.sort(sample)
-        yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
+        sorted_array, yvals = co.get_cdf(results[direction][label])
         if len(sorted_array) > 0:
-            # Add a last point
-            sorted_array = np.append(sorted_array, sorted_array[-1])
-            yvals = np.append(yvals, 1.0)
             ax.plot(sorted_array, yvals, color=color[label], linestyle=ls[label], linewidth=2, label=label)
 
             # Shrink current axis's height by 10% on the top
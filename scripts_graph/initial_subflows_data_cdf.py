@@ -133,13 +133,8 @@ for direction in co.DIRECTIONS:
     graph_full_path = os.path.join(sums_dir_exp, graph_fname)
 
     for label in [INITIAL_SF, INITIAL_SFS]:
-        sample = np.array(sorted(results[direction][label]))
-        sorted_array = np.sort(sample)
-        yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
+        sorted_array, yvals = co.get_cdf(results[direction][label])
         if len(sorted_array) > 0:
-            # Add a last point
-            sorted_array = np.append(sorted_array, sorted_array[-1])
-            yvals = np.append(yvals, 1.0)
             ax.plot(sorted_array, yvals, color=color[label], linestyle=ls[label], linewidth=2, label=label)
 
             # Shrink current axis's height by 10% on the top
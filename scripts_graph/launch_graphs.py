@@ -29,9 +29,15 @@ matplotlib.use('Agg')
 matplotlib.rcParams['pdf.fonttype'] = 42
 matplotlib.rcParams['ps.fonttype'] = 42
 import matplotlib.pyplot as plt
+import importlib
 import numpy as np
 import os
 import sys
+import time
+import traceback
+
+from multiprocessing import cpu_count
+from multiprocessing import Process
 
 # Add root directory in Python path and be at the root
 ROOT_DIR = os.path.abspath(os.path.join(".", os.pardir))
@@ -43,6 +49,19 @@ import common_graph as cog
 import mptcp
 import tcp
 
+##################################################
+##                    GRAPHS                    ##
+##################################################
+
+# Modules of graphs, each of them has a function plot(connections, multiflow_connections, sums_dir_exp), and a list
+# PLOT_METRICS of the derived metrics it uses if any
+GRAPH_MODULES = ['cdf_duration_bytes', 'difference_rtt_sfs', 'delay_mpcapable_mpjoin', 'overhead_retrans_reinj',
+                 'subflow_switching_freq', 'bursts_conn_duration', 'bursts_duration_bytes', 'bursts_duration_bytes_cdf',
+                 'bursts_duration_bytes_wcdf', 'bursts_duration_wcdf', 'bursts_size_cdf', 'time_retrans_reinj',
+                 'retrans_dss', 'global_stats']
+# Time (in seconds) between two checks of the plotting processes
+PLOT_POLL_DELAY = 0.1
+
 ##################################################
 ##                  ARGUMENTS                   ##
 ##################################################
@@ -55,6 +74,10 @@ parser.add_argument('-S',
                     "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
 parser.add_argument("-d",
                     "--dirs", help="list of directories to aggregate", nargs="+")
+parser.add_argument("-g",
+                    "--graphs", help="list of graphs to plot (all by default)", nargs="+", choices=GRAPH_MODULES, default=GRAPH_MODULES)
+parser.add_argument("-j",
+                    "--jobs", help="number of graphs plotted at the same time (one per CPU by default)", type=int, default=cpu_count())
 
 args = parser.parse_args()
 stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
@@ -65,20 +88,51 @@ co.check_directory_exists(sums_dir_exp)
 ##                 GET THE DATA                 ##
 ##################################################
 
+# Import all modules before plotting, not once per process
+graph_modules = [(name, importlib.import_module(name)) for name in args.graphs]
+
 connections = cog.fetch_valid_data(stat_dir_exp, args)
 multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
+# Compute the derived metrics used by the graphs (or check their cache) once, instead of in each plotting process
+for metric in set([metric for name, module in graph_modules for metric in getattr(module, 'PLOT_METRICS', [])]):
+    cog.get_metric(metric, connections)
 
 ##################################################
 ##               PLOTTING RESULTS               ##
 ##################################################
 
-import cdf_duration_bytes
-cdf_duration_bytes.plot(connections, multiflow_connections, sums_dir_exp)
-import difference_rtt_sfs
-difference_rtt_sfs.plot(connections, multiflow_connections, sums_dir_exp)
-import delay_mpcapable_mpjoin
-delay_mpcapable_mpjoin.plot(connections, multiflow_connections, sums_dir_exp)
-import overhead_retrans_reinj
-overhead_retrans_reinj.plot(connections, multiflow_connections, sums_dir_exp)
-import subflow_switching_freq
-subflow_switching_freq.plot(connections, multiflow_connections, sums_dir_exp)
+
+def plot_graph(module):
+    """ Body of a process plotting the graphs of module
+        The connections loaded once here are shared (copy-on-write) by all plotting processes
+    """
+    try:
+        module.plot(connections, multiflow_connections, sums_dir_exp)
+    except:
+        print(traceback.format_exc(), file=sys.stderr)
+        sys.exit(1)
+
+
+def wait_plots(running, max_running):
+    """ Wait until at most max_running processes of running (list of (name, process)) are still plotting """
+    while True:
+        for name, process in running[:]:
+            if not process.is_alive():
+                process.join()
+                running.remove((name, process))
+                if process.exitcode != 0:
+                    print("Error when plotting " + name, file=sys.stderr)
+        if len(running) <= max_running:
+            return
+        time.sleep(PLOT_POLL_DELAY)
+
+
+running = []
+for name, module in graph_modules:
+    wait_plots(running, max(args.jobs, 1) - 1)
+    print("Plotting " + name)
+    process = Process(target=plot_graph, args=(module,))
+    process.start()
+    running.append((name, process))
+
+wait_plots(running, 0)
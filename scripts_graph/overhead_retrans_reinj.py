@@ -33,8 +33,8 @@ import numpy as np
 import os
 import sys
 
-# Add root directory in Python path and be at the root
-ROOT_DIR = os.path.abspath(os.path.join(".", os.pardir))
+# Add root directory in Python path and be at the root (nothing changes when imported by launch_graphs)
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 os.chdir(ROOT_DIR)
 sys.path.append(ROOT_DIR)
 
@@ -43,32 +43,6 @@ import common_graph as cog
 import mptcp
 import tcp
 
-##################################################
-##                  ARGUMENTS                   ##
-##################################################
-
-parser = argparse.ArgumentParser(
-    description="Summarize stat files generated by analyze")
-parser.add_argument("-s",
-                    "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
-parser.add_argument('-S',
-                    "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
-parser.add_argument("-d",
-                    "--dirs", help="list of directories to aggregate", nargs="+")
-
-args = parser.parse_args()
-stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
-sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
-co.check_directory_exists(sums_dir_exp)
-print('-s dir is', args.stat, 'and -S dir is', args.sums)
-
-##################################################
-##                 GET THE DATA                 ##
-##################################################
-
-connections = cog.fetch_valid_data(stat_dir_exp, args)
-multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
-
 ##################################################
 ##               PLOTTING RESULTS               ##
 ##################################################
@@ -150,13 +124,8 @@ def plot(connections, multiflow_connections, sums_dir_exp):
         min_y = 1.0
 
         for dataset in [RETRANS, REINJ]:
-            sample = np.array(sorted(results[direction][dataset]))
-            sorted_array = np.sort(sample)
-            yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
+            sorted_array, yvals = co.get_cdf(results[direction][dataset], max_points=None)
             if len(sorted_array) > 0:
-                # Add a last point
-                sorted_array = np.append(sorted_array, sorted_array[-1])
-                yvals = np.append(yvals, 1.0)
                 index = 0
                 for x_value in sorted_array:
                     if x_value > 0.0:
@@ -168,7 +137,7 @@ def plot(connections, multiflow_connections, sums_dir_exp):
                 print("1%", dataset, (len([x for x in sorted_array if x <= 0.01]) + 0.0) / len(sorted_array))
                 print("10%", dataset, (len([x for x in sorted_array if x <= 0.1]) + 0.0) / len(sorted_array))
                 # Log plot
-
+                sorted_array, yvals = co.downsample_cdf(sorted_array, yvals)
                 ax.plot(sorted_array, yvals, color=color[dataset], linewidth=2, linestyle=ls[dataset], label=dataset)
 
         ax.set_xscale('log')
@@ -188,4 +157,31 @@ def plot(connections, multiflow_connections, sums_dir_exp):
         print("TOTAL REINJ", total_reinj)
         print("TOTAL REINJ MPTCP", total_reinj_mptcp)
 
-plot(connections, multiflow_connections, sums_dir_exp)
+##################################################
+##                     MAIN                     ##
+##################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize stat files generated by analyze")
+    parser.add_argument("-s",
+                        "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument('-S',
+                        "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument("-d",
+                        "--dirs", help="list of directories to aggregate", nargs="+")
+
+    args = parser.parse_args()
+    stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
+    sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
+    co.check_directory_exists(sums_dir_exp)
+    print('-s dir is', args.stat, 'and -S dir is', args.sums)
+
+    connections = cog.fetch_valid_data(stat_dir_exp, args)
+    multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
+    plot(connections, multiflow_connections, sums_dir_exp)
+
+
+if __name__ == '__main__':
+    main()
@@ -33,8 +33,8 @@ import numpy as np
 import os
 import sys
 
-# Add root directory in Python path and be at the root
-ROOT_DIR = os.path.abspath(os.path.join(".", os.pardir))
+# Add root directory in Python path and be at the root (nothing changes when imported by launch_graphs)
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
 os.chdir(ROOT_DIR)
 sys.path.append(ROOT_DIR)
 
@@ -43,32 +43,6 @@ import common_graph as cog
 import mptcp
 import tcp
 
-##################################################
-##                  ARGUMENTS                   ##
-##################################################
-
-parser = argparse.ArgumentParser(
-    description="Summarize stat files generated by analyze")
-parser.add_argument("-s",
-                    "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
-parser.add_argument('-S',
-                    "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
-parser.add_argument("-d",
-                    "--dirs", help="list of directories to aggregate", nargs="+")
-
-args = parser.parse_args()
-stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
-sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
-co.check_directory_exists(sums_dir_exp)
-print('-s dir is', args.stat, 'and -S dir is', args.sums)
-
-##################################################
-##                 GET THE DATA                 ##
-##################################################
-
-connections = cog.fetch_valid_data(stat_dir_exp, args)
-multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
-
 ##################################################
 ##               PLOTTING RESULTS               ##
 ##################################################
@@ -94,7 +68,7 @@ def has_two_opened_sfs(ts_delta, ts_delta_first_sent, idle_time, connection, dir
     OK FOR CLIENT TO START SENDING
     """
     count = 0
-    for flow_id, flow in conn.flows.iteritems():
+    for flow_id, flow in connection.flows.iteritems():
         if direction == co.C2S:
             # TODO should have one more attribute here...
             if co.START in flow.attr and ((ts_delta_first_sent - flow.attr[co.START]).total_seconds() >= 0.0
@@ -110,141 +84,151 @@ def has_two_opened_sfs(ts_delta, ts_delta_first_sent, idle_time, connection, dir
     return count >= 2
 
 
-retransmissions_since_first = []
-retransmissions_since_last = []
-retransmissions_since_last_active = []
-count_retrans_dss = []
-for fname, conns in multiflow_connections.iteritems():
-    for conn_id, conn in conns.iteritems():
-        retrans_dss = {}
-        for ts_delta, flow_id, dss, idle_time, retrans_since_first, retrans_since_last, retrans_since_last_all in conn.attr[co.S2C][co.RETRANS_DSS]:
-            if conn.attr[co.S2C][co.RTT_SAMPLES] > 1 and has_two_opened_sfs(ts_delta, ts_delta - retrans_since_first, idle_time, conn, co.S2C):
-                retransmissions_since_first.append(retrans_since_first.total_seconds() * 1000.0 / conn.attr[co.S2C][co.RTT_AVG])
-                retransmissions_since_last.append(retrans_since_last.total_seconds() * 1000.0 / conn.attr[co.S2C][co.RTT_AVG])
-                retransmissions_since_last_active.append(retrans_since_last_all.total_seconds() * 1000.0 / conn.attr[co.S2C][co.RTT_AVG])
-                if dss not in retrans_dss:
-                    retrans_dss[dss] = 0
-                retrans_dss[dss] += 1
-
-        for dss in retrans_dss.keys():
-            if retrans_dss[dss] > 100000:
-                print(fname, conn_id, dss, retrans_dss[dss])
-            count_retrans_dss.append(retrans_dss[dss])
-
-sample = np.array(sorted(retransmissions_since_first))
-sorted_array = np.sort(sample)
-yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
-if len(sorted_array) > 0:
-    # Add a last point
-    sorted_array = np.append(sorted_array, sorted_array[-1])
-    yvals = np.append(yvals, 1.0)
-
-    # Log plot
-    plt.figure()
-    plt.clf()
-    fig, ax = plt.subplots()
-    ax.plot(sorted_array, yvals, color='red', linewidth=2, label="Retrans / RTT")
-
-    # Shrink current axis's height by 10% on the top
-    # box = ax.get_position()
-    # ax.set_position([box.x0, box.y0,
-    #                  box.width, box.height * 0.9])
-    ax.set_xscale('log')
-
-    # Put a legend above current axis
-    # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
-    ax.legend(loc='lower right')
-
-    plt.xlim(xmin=0.001)
-
-    plt.xlabel('Retrans DSS Time / Avg RTT', fontsize=24, labelpad=-1)
-    plt.ylabel("CDF", fontsize=24)
-    plt.savefig(os.path.join(sums_dir_exp, 'retrans_dss.pdf'))
-    plt.close('all')
-
-sample = np.array(sorted(retransmissions_since_last))
-sorted_array = np.sort(sample)
-yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
-if len(sorted_array) > 0:
-    # Add a last point
-    sorted_array = np.append(sorted_array, sorted_array[-1])
-    yvals = np.append(yvals, 1.0)
-
-    # Log plot
-    plt.figure()
-    plt.clf()
-    fig, ax = plt.subplots()
-    ax.plot(sorted_array, yvals, color='red', linewidth=2, label="Retrans / RTT")
-
-    # Shrink current axis's height by 10% on the top
-    # box = ax.get_position()
-    # ax.set_position([box.x0, box.y0,
-    #                  box.width, box.height * 0.9])
-    ax.set_xscale('log')
-
-    # Put a legend above current axis
-    # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
-    ax.legend(loc='lower right')
-
-    plt.xlabel('Retrans DSS Time / Avg RTT', fontsize=24, labelpad=-1)
-    plt.ylabel("CDF", fontsize=24)
-    plt.savefig(os.path.join(sums_dir_exp, 'retrans_dss_last.pdf'))
-    plt.close('all')
-
-sample = np.array(sorted(retransmissions_since_last_active))
-sorted_array = np.sort(sample)
-yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
-if len(sorted_array) > 0:
-    # Add a last point
-    sorted_array = np.append(sorted_array, sorted_array[-1])
-    yvals = np.append(yvals, 1.0)
-
-    # Log plot
-    plt.figure()
-    plt.clf()
-    fig, ax = plt.subplots()
-    ax.plot(sorted_array, yvals, color='red', linewidth=2, label="Retrans / RTT")
-
-    # Shrink current axis's height by 10% on the top
-    # box = ax.get_position()
-    # ax.set_position([box.x0, box.y0,
-    #                  box.width, box.height * 0.9])
-    ax.set_xscale('log')
-
-    # Put a legend above current axis
-    # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
-    ax.legend(loc='lower right')
-
-    plt.xlabel('Retrans DSS Time / Avg RTT', fontsize=24, labelpad=-1)
-    plt.ylabel("CDF", fontsize=24)
-    plt.savefig(os.path.join(sums_dir_exp, 'retrans_dss_all.pdf'))
-    plt.close('all')
-
-sample = np.array(sorted(count_retrans_dss))
-sorted_array = np.sort(sample)
-yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
-if len(sorted_array) > 0:
-    # Add a last point
-    sorted_array = np.append(sorted_array, sorted_array[-1])
-    yvals = np.append(yvals, 1.0)
-
-    # Log plot
-    plt.figure()
-    plt.clf()
-    fig, ax = plt.subplots()
-    ax.plot(sorted_array, yvals, color='red', linewidth=2, label="# of retrans per DSS")
-
-    # Shrink current axis's height by 10% on the top
-    # box = ax.get_position()
-    # ax.set_position([box.x0, box.y0,
-    #                  box.width, box.height * 0.9])
-    ax.set_xscale('log')
-
-    # Put a legend above current axis
-    # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
-    ax.legend(loc='lower right')
-
-    plt.xlabel('# of retransmissions per DSS', fontsize=24, labelpad=-1)
-    plt.ylabel("CDF", fontsize=24)
-    plt.savefig(os.path.join(sums_dir_exp, 'count_retrans_dss.pdf'))
-    plt.close('all')
+def plot(connections, multiflow_connections, sums_dir_exp):
+    retransmissions_since_first = []
+    retransmissions_since_last = []
+    retransmissions_since_last_active = []
+    count_retrans_dss = []
+    for fname, conns in multiflow_connections.iteritems():
+        for conn_id, conn in conns.iteritems():
+            retrans_dss = {}
+            for ts_delta, flow_id, dss, idle_time, retrans_since_first, retrans_since_last, retrans_since_last_all in conn.attr[co.S2C][co.RETRANS_DSS]:
+                if conn.attr[co.S2C][co.RTT_SAMPLES] > 1 and has_two_opened_sfs(ts_delta, ts_delta - retrans_since_first, idle_time, conn, co.S2C):
+                    retransmissions_since_first.append(retrans_since_first.total_seconds() * 1000.0 / conn.attr[co.S2C][co.RTT_AVG])
+                    retransmissions_since_last.append(retrans_since_last.total_seconds() * 1000.0 / conn.attr[co.S2C][co.RTT_AVG])
+                    retransmissions_since_last_active.append(retrans_since_last_all.total_seconds() * 1000.0 / conn.attr[co.S2C][co.RTT_AVG])
+                    if dss not in retrans_dss:
+                        retrans_dss[dss] = 0
+                    retrans_dss[dss] += 1
+
+            for dss in retrans_dss.keys():
+                if retrans_dss[dss] > 100000:
+                    print(fname, conn_id, dss, retrans_dss[dss])
+                count_retrans_dss.append(retrans_dss[dss])
+
+    sorted_array, yvals = co.get_cdf(retransmissions_since_first)
+    if len(sorted_array) > 0:
+
+        # Log plot
+        plt.figure()
+        plt.clf()
+        fig, ax = plt.subplots()
+        ax.plot(sorted_array, yvals, color='red', linewidth=2, label="Retrans / RTT")
+
+        # Shrink current axis's height by 10% on the top
+        # box = ax.get_position()
+        # ax.set_position([box.x0, box.y0,
+        #                  box.width, box.height * 0.9])
+        ax.set_xscale('log')
+
+        # Put a legend above current axis
+        # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
+        ax.legend(loc='lower right')
+
+        plt.xlim(xmin=0.001)
+
+        plt.xlabel('Retrans DSS Time / Avg RTT', fontsize=24, labelpad=-1)
+        plt.ylabel("CDF", fontsize=24)
+        plt.savefig(os.path.join(sums_dir_exp, 'retrans_dss.pdf'))
+        plt.close('all')
+
+    sorted_array, yvals = co.get_cdf(retransmissions_since_last)
+    if len(sorted_array) > 0:
+
+        # Log plot
+        plt.figure()
+        plt.clf()
+        fig, ax = plt.subplots()
+        ax.plot(sorted_array, yvals, color='red', linewidth=2, label="Retrans / RTT")
+
+        # Shrink current axis's height by 10% on the top
+        # box = ax.get_position()
+        # ax.set_position([box.x0, box.y0,
+        #                  box.width, box.height * 0.9])
+        ax.set_xscale('log')
+
+        # Put a legend above current axis
+        # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
+        ax.legend(loc='lower right')
+
+        plt.xlabel('Retrans DSS Time / Avg RTT', fontsize=24, labelpad=-1)
+        plt.ylabel("CDF", fontsize=24)
+        plt.savefig(os.path.join(sums_dir_exp, 'retrans_dss_last.pdf'))
+        plt.close('all')
+
+    sorted_array, yvals = co.get_cdf(retransmissions_since_last_active)
+    if len(sorted_array) > 0:
+
+        # Log plot
+        plt.figure()
+        plt.clf()
+        fig, ax = plt.subplots()
+        ax.plot(sorted_array, yvals, color='red', linewidth=2, label="Retrans / RTT")
+
+        # Shrink current axis's height by 10% on the top
+        # box = ax.get_position()
+        # ax.set_position([box.x0, box.y0,
+        #                  box.width, box.height * 0.9])
+        ax.set_xscale('log')
+
+        # Put a legend above current axis
+        # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
+        ax.legend(loc='lower right')
+
+        plt.xlabel('Retrans DSS Time / Avg RTT', fontsize=24, labelpad=-1)
+        plt.ylabel("CDF", fontsize=24)
+        plt.savefig(os.path.join(sums_dir_exp, 'retrans_dss_all.pdf'))
+        plt.close('all')
+
+    sorted_array, yvals = co.get_cdf(count_retrans_dss)
+    if len(sorted_array) > 0:
+
+        # Log plot
+        plt.figure()
+        plt.clf()
+        fig, ax = plt.subplots()
+        ax.plot(sorted_array, yvals, color='red', linewidth=2, label="# of retrans per DSS")
+
+        # Shrink current axis's height by 10% on the top
+        # box = ax.get_position()
+        # ax.set_position([box.x0, box.y0,
+        #                  box.width, box.height * 0.9])
+        ax.set_xscale('log')
+
+        # Put a legend above current axis
+        # ax.legend(loc='lower center', bbox_to_anchor=(0.5, 1.05), fancybox=True, shadow=True, ncol=ncol)
+        ax.legend(loc='lower right')
+
+        plt.xlabel('# of retransmissions per DSS', fontsize=24, labelpad=-1)
+        plt.ylabel("CDF", fontsize=24)
+        plt.savefig(os.path.join(sums_dir_exp, 'count_retrans_dss.pdf'))
+        plt.close('all')
+
+##################################################
+##                     MAIN                     ##
+##################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize stat files generated by analyze")
+    parser.add_argument("-s",
+                        "--stat", help="directory where the stat files are stored", default=co.DEF_STAT_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument('-S',
+                        "--sums", help="directory where the summary graphs will be stored", default=co.DEF_SUMS_DIR + '_' + co.DEF_IFACE)
+    parser.add_argument("-d",
+                        "--dirs", help="list of directories to aggregate", nargs="+")
+
+    args = parser.parse_args()
+    stat_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.stat))
+    sums_dir_exp = os.path.abspath(os.path.join(ROOT_DIR, args.sums))
+    co.check_directory_exists(sums_dir_exp)
+    print('-s dir is', args.stat, 'and -S dir is', args.sums)
+
+    connections = cog.fetch_valid_data(stat_dir_exp, args)
+    multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
+    plot(connections, multiflow_connections, sums_dir_exp)
+
+
+if __name__ == '__main__':
+    main()
@@ -81,6 +81,7 @@ LARGE = '>=1MB'
 results_bytes = {co.C2S: {TINY: [], SMALL: [], MEDIUM: [], LARGE: []}, co.S2C: {TINY: [], SMALL: [], MEDIUM: [], LARGE: []}}
 results_pkts = {co.C2S: {TINY: [], SMALL: [], MEDIUM: [], LARGE: []}, co.S2C: {TINY: [], SMALL: [], MEDIUM: [], LARGE: []}}
 min_duration = 0.001
+conn_bytes_data = cog.get_metric(cog.CONN_BYTES_DATA, connections)
 for fname, conns in multiflow_connections.iteritems():
     for conn_id, conn in conns.iteritems():
         # Restrict to only 2SFs, but we can also see with more than 2
@@ -98,9 +99,7 @@ for fname, conns in multiflow_connections.iteritems():
                 tot_packs = 0
                 to_add_pkts = []
                 # First count all bytes sent (including retransmissions)
-                tcp_conn_bytes = 0
-                for flow_id, flow in conn.flows.iteritems():
-                    tcp_conn_bytes += flow.attr[direction].get(co.BYTES_DATA, 0)
+                tcp_conn_bytes = conn_bytes_data[fname][conn_id][direction]
                 # To cope with unseen TCP connections
                 conn_bytes = max(conn.attr[direction][co.BYTES_MPTCPTRACE], tcp_conn_bytes)
                 if len(conn.attr[direction][co.BURSTS]) == 0:
@@ -134,16 +133,11 @@ for direction in co.DIRECTIONS:
     graph_full_path = os.path.join(sums_dir_exp, graph_fname)
 
     for label in [TINY, SMALL, MEDIUM, LARGE]:
-        sample = np.array(sorted(results_bytes[direction][label]))
-        sorted_array = np.sort(sample)
-        yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
-        more_than_100 = [x for x in sorted_array if x >= 100]
-        # print(direction, label, len(more_than_100), len(more_than_100) * 100.0 / len(sorted_array))
+        # more_than_100 = [x for x in results_bytes[direction][label] if x >= 100]
+        # print(direction, label, len(more_than_100), len(more_than_100) * 100.0 / len(results_bytes[direction][label]))
+        sorted_array, yvals = co.get_cdf(results_bytes[direction][label])
 
         if len(sorted_array) > 0:
-            # Add a last point
-            sorted_array = np.append(sorted_array, sorted_array[-1])
-            yvals = np.append(yvals, 1.0)
             ax.plot(sorted_array, yvals, color=color[label], linestyle=ls[label], linewidth=2, label=label)
 
     ax.set_xscale('log')
@@ -160,14 +154,8 @@ for direction in co.DIRECTIONS:
     graph_full_path = os.path.join(sums_dir_exp, graph_fname)
 
     for label in [TINY, SMALL, MEDIUM, LARGE]:
-        sample = np.array(sorted(results_pkts[direction][label]))
-        sorted_array = np.sort(sample)
-        yvals = np.arange(len(sorted_array)) / float(len(sorted_array))
-
+        sorted_array, yvals = co.get_cdf(results_pkts[direction][label])
         if len(sorted_array) > 0:
-            # Add a last point
-            sorted_array = np.append(sorted_array, sorted_array[-1])
-            yvals = np.append(yvals, 1.0)
             ax.plot(sorted_array, yvals, color=color[label], linestyle=ls[label], linewidth=2, label=label)
 
     ax.set_xscale('log')
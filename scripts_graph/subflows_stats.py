@@ -66,8 +66,9 @@ print('-s dir is', args.stat, 'and -S dir is', args.sums)
 ##                 GET THE DATA                 ##
 ##################################################
 
-connections = cog.fetch_valid_data(stat_dir_exp, args)
-# multiflow_connections, singleflow_connections = cog.get_multiflow_connections(connections)
+# The number of subflows of the connections only needs their rows in the columnar stores
+conn_columns = cog.fetch_valid_columns(stat_dir_exp, args, [co.CONN_ID])
+flow_columns = cog.fetch_valid_columns(stat_dir_exp, args, [co.CONN_ID], table=co.FLOW_TABLE)
 
 ##################################################
 ##               PLOTTING RESULTS               ##
@@ -76,10 +77,12 @@ connections = cog.fetch_valid_data(stat_dir_exp, args)
 nb_conns = 0
 sfs = {}
 
-for fname, conns in connections.iteritems():
-    for conn_id, conn in conns.iteritems():
+for fname, conns in conn_columns.iteritems():
+    flow_conn_ids, flow_counts = np.unique(flow_columns[fname][co.CONN_ID], return_counts=True)
+    nb_flows = dict(zip(flow_conn_ids.tolist(), flow_counts.tolist()))
+    for conn_id in conns[co.CONN_ID].tolist():
         nb_conns += 1
-        nb_sfs = len(conn.flows)
+        nb_sfs = nb_flows.get(conn_id, 0)
         if nb_sfs > 40:
             print(nb_sfs, fname, conn_id)
         if nb_sfs not in sfs:
@@ -38,7 +38,6 @@ import mptcp
 import numpy as np
 import os
 import os.path
-import pickle
 import sys
 import tcp
 
@@ -64,29 +63,10 @@ sums_dir_exp = os.path.abspath(os.path.expanduser(args.sums))
 csv_dir_exp = os.path.abspath(os.path.expanduser(args.csv))
 
 co.check_directory_exists(sums_dir_exp)
+co.check_directory_exists(stat_dir_exp)
 
-def check_in_list(dirpath, dirs):
-    """ Check if dirpath is one of the dir in dirs, True if dirs is empty """
-    if not dirs:
-        return True
-    return os.path.basename(dirpath) in dirs
-
-
-def fetch_data(dir_exp):
-    co.check_directory_exists(dir_exp)
-    dico = {}
-    for dirpath, dirnames, filenames in os.walk(dir_exp):
-        if check_in_list(dirpath, args.dirs):
-            for fname in filenames:
-                try:
-                    stat_file = open(os.path.join(dirpath, fname), 'r')
-                    dico[fname] = pickle.load(stat_file)
-                    stat_file.close()
-                except IOError as e:
-                    print(str(e) + ': skip stat file ' + fname, file=sys.stderr)
-    return dico
-
-connections = fetch_data(stat_dir_exp)
+# Stat files are loaded lazily, in parallel, while the previous ones are plotted
+connections = co.iter_stat_files(co.list_stat_files(stat_dir_exp, args.dirs))
 
 
 def is_reverse_connection(csv_fname):
@@ -97,7 +77,7 @@ def is_reverse_connection(csv_fname):
 
 
 def seq_d2s_all_connections(time_loss=1.5):
-    for fname, conns in connections.iteritems():
+    for fname, conns in connections:
         seqs = {co.WIFI: [], co.CELL: []}
         start_connections = []
         retrans_rto = {co.WIFI: [], co.CELL: []}
@@ -361,7 +341,7 @@ def seq_d2s_all_connections(time_loss=1.5):
                     continue
 
                 # Now process the file
-                conn = connections[fname][conn_id]
+                conn = conns[conn_id]
                 start_connections.append(conn.flow.attr[co.START].total_seconds() - min_start)
                 offset = conn.flow.attr[co.START].total_seconds() - min_start
                 interface = conn.flow.attr[co.IF]
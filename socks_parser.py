@@ -215,11 +215,15 @@ def get_ip_address(cmd):
 def process_pcap(pcap_filepath, ports):
     # condition = "tcp.len==7"
     # tshark_filter(condition, pcap_filepath, pcap_filtered_filepath)
-    file = open(pcap_filepath)
     try:
-        pcap = dpkt.pcap.Reader(file)
+        pcap = co.PcapReader(pcap_filepath)
+    except co.PcapError as e:
+        print(e)
+        return
+
+    try:
         for ts, data in pcap:
-            eth = dpkt.ethernet.Ethernet(data)
+            eth = dpkt.ethernet.Ethernet(str(data))
             ip = eth.data
             tcp = ip.data
             if len(tcp.data) == 7:
@@ -230,7 +234,7 @@ def process_pcap(pcap_filepath, ports):
     except Exception as e:
         print(e)
 
-    file.close()
+    pcap.close()
 
 if __name__ == "__main__":
     for pcap_filepath in pcap_list:
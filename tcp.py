@@ -21,7 +21,6 @@
 #  Contains code related to the processing of TCP traces
 
 from __future__ import print_function
-# from collections import deque
 
 ##################################################
 #                    IMPORTS                     #
@@ -33,13 +32,21 @@ import bisect
 import common as co
 import dpkt
 import glob
+import numpy as np
 import os
 import shutil
 import socket
 import socks_parser
+import struct
 import subprocess
 import sys
 
+from collections import deque
+from itertools import izip
+from multiprocessing import Process
+from multiprocessing import Queue
+from Queue import Empty
+
 ##################################################
 #                   EXCEPTIONS                   #
 ##################################################
@@ -63,9 +70,35 @@ SEQ_C2S = 'seq_c2s'
 SEQ_S2C = 'seq_s2c'
 HSEQ_C2S = 'hseq_c2s'
 HSEQ_S2C = 'hseq_s2c'
+# Number of acknowledged segments kept by SentSegments, to detect spurious retransmissions
+RETRANS_HISTORY = 1000
 CLIENT = 'client'
 SERVER = 'server'
 
+# Headers decoded by the fast path of process_tcp_packets
+ETH_HDR_LEN = 14
+SLL_HDR_LEN = 16
+ETH_TYPE_IP = 0x0800
+IP_HDR = struct.Struct('!BxHxxHxB2x4s4s')
+TCP_HDR = struct.Struct('!HHIIBB')
+TCP_HDR_LEN = 20
+# Attributes of directions of flows containing a timestamp of the processing of packets
+TCP_TIME_ATTRS = [co.TIME_LAST_ACK_TCP, co.TIME_FIN_ACK_TCP, co.TIME_LAST_PAYLD_TCP, co.TIME_LAST_PAYLD_WITH_RETRANS_TCP]
+# Keys of the state of connections of TCPAcksRetransAnalyzer in streaming mode: sides having sent a FIN and time of closing
+FINS = 'fins'
+CLOSED = 'closed'
+# With streaming, delay (in seconds) after which the state of a closed connection is forgotten
+FIN_TIMEOUT = 60.0
+# With streaming, delay (in seconds of the trace) between the evictions of the state of closed or idle connections
+EVICTION_INTERVAL = 60.0
+# Delay (in seconds) between checks of the processes analyzing shards of a trace
+SHARD_POLL_DELAY = 1.0
+# Keys of the external tools launched by launch_tools
+TSTAT = 'tstat'
+TCPCSM = 'tcpcsm'
+# Maximal difference (in seconds) between the start of a TCP connection and the one of its MPTCP connection
+MPTCP_MATCH_WINDOW = 8.0
+
 ##################################################
 #            CONNECTION DATA RELATED             #
 ##################################################
@@ -74,215 +107,164 @@ SERVER = 'server'
 class TCPConnection(co.BasicConnection):
 
     """ Represent a TCP connection """
-    flow = None
+    __slots__ = ('flow',)
 
     def __init__(self, conn_id):
         super(TCPConnection, self).__init__(conn_id)
         self.flow = co.BasicFlow()
 
 
-def extract_tstat_data_tcp_complete(filename, connections, conn_id):
-    """ Subpart of extract_tstat_data dedicated to the processing of the log_tcp_complete file
-        Returns the connections seen and the conn_id reached
+def tstat_int(values):
+    # Parsing integers is much faster when numpy does it on the whole column
+    return np.fromstring(" ".join(values), dtype=np.int64, sep=" ").tolist()
+
+
+def tstat_float(values):
+    return map(float, values)
+
+
+def tstat_ms(values):
+    """ Except RTT, all time (in ms in tstat) shoud be converted into seconds """
+    return [float(value) / 1000.0 for value in values]
+
+
+# Columns of the tstat logs, as (attribute, direction or None for the flow, column, conversion)
+TSTAT_NOCOMPLETE_COLUMNS = [
+    (co.DURATION, None, 30, tstat_ms),
+    (co.PACKS, co.C2S, 2, tstat_int), (co.PACKS, co.S2C, 16, tstat_int),
+    # Note that this count is about unique data bytes (sent in the payload)
+    (co.BYTES, co.C2S, 6, tstat_int), (co.BYTES, co.S2C, 20, tstat_int),
+    # This is about actual data bytes (sent in the payload, including retransmissions)
+    (co.BYTES_DATA, co.C2S, 8, tstat_int), (co.BYTES_DATA, co.S2C, 22, tstat_int),
+    (co.PACKS_RETRANS, co.C2S, 9, tstat_int), (co.PACKS_RETRANS, co.S2C, 23, tstat_int),
+    (co.BYTES_RETRANS, co.C2S, 10, tstat_int), (co.BYTES_RETRANS, co.S2C, 24, tstat_int),
+    (co.PACKS_OOO, co.C2S, 11, tstat_int), (co.PACKS_OOO, co.S2C, 25, tstat_int),
+    (co.NB_SYN, co.C2S, 12, tstat_int), (co.NB_SYN, co.S2C, 26, tstat_int),
+    (co.NB_FIN, co.C2S, 13, tstat_int), (co.NB_FIN, co.S2C, 27, tstat_int),
+    (co.NB_RST, co.C2S, 3, tstat_int), (co.NB_RST, co.S2C, 17, tstat_int),
+    (co.NB_ACK, co.C2S, 4, tstat_int), (co.NB_ACK, co.S2C, 18, tstat_int),
+    (co.TIME_FIRST_PAYLD, co.C2S, 31, tstat_ms), (co.TIME_FIRST_PAYLD, co.S2C, 32, tstat_ms),
+    (co.TIME_LAST_PAYLD, co.C2S, 33, tstat_ms), (co.TIME_LAST_PAYLD, co.S2C, 34, tstat_ms),
+    (co.TIME_FIRST_ACK, co.C2S, 35, tstat_ms), (co.TIME_FIRST_ACK, co.S2C, 36, tstat_ms),
+]
+
+TSTAT_COMPLETE_COLUMNS = TSTAT_NOCOMPLETE_COLUMNS + [
+    (co.RTT_SAMPLES, co.C2S, 48, tstat_int), (co.RTT_SAMPLES, co.S2C, 55, tstat_int),
+    (co.RTT_MIN, co.C2S, 45, tstat_float), (co.RTT_MIN, co.S2C, 52, tstat_float),
+    (co.RTT_MAX, co.C2S, 46, tstat_float), (co.RTT_MAX, co.S2C, 53, tstat_float),
+    (co.RTT_AVG, co.C2S, 44, tstat_float), (co.RTT_AVG, co.S2C, 51, tstat_float),
+    (co.RTT_STDEV, co.C2S, 47, tstat_float), (co.RTT_STDEV, co.S2C, 54, tstat_float),
+    (co.TTL_MIN, co.C2S, 49, tstat_float), (co.TTL_MIN, co.S2C, 56, tstat_float),
+    (co.TTL_MAX, co.C2S, 50, tstat_float), (co.TTL_MAX, co.S2C, 57, tstat_float),
+    (co.SS_MIN, co.C2S, 71, tstat_int), (co.SS_MIN, co.S2C, 94, tstat_int),
+    (co.SS_MAX, co.C2S, 70, tstat_int), (co.SS_MAX, co.S2C, 93, tstat_int),
+    (co.CWIN_MIN, co.C2S, 76, tstat_int), (co.CWIN_MIN, co.S2C, 99, tstat_int),
+    (co.CWIN_MAX, co.C2S, 75, tstat_int), (co.CWIN_MAX, co.S2C, 98, tstat_int),
+    (co.NB_RTX_RTO, co.C2S, 78, tstat_int), (co.NB_RTX_RTO, co.S2C, 101, tstat_int),
+    (co.NB_RTX_FR, co.C2S, 79, tstat_int), (co.NB_RTX_FR, co.S2C, 102, tstat_int),
+    (co.NB_REORDERING, co.C2S, 80, tstat_int), (co.NB_REORDERING, co.S2C, 103, tstat_int),
+    (co.NB_NET_DUP, co.C2S, 81, tstat_int), (co.NB_NET_DUP, co.S2C, 104, tstat_int),
+    (co.NB_UNKNOWN, co.C2S, 82, tstat_int), (co.NB_UNKNOWN, co.S2C, 105, tstat_int),
+    (co.NB_FLOW_CONTROL, co.C2S, 83, tstat_int), (co.NB_FLOW_CONTROL, co.S2C, 106, tstat_int),
+    (co.NB_UNNECE_RTX_RTO, co.C2S, 84, tstat_int), (co.NB_UNNECE_RTX_RTO, co.S2C, 107, tstat_int),
+    (co.NB_UNNECE_RTX_FR, co.C2S, 85, tstat_int), (co.NB_UNNECE_RTX_FR, co.S2C, 108, tstat_int),
+]
+
+# Columns of the addresses, ports and start of connections
+TSTAT_SADDR = 0
+TSTAT_SPORT = 1
+TSTAT_DADDR = 14
+TSTAT_DPORT = 15
+TSTAT_START = 28
+
+
+def load_tstat_columns(filename, columns):
+    """ Parse the tstat log filename in bulk, column by column
+        Return the lines (split in fields) that are not comments and, for the flow (None) and each direction, the attributes
+        of columns with their converted values, one tuple per line
     """
+    nb_fields = max([column for attr, direction, column, conversion in columns] + [TSTAT_START]) + 1
     log_file = open(filename)
-    data = log_file.readlines()
-    for line in data:
-        # Case 1: line start with #; skip it
-        if not line.startswith("#"):
-            # Case 2: extract info from the line
-            info = line.split()
+    # Lines starting with # are skipped
+    rows = [line.split()[:nb_fields] for line in log_file if not line.startswith("#")]
+    log_file.close()
+    if any(len(info) < nb_fields for info in rows):
+        raise TstatError("Lines with missing fields in " + filename)
+
+    fields = zip(*rows)
+    values = {}
+    for direction in [None] + co.DIRECTIONS:
+        attrs = []
+        direction_values = []
+        for attr, col_direction, column, conversion in columns:
+            if col_direction != direction:
+                continue
+            attrs.append(attr)
+            if fields:
+                direction_values.append(conversion(fields[column]))
+                if len(direction_values[-1]) != len(rows):
+                    raise TstatError("Bad values in column " + str(column) + " of " + filename)
+
+        values[direction] = (attrs, zip(*direction_values))
+
+    return rows, values
+
+
+def extract_tstat_data_tcp(filename, connections, conn_id, complete):
+    """ Subpart of extract_tstat_data dedicated to the processing of the log_tcp_complete (if complete is True) or
+        log_tcp_nocomplete file
+        Returns the connections seen and the conn_id reached
+    """
+    # Objects built here are kept, there is no garbage to collect
+    with co.gc_paused():
+        rows, values = load_tstat_columns(filename, TSTAT_COMPLETE_COLUMNS if complete else TSTAT_NOCOMPLETE_COLUMNS)
+        flow_attrs, flow_values = values[None]
+        c2s_attrs, c2s_values = values[co.C2S]
+        s2c_attrs, s2c_values = values[co.S2C]
+        # Addresses are often shared by many connections
+        long_addresses = {}
+        for i, info in enumerate(rows):
             conn_id += 1
             connection = TCPConnection(conn_id)
-            connection.flow.attr[co.TCP_COMPLETE] = True
-            connection.flow.attr[co.SADDR] = co.long_ipv6_address(info[0])
-            connection.flow.attr[co.DADDR] = co.long_ipv6_address(info[14])
-            connection.flow.attr[co.SPORT] = info[1]
-            connection.flow.attr[co.DPORT] = info[15]
+            flow_attr = connection.flow.attr
+            flow_attr[co.TCP_COMPLETE] = complete
+            for attr, column in ((co.SADDR, TSTAT_SADDR), (co.DADDR, TSTAT_DADDR)):
+                if info[column] not in long_addresses:
+                    long_addresses[info[column]] = co.long_ipv6_address(info[column])
+                flow_attr[attr] = long_addresses[info[column]]
+            flow_attr[co.SPORT] = info[TSTAT_SPORT]
+            flow_attr[co.DPORT] = info[TSTAT_DPORT]
             connection.flow.detect_ipv4()
             connection.flow.indicates_wifi_or_cell()
-            # Except RTT, all time (in ms in tstat) shoud be converted into seconds
-            connection.flow.attr[co.START] = timedelta(seconds=float(info[28])/1000)
-            connection.flow.attr[co.DURATION] = float(info[30]) / 1000.0
-            connection.flow.attr[co.C2S][co.PACKS] = int(info[2])
-            connection.flow.attr[co.S2C][co.PACKS] = int(info[16])
-            # Note that this count is about unique data bytes (sent in the payload)
-            connection.flow.attr[co.C2S][co.BYTES] = int(info[6])
-            connection.flow.attr[co.S2C][co.BYTES] = int(info[20])
-            # This is about actual data bytes (sent in the payload, including retransmissions)
-            connection.flow.attr[co.C2S][co.BYTES_DATA] = int(info[8])
-            connection.flow.attr[co.S2C][co.BYTES_DATA] = int(info[22])
-
-            connection.flow.attr[co.C2S][co.PACKS_RETRANS] = int(info[9])
-            connection.flow.attr[co.S2C][co.PACKS_RETRANS] = int(info[23])
-            connection.flow.attr[co.C2S][co.BYTES_RETRANS] = int(info[10])
-            connection.flow.attr[co.S2C][co.BYTES_RETRANS] = int(info[24])
-
-            connection.flow.attr[co.C2S][co.PACKS_OOO] = int(info[11])
-            connection.flow.attr[co.S2C][co.PACKS_OOO] = int(info[25])
-
-            connection.flow.attr[co.C2S][co.NB_SYN] = int(info[12])
-            connection.flow.attr[co.S2C][co.NB_SYN] = int(info[26])
-            connection.flow.attr[co.C2S][co.NB_FIN] = int(info[13])
-            connection.flow.attr[co.S2C][co.NB_FIN] = int(info[27])
-            connection.flow.attr[co.C2S][co.NB_RST] = int(info[3])
-            connection.flow.attr[co.S2C][co.NB_RST] = int(info[17])
-            connection.flow.attr[co.C2S][co.NB_ACK] = int(info[4])
-            connection.flow.attr[co.S2C][co.NB_ACK] = int(info[18])
-
-            # Except RTT, all time (in ms in tstat) shoud be converted into seconds
-            connection.flow.attr[co.C2S][co.TIME_FIRST_PAYLD] = float(info[31]) / 1000.0
-            connection.flow.attr[co.S2C][co.TIME_FIRST_PAYLD] = float(info[32]) / 1000.0
-            connection.flow.attr[co.C2S][co.TIME_LAST_PAYLD] = float(info[33]) / 1000.0
-            connection.flow.attr[co.S2C][co.TIME_LAST_PAYLD] = float(info[34]) / 1000.0
-            connection.flow.attr[co.C2S][co.TIME_FIRST_ACK] = float(info[35]) / 1000.0
-            connection.flow.attr[co.S2C][co.TIME_FIRST_ACK] = float(info[36]) / 1000.0
-
-            connection.flow.attr[co.C2S][co.RTT_SAMPLES] = int(info[48])
-            connection.flow.attr[co.S2C][co.RTT_SAMPLES] = int(info[55])
-            connection.flow.attr[co.C2S][co.RTT_MIN] = float(info[45])
-            connection.flow.attr[co.S2C][co.RTT_MIN] = float(info[52])
-            connection.flow.attr[co.C2S][co.RTT_MAX] = float(info[46])
-            connection.flow.attr[co.S2C][co.RTT_MAX] = float(info[53])
-            connection.flow.attr[co.C2S][co.RTT_AVG] = float(info[44])
-            connection.flow.attr[co.S2C][co.RTT_AVG] = float(info[51])
-            connection.flow.attr[co.C2S][co.RTT_STDEV] = float(info[47])
-            connection.flow.attr[co.S2C][co.RTT_STDEV] = float(info[54])
-            connection.flow.attr[co.C2S][co.TTL_MIN] = float(info[49])
-            connection.flow.attr[co.S2C][co.TTL_MIN] = float(info[56])
-            connection.flow.attr[co.C2S][co.TTL_MAX] = float(info[50])
-            connection.flow.attr[co.S2C][co.TTL_MAX] = float(info[57])
-
-            connection.flow.attr[co.C2S][co.SS_MIN] = int(info[71])
-            connection.flow.attr[co.S2C][co.SS_MIN] = int(info[94])
-            connection.flow.attr[co.C2S][co.SS_MAX] = int(info[70])
-            connection.flow.attr[co.S2C][co.SS_MAX] = int(info[93])
-
-            connection.flow.attr[co.C2S][co.CWIN_MIN] = int(info[76])
-            connection.flow.attr[co.S2C][co.CWIN_MIN] = int(info[99])
-            connection.flow.attr[co.C2S][co.CWIN_MAX] = int(info[75])
-            connection.flow.attr[co.S2C][co.CWIN_MAX] = int(info[98])
-
-            connection.flow.attr[co.C2S][co.NB_RTX_RTO] = int(info[78])
-            connection.flow.attr[co.S2C][co.NB_RTX_RTO] = int(info[101])
-            connection.flow.attr[co.C2S][co.NB_RTX_FR] = int(info[79])
-            connection.flow.attr[co.S2C][co.NB_RTX_FR] = int(info[102])
-            connection.flow.attr[co.C2S][co.NB_REORDERING] = int(info[80])
-            connection.flow.attr[co.S2C][co.NB_REORDERING] = int(info[103])
-            connection.flow.attr[co.C2S][co.NB_NET_DUP] = int(info[81])
-            connection.flow.attr[co.S2C][co.NB_NET_DUP] = int(info[104])
-            connection.flow.attr[co.C2S][co.NB_UNKNOWN] = int(info[82])
-            connection.flow.attr[co.S2C][co.NB_UNKNOWN] = int(info[105])
-            connection.flow.attr[co.C2S][co.NB_FLOW_CONTROL] = int(info[83])
-            connection.flow.attr[co.S2C][co.NB_FLOW_CONTROL] = int(info[106])
-            connection.flow.attr[co.C2S][co.NB_UNNECE_RTX_RTO] = int(info[84])
-            connection.flow.attr[co.S2C][co.NB_UNNECE_RTX_RTO] = int(info[107])
-            connection.flow.attr[co.C2S][co.NB_UNNECE_RTX_FR] = int(info[85])
-            connection.flow.attr[co.S2C][co.NB_UNNECE_RTX_FR] = int(info[108])
+            flow_attr[co.START] = timedelta(seconds=float(info[TSTAT_START]) / 1000)
+            flow_attr.update(izip(flow_attrs, flow_values[i]))
+            flow_attr[co.C2S].update(izip(c2s_attrs, c2s_values[i]))
+            flow_attr[co.S2C].update(izip(s2c_attrs, s2c_values[i]))
 
             connection.attr[co.C2S][co.BYTES] = {}
             connection.attr[co.S2C][co.BYTES] = {}
 
-            connection.flow.attr[co.C2S][co.TIMESTAMP_RETRANS] = []
-            connection.flow.attr[co.S2C][co.TIMESTAMP_RETRANS] = []
-
-            connection.flow.attr[co.C2S][co.TIME_FIN_ACK_TCP] = timedelta(0)
-            connection.flow.attr[co.S2C][co.TIME_FIN_ACK_TCP] = timedelta(0)
-
-            connection.flow.attr[co.C2S][co.TIME_LAST_ACK_TCP] = timedelta(0)
-            connection.flow.attr[co.S2C][co.TIME_LAST_ACK_TCP] = timedelta(0)
-
-            connection.flow.attr[co.C2S][co.TIME_LAST_PAYLD_TCP] = timedelta(0)
-            connection.flow.attr[co.S2C][co.TIME_LAST_PAYLD_TCP] = timedelta(0)
-
-            connection.flow.attr[co.C2S][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = timedelta(0)
-            connection.flow.attr[co.S2C][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = timedelta(0)
+            for direction in co.DIRECTIONS:
+                flow_attr[direction][co.TIMESTAMP_RETRANS] = []
+                flow_attr[direction][co.TIME_FIN_ACK_TCP] = timedelta(0)
+                flow_attr[direction][co.TIME_LAST_ACK_TCP] = timedelta(0)
+                flow_attr[direction][co.TIME_LAST_PAYLD_TCP] = timedelta(0)
+                flow_attr[direction][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = timedelta(0)
 
             connections[conn_id] = connection
 
-    log_file.close()
     return connections, conn_id
 
 
-def extract_tstat_data_tcp_nocomplete(filename, connections, conn_id):
-    log_file = open(filename)
-    data = log_file.readlines()
-    for line in data:
-        # Case 1: line start with #; skip it
-        if not line.startswith("#"):
-            # Case 2: extract info from the line
-            info = line.split()
-            conn_id += 1
-            connection = TCPConnection(conn_id)
-
-            connection.flow.attr[co.TCP_COMPLETE] = False
-
-            connection.flow.attr[co.SADDR] = co.long_ipv6_address(info[0])
-            connection.flow.attr[co.DADDR] = co.long_ipv6_address(info[14])
-            connection.flow.attr[co.SPORT] = info[1]
-            connection.flow.attr[co.DPORT] = info[15]
-
-            connection.flow.detect_ipv4()
-            connection.flow.indicates_wifi_or_cell()
-            # Except RTT, all time (in ms in tstat) shoud be converted into seconds
-            connection.flow.attr[co.START] = timedelta(seconds=float(info[28])/1000)
-            connection.flow.attr[co.DURATION] = float(info[30]) / 1000.0
-            connection.flow.attr[co.C2S][co.PACKS] = int(info[2])
-            connection.flow.attr[co.S2C][co.PACKS] = int(info[16])
-            # Note that this count is about unique data bytes (sent in the payload)
-            connection.flow.attr[co.C2S][co.BYTES] = int(info[6])
-            connection.flow.attr[co.S2C][co.BYTES] = int(info[20])
-            # This is about actual data bytes (sent in the payload, including retransmissions)
-            connection.flow.attr[co.C2S][co.BYTES_DATA] = int(info[8])
-            connection.flow.attr[co.S2C][co.BYTES_DATA] = int(info[22])
-
-            connection.flow.attr[co.C2S][co.PACKS_RETRANS] = int(info[9])
-            connection.flow.attr[co.S2C][co.PACKS_RETRANS] = int(info[23])
-            connection.flow.attr[co.C2S][co.BYTES_RETRANS] = int(info[10])
-            connection.flow.attr[co.S2C][co.BYTES_RETRANS] = int(info[24])
-
-            connection.flow.attr[co.C2S][co.PACKS_OOO] = int(info[11])
-            connection.flow.attr[co.S2C][co.PACKS_OOO] = int(info[25])
-
-            connection.flow.attr[co.C2S][co.NB_SYN] = int(info[12])
-            connection.flow.attr[co.S2C][co.NB_SYN] = int(info[26])
-            connection.flow.attr[co.C2S][co.NB_FIN] = int(info[13])
-            connection.flow.attr[co.S2C][co.NB_FIN] = int(info[27])
-            connection.flow.attr[co.C2S][co.NB_RST] = int(info[3])
-            connection.flow.attr[co.S2C][co.NB_RST] = int(info[17])
-            connection.flow.attr[co.C2S][co.NB_ACK] = int(info[4])
-            connection.flow.attr[co.S2C][co.NB_ACK] = int(info[18])
-
-            # Except RTT, all time (in ms in tstat) shoud be converted into seconds
-            connection.flow.attr[co.C2S][co.TIME_FIRST_PAYLD] = float(info[31]) / 1000.0
-            connection.flow.attr[co.S2C][co.TIME_FIRST_PAYLD] = float(info[32]) / 1000.0
-            connection.flow.attr[co.C2S][co.TIME_LAST_PAYLD] = float(info[33]) / 1000.0
-            connection.flow.attr[co.S2C][co.TIME_LAST_PAYLD] = float(info[34]) / 1000.0
-            connection.flow.attr[co.C2S][co.TIME_FIRST_ACK] = float(info[35]) / 1000.0
-            connection.flow.attr[co.S2C][co.TIME_FIRST_ACK] = float(info[36]) / 1000.0
-
-            connection.attr[co.C2S][co.BYTES] = {}
-            connection.attr[co.S2C][co.BYTES] = {}
-
-            connection.flow.attr[co.C2S][co.TIMESTAMP_RETRANS] = []
-            connection.flow.attr[co.S2C][co.TIMESTAMP_RETRANS] = []
-
-            connection.flow.attr[co.C2S][co.TIME_FIN_ACK_TCP] = timedelta(0)
-            connection.flow.attr[co.S2C][co.TIME_FIN_ACK_TCP] = timedelta(0)
-
-            connection.flow.attr[co.C2S][co.TIME_LAST_ACK_TCP] = timedelta(0)
-            connection.flow.attr[co.S2C][co.TIME_LAST_ACK_TCP] = timedelta(0)
-
-            connection.flow.attr[co.C2S][co.TIME_LAST_PAYLD_TCP] = timedelta(0)
-            connection.flow.attr[co.S2C][co.TIME_LAST_PAYLD_TCP] = timedelta(0)
-
-            connection.flow.attr[co.C2S][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = timedelta(0)
-            connection.flow.attr[co.S2C][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = timedelta(0)
+def extract_tstat_data_tcp_complete(filename, connections, conn_id):
+    """ Subpart of extract_tstat_data dedicated to the processing of the log_tcp_complete file
+        Returns the connections seen and the conn_id reached
+    """
+    return extract_tstat_data_tcp(filename, connections, conn_id, True)
 
-            connections[conn_id] = connection
 
-    log_file.close()
-    return connections, conn_id
+def extract_tstat_data_tcp_nocomplete(filename, connections, conn_id):
+    return extract_tstat_data_tcp(filename, connections, conn_id, False)
 
 
 def extract_tstat_data(pcap_filepath):
@@ -333,14 +315,21 @@ def get_flow_name(xpl_filepath):
 ##################################################
 
 
-def process_tstat_cmd(cmd, pcap_filepath, keep_log=False, graph_dir_exp=None):
-    """ Launch the command cmd given in argument, and return a dictionary containing information
+def launch_tstat(pcap_filepath):
+    """ Start tstat on pcap_filepath in the current directory, and return it to give to process_tstat """
+    cmd = ['tstat', '-s', os.path.basename(pcap_filepath[:-5]), pcap_filepath]
+    stdout_tstat = open(pcap_filepath[:-5] + '_tstat', 'w+')
+    return subprocess.Popen(cmd, stdout=stdout_tstat), stdout_tstat
+
+
+def process_tstat(tstat, pcap_filepath, keep_log=False, graph_dir_exp=None):
+    """ Wait for tstat (as returned by launch_tstat), and return a dictionary containing information
         about connections of the pcap file analyzed
         Raise a TstatError if tstat encounters problems
     """
-    pcap_flow_data_path = pcap_filepath[:-5] + '_tstat'
-    stdout_tstat = open(pcap_flow_data_path, 'w+')
-    if subprocess.call(cmd, stdout=stdout_tstat) != 0:
+    tstat_process, stdout_tstat = tstat
+    pcap_flow_data_path = stdout_tstat.name
+    if tstat_process.wait() != 0:
         raise TstatError("Error of tcptrace with " + pcap_filepath)
 
     connections = extract_tstat_data(pcap_filepath)
@@ -364,6 +353,31 @@ def process_tstat_cmd(cmd, pcap_filepath, keep_log=False, graph_dir_exp=None):
     return connections
 
 
+def launch_tools(pcap_filepath, tcpcsm):
+    """ Start the external tools used by process_trace on pcap_filepath (tstat, and tcpcsm if True)
+        Return a dictionary to give to process_trace, so that they analyze the trace while something else is done
+    """
+    tools = {TSTAT: launch_tstat(pcap_filepath)}
+    if tcpcsm:
+        tools[TCPCSM] = launch_tcpcsm(pcap_filepath)
+    return tools
+
+
+def kill_tools(pcap_filepath, tools):
+    """ Stop the tools started by launch_tools and remove their outputs, when process_trace will not use them """
+    tstat_process, stdout_tstat = tools[TSTAT]
+    for process in [tstat_process, tools.get(TCPCSM, None)]:
+        if process and process.poll() is None:
+            process.kill()
+            process.wait()
+
+    stdout_tstat.close()
+    for filepath in [stdout_tstat.name, pcap_filepath[:-5] + '_tcpcsm']:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+    shutil.rmtree(os.path.basename(pcap_filepath[:-5]), ignore_errors=True)
+
+
 ##################################################
 #                 RETRANSMISSION                 #
 ##################################################
@@ -377,91 +391,91 @@ def get_ip_port_tshark(str_data):
     port = str_data[separator + 1:]
     return ip, port
 
-
-def get_total_and_retrans_frames(pcap_filepath, connections):
-    """ Fill information for connections based on tshark """
-    # First init values to avoid strange errors if connection is empty
-    for conn_id, conn in connections.iteritems():
-        for direction in co.DIRECTIONS:
-            connections[conn_id].flow.attr[direction][co.FRAMES_TOTAL] = 0
-            connections[conn_id].flow.attr[direction][co.BYTES_FRAMES_TOTAL] = 0
-            connections[conn_id].flow.attr[direction][co.FRAMES_RETRANS] = 0
-            connections[conn_id].flow.attr[direction][co.BYTES_FRAMES_RETRANS] = 0
-
-    stats_filename = os.path.basename(pcap_filepath)[:-5] + "_tshark_total"
-    stats_file = open(stats_filename, 'w')
-    co.tshark_stats(None, pcap_filepath, print_out=stats_file)
-    stats_file.close()
-
-    stats_file = open(stats_filename)
-    data = stats_file.readlines()
-    stats_file.close()
-    for line in data:
-        split_line = " ".join(line.split()).split(" ")
-        if len(split_line) == 11:
-            # Manage case with ipv6
-            ip_src, port_src = get_ip_port_tshark(split_line[0])
-            ip_dst, port_dst = get_ip_port_tshark(split_line[2])
-            for conn_id, conn in connections.iteritems():
-                if conn.flow.attr[co.SADDR] == ip_src and conn.flow.attr[co.SPORT] == port_src and \
-                        conn.flow.attr[co.DADDR] == ip_dst and conn.flow.attr[co.DPORT]:
-                    connections[conn_id].flow.attr[co.S2C][co.FRAMES_TOTAL] = int(split_line[3])
-                    connections[conn_id].flow.attr[co.S2C][co.BYTES_FRAMES_TOTAL] = int(split_line[4])
-                    connections[conn_id].flow.attr[co.C2S][co.FRAMES_TOTAL] = int(split_line[5])
-                    connections[conn_id].flow.attr[co.C2S][co.BYTES_FRAMES_TOTAL] = int(split_line[6])
-                    break
-
-    stats_file.close()
-    os.remove(stats_filename)
-
-    stats_filename = os.path.basename(pcap_filepath)[:-5] + "_tshark_retrans"
-    stats_file = open(stats_filename, 'w')
-    co.tshark_stats('tcp.analysis.retransmission', pcap_filepath, print_out=stats_file)
-    stats_file.close()
-
-    stats_file = open(stats_filename)
-    data = stats_file.readlines()
-    stats_file.close()
-    for line in data:
-        split_line = " ".join(line.split()).split(" ")
-        if len(split_line) == 11:
-            ip_src, port_src = get_ip_port_tshark(split_line[0])
-            ip_dst, port_dst = get_ip_port_tshark(split_line[2])
-            for conn_id, conn in connections.iteritems():
-                if conn.flow.attr[co.SADDR] == ip_src and conn.flow.attr[co.SPORT] == port_src and \
-                   conn.flow.attr[co.DADDR] == ip_dst and conn.flow.attr[co.DPORT]:
-                    connections[conn_id].flow.attr[co.S2C][co.FRAMES_RETRANS] = int(split_line[3])
-                    connections[conn_id].flow.attr[co.S2C][co.BYTES_FRAMES_RETRANS] = int(split_line[4])
-                    connections[conn_id].flow.attr[co.C2S][co.FRAMES_RETRANS] = int(split_line[5])
-                    connections[conn_id].flow.attr[co.C2S][co.BYTES_FRAMES_RETRANS] = int(split_line[6])
-                    break
-
-    stats_file.close()
-    os.remove(stats_filename)
-
 ##################################################
 #                   PROCESSING                   #
 ##################################################
 
 
+class TimeIndex(object):
+
+    """ Items sorted by their start (in nanoseconds), to find quickly the ones starting around a given time
+        Connections with the same 4-tuple (e.g. behind a NAT reusing ports) are told apart this way
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, start, item):
+        """ Add item starting at start; items with the same start are kept in their order of insertion """
+        index = bisect.bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.items.insert(index, item)
+
+    def get_window(self, ts, delta):
+        """ Return the list of items starting at most delta from ts, sorted by their start """
+        return self.items[bisect.bisect_left(self.starts, ts - delta):bisect.bisect_right(self.starts, ts + delta)]
+
+    def get_closest(self, ts, max_delta):
+        """ Return the item starting the closest to ts, if it is less than max_delta from it, or None
+            In case of tie, the one starting first (or added first if they have the same start) is returned
+        """
+        index = bisect.bisect_left(self.starts, ts)
+        closest = None
+        # Only the first items starting just before ts and at or after ts can be the closest
+        for i in (bisect.bisect_left(self.starts, self.starts[index - 1]) if index > 0 else -1, index):
+            if 0 <= i < len(self.starts) and abs(ts - self.starts[i]) < max_delta:
+                closest = self.items[i]
+                max_delta = abs(ts - self.starts[i])
+
+        return closest
+
+    def get_last(self, ts):
+        """ Return the last item starting at or before ts (the last added if several have the same start), or None """
+        index = bisect.bisect_right(self.starts, ts)
+        return self.items[index - 1] if index > 0 else None
+
+
+def add_to_time_index(index_dict, key, start, item):
+    """ Add item starting at start to the TimeIndex of key in index_dict """
+    if key not in index_dict:
+        index_dict[key] = TimeIndex()
+
+    index_dict[key].add(start, item)
+
+
 def get_preprocessed_connections(connections):
-    """ Prepare a dictionary for fast association of a TCP connection with a MPTCP flow """
+    """ Prepare a dictionary for fast association of a TCP connection with a MPTCP flow
+        Each (saddr, daddr, sport, dport) gives a TimeIndex of (start, duration, conn_id, flow_id) by start of MPTCP connection
+    """
     fast_dico = {}
 
     # Collect all potential subflows
     for conn_id, conn in connections.iteritems():
         if conn.attr.get(co.START, None):
             for flow_id, flow in conn.flows.iteritems():
-                if (flow.attr[co.SADDR], flow.attr[co.DADDR], flow.attr[co.SPORT], flow.attr[co.DPORT]) not in fast_dico:
-                    fast_dico[(flow.attr[co.SADDR], flow.attr[co.DADDR], flow.attr[co.SPORT], flow.attr[co.DPORT])] = []
+                add_to_time_index(fast_dico, (flow.attr[co.SADDR], flow.attr[co.DADDR], flow.attr[co.SPORT], flow.attr[co.DPORT]),
+                                  timedelta_to_ns(conn.attr[co.START]), (conn.attr[co.START], float(conn.attr[co.DURATION]), conn_id, flow_id))
 
-                fast_dico[(flow.attr[co.SADDR], flow.attr[co.DADDR], flow.attr[co.SPORT], flow.attr[co.DPORT])] += [(conn.attr[co.START],
-                                                                                                                     float(conn.attr[co.DURATION]),
-                                                                                                                     conn_id, flow_id)]
+    return fast_dico
 
-    # Sort them for faster processing
-    for quadruplet in fast_dico.keys():
-        fast_dico[quadruplet] = sorted(fast_dico[quadruplet], key=lambda x: x[0])
+
+def get_preprocessed_flows(connections):
+    """ Prepare a dictionary for fast association of the SYN of a MPTCP subflow with its MPTCP flow
+        Each (saddr, daddr, sport, dport) gives a TimeIndex of (conn_id, flow_id) by start of MPTCP flow, for flows whose
+        start is known (see copy_info_to_mptcp_connections)
+    """
+    fast_dico = {}
+    for conn_id, conn in connections.iteritems():
+        if not conn.attr.get(co.START, None):
+            continue
+        for flow_id, flow in conn.flows.iteritems():
+            if co.START in flow.attr:
+                add_to_time_index(fast_dico, (flow.attr[co.SADDR], flow.attr[co.DADDR], flow.attr[co.SPORT], flow.attr[co.DPORT]),
+                                  timedelta_to_ns(flow.attr[co.START]), (conn_id, flow_id))
 
     return fast_dico
 
@@ -473,7 +487,7 @@ def get_flow_name_connection(connection, connections):
     """
     for conn_id, conn in connections.iteritems():
         # Let a little margin, but don't think it's needed
-        if conn.attr.get(co.START, None) and (abs((connection.flow.attr[co.START] - conn.attr[co.START]).total_seconds()) <= 8.0 and
+        if conn.attr.get(co.START, None) and (abs((connection.flow.attr[co.START] - conn.attr[co.START]).total_seconds()) <= MPTCP_MATCH_WINDOW and
                                               connection.flow.attr[co.START].total_seconds() <=
                                               conn.attr[co.START].total_seconds() + float(conn.attr[co.DURATION])):
             for flow_id, flow in conn.flows.iteritems():
@@ -499,25 +513,19 @@ def get_flow_name_connection_optimized(connection, connections, fast_conns=None)
                                     connection.flow.attr[co.DPORT])]
 
         if len(potential_list) == 1:
-            return potential_list[0][2], potential_list[0][3]
-
-        # Search on list
-        potential_match_index = 0
-        match_indexes = []
-        # Check with an error window of 8 seconds for both sides
-        while (potential_match_index < len(potential_list)
-               and abs((potential_list[potential_match_index][0] - connection.flow.attr[co.START]).total_seconds()) <= 8.0):
-            if connection.flow.attr[co.START].total_seconds() <= potential_list[potential_match_index][0].total_seconds() + potential_list[potential_match_index][1]:
-                match_indexes += [potential_match_index]
-
-            potential_match_index += 1
-
-        if len(match_indexes) == 1:
-            return potential_list[match_indexes[0]][2], potential_list[match_indexes[0]][3]
-        elif len(match_indexes) > 1:
+            return potential_list.items[0][2], potential_list.items[0][3]
+
+        # Check with an error window of MPTCP_MATCH_WINDOW seconds for both sides
+        matches = [potential for potential in potential_list.get_window(timedelta_to_ns(connection.flow.attr[co.START]),
+                                                                        int(MPTCP_MATCH_WINDOW * co.NS_PER_SEC))
+                   if connection.flow.attr[co.START].total_seconds() <= potential[0].total_seconds() + potential[1]]
+
+        if len(matches) == 1:
+            return matches[0][2], matches[0][3]
+        elif len(matches) > 1:
             print("More than one possible match...")
             # By default, return the first match
-            return potential_list[match_indexes[0]][2], potential_list[match_indexes[0]][3]
+            return matches[0][2], matches[0][3]
         else:
             print("No match found for MPTCP subflow...")
 
@@ -536,27 +544,7 @@ def copy_info_to_mptcp_connections(connections, mptcp_connections, failed_conns,
         mptcp_connections[conn_id].flows[flow_id].attr[co.TCP_COMPLETE] = connection.flow.attr[co.TCP_COMPLETE]
         mptcp_connections[conn_id].flows[flow_id].attr[co.START] = connection.flow.attr[co.START]
         mptcp_connections[conn_id].flows[flow_id].attr[co.DURATION] = connection.flow.attr[co.DURATION]
-        if co.BACKUP in connection.attr:
-            mptcp_connections[conn_id].flows[flow_id].attr[co.BACKUP] = connection.attr[co.BACKUP]
-        if co.SOCKS_PORT in connection.attr:
-            mptcp_connections[conn_id].flows[flow_id].attr[co.SOCKS_PORT] = connection.attr[co.SOCKS_PORT]
-            mptcp_connections[conn_id].flows[flow_id].attr[co.SOCKS_DADDR] = connection.attr[co.SOCKS_DADDR]
-            if co.SOCKS_PORT not in mptcp_connections[conn_id].attr:
-                mptcp_connections[conn_id].attr[co.SOCKS_PORT] = connection.attr[co.SOCKS_PORT]
-                mptcp_connections[conn_id].attr[co.SOCKS_DADDR] = connection.attr[co.SOCKS_DADDR]
-
-            elif not mptcp_connections[conn_id].attr[co.SOCKS_PORT] == connection.attr[co.SOCKS_PORT] or not mptcp_connections[conn_id].attr[co.SOCKS_DADDR] == connection.attr[co.SOCKS_DADDR]:
-                print("DIFFERENT SOCKS PORT...", mptcp_connections[conn_id].attr[co.SOCKS_PORT], connection.attr[co.SOCKS_PORT], mptcp_connections[conn_id].attr[co.SOCKS_DADDR], connection.attr[co.SOCKS_DADDR], conn_id, flow_id)
-
-        for direction in co.DIRECTIONS:
-            for attr in connection.flow.attr[direction]:
-                mptcp_connections[conn_id].flows[flow_id].attr[direction][attr] = connection.flow.attr[direction][attr]
-
-            if flow_name in acksize_all[direction]:
-                if conn_id not in acksize_all_mptcp[direction]:
-                    acksize_all_mptcp[direction][conn_id] = {}
-
-                acksize_all_mptcp[direction][conn_id][flow_id] = acksize_all[direction][flow_name]
+        copy_trace_info_to_mptcp_flow(connections, mptcp_connections, acksize_all, acksize_all_mptcp, flow_name, conn_id, flow_id)
 
     else:
         # This is a TCPConnection that failed to be a MPTCP subflow: add it in failed_conns
@@ -565,14 +553,52 @@ def copy_info_to_mptcp_connections(connections, mptcp_connections, failed_conns,
     return conn_id, flow_id
 
 
-def retransmissions_tcpcsm(pcap_filepath, connections):
+def copy_trace_info_to_mptcp_flow(connections, mptcp_connections, acksize_all, acksize_all_mptcp, flow_name, conn_id, flow_id):
+    """ Copy the information of the tcp connection computed from the trace (backup, socks, both directions and ack
+        sizes) to the flow flow_id of the mptcp connection conn_id
+    """
+    connection = connections[flow_name]
+    if co.BACKUP in connection.attr:
+        mptcp_connections[conn_id].flows[flow_id].attr[co.BACKUP] = connection.attr[co.BACKUP]
+    if co.SOCKS_PORT in connection.attr:
+        mptcp_connections[conn_id].flows[flow_id].attr[co.SOCKS_PORT] = connection.attr[co.SOCKS_PORT]
+        mptcp_connections[conn_id].flows[flow_id].attr[co.SOCKS_DADDR] = connection.attr[co.SOCKS_DADDR]
+        if co.SOCKS_PORT not in mptcp_connections[conn_id].attr:
+            mptcp_connections[conn_id].attr[co.SOCKS_PORT] = connection.attr[co.SOCKS_PORT]
+            mptcp_connections[conn_id].attr[co.SOCKS_DADDR] = connection.attr[co.SOCKS_DADDR]
+
+        elif not mptcp_connections[conn_id].attr[co.SOCKS_PORT] == connection.attr[co.SOCKS_PORT] or not mptcp_connections[conn_id].attr[co.SOCKS_DADDR] == connection.attr[co.SOCKS_DADDR]:
+            print("DIFFERENT SOCKS PORT...", mptcp_connections[conn_id].attr[co.SOCKS_PORT], connection.attr[co.SOCKS_PORT], mptcp_connections[conn_id].attr[co.SOCKS_DADDR], connection.attr[co.SOCKS_DADDR], conn_id, flow_id)
+
+    for direction in co.DIRECTIONS:
+        for attr in connection.flow.attr[direction]:
+            mptcp_connections[conn_id].flows[flow_id].attr[direction][attr] = connection.flow.attr[direction][attr]
+
+        if flow_name in acksize_all[direction]:
+            if conn_id not in acksize_all_mptcp[direction]:
+                acksize_all_mptcp[direction][conn_id] = {}
+
+            acksize_all_mptcp[direction][conn_id][flow_id] = acksize_all[direction][flow_name]
+
+
+def launch_tcpcsm(pcap_filepath):
+    """ Start tcpcsm on pcap_filepath, and return it to give to retransmissions_tcpcsm (None if it cannot be started) """
     cmd = ['tcpcsm', '-o', pcap_filepath[:-5] + '_tcpcsm', '-R', pcap_filepath]
     try:
-        if subprocess.call(cmd) != 0:
-            return
+        return subprocess.Popen(cmd)
 
     except Exception as e:
         print(str(e), file=sys.stderr)
+        return None
+
+
+def retransmissions_tcpcsm(pcap_filepath, connections, tcpcsm_process=None):
+    """ Fill information for connections based on tcpcsm
+        If tcpcsm_process (as returned by launch_tcpcsm) is not given, tcpcsm is launched now
+    """
+    if tcpcsm_process is None:
+        tcpcsm_process = launch_tcpcsm(pcap_filepath)
+    if tcpcsm_process is None or tcpcsm_process.wait() != 0:
         return
 
     # Create a reversed dictionary to speed up the lookup
@@ -586,8 +612,9 @@ def retransmissions_tcpcsm(pcap_filepath, connections):
         split_line = line.split()
         if split_line[6] in ['RTO', 'FRETX', 'MS_FRETX', 'SACK_FRETX', 'BAD_FRETX', 'LOSS_REC', 'UNEXP_FREC', 'UNNEEDED']:
             key = (split_line[1], split_line[0], split_line[3], split_line[2])
-            if len(inverse_dict.get(key, [])) == 1:
-                conn_id = inverse_dict[key][0]
+            # The 4-tuple can be reused: the retransmission belongs to the last connection started before it
+            conn_id = inverse_dict[key].get_last(int(round(float(split_line[7]) * co.NS_PER_SEC))) if key in inverse_dict else None
+            if conn_id is not None:
                 direction = co.C2S if split_line[5] == '1' else co.S2C
                 if co.TCPCSM_RETRANS not in connections[conn_id].flow.attr[direction]:
                     connections[conn_id].flow.attr[direction][co.TCPCSM_RETRANS] = [(split_line[7], split_line[6])]
@@ -598,14 +625,12 @@ def retransmissions_tcpcsm(pcap_filepath, connections):
 
 
 def create_inverse_tcp_dictionary(connections):
+    """ Return a dictionary giving for each (saddr, sport, daddr, dport) a TimeIndex of the ids of TCP connections by start """
     inverse = {}
     for conn_id, conn in connections.iteritems():
         flow = conn.flow
         key = (flow.attr[co.SADDR], flow.attr[co.SPORT], flow.attr[co.DADDR], flow.attr[co.DPORT])
-        if key not in inverse:
-            inverse[key] = [conn_id]
-        else:
-            inverse[key] += [conn_id]
+        add_to_time_index(inverse, key, timedelta_to_ns(flow.attr[co.START]), conn_id)
 
     return inverse
 
@@ -626,6 +651,16 @@ def get_ts_delta(ts):
         return timedelta(seconds=ts)
 
 
+def ns_to_timedelta(ns):
+    """ Get a timedelta object for the number of nanoseconds ns (rounded to the microsecond) """
+    return timedelta(microseconds=(ns + 500) // 1000)
+
+
+def timedelta_to_ns(delta):
+    """ Get the number of nanoseconds of the timedelta object delta """
+    return ((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds) * 1000
+
+
 def get_ips_and_ports(eth, ip, tcp):
     """ Given the Ethernet (and its conversion in IP) and TCP packet,
         return the IPs and ports of source (client) and destination (server)
@@ -645,6 +680,81 @@ def get_ips_and_ports(eth, ip, tcp):
     return saddr, daddr, sport, dport
 
 
+class FastIP(object):
+
+    """ IPv4 header read directly from the packet buffer, with the attributes of dpkt.ip.IP used in this file """
+    __slots__ = ('len', 'hl', 'src', 'dst')
+
+
+class FastTCP(object):
+
+    """ TCP header read directly from the packet buffer, with the attributes of dpkt.tcp.TCP used in this file
+        The payload is only copied if needed
+    """
+    __slots__ = ('sport', 'dport', 'seq', 'ack', 'off', 'flags', 'opts', '_buf', '_start', '_end')
+
+    @property
+    def data(self):
+        return self._buf[self._start:self._end]
+
+
+def fast_decode_tcp_packet(buf, link_hdr_len, addr_names, port_names):
+    """ Decode an IPv4 TCP packet (str or buffer) without building dpkt objects
+        Return (ip, tcp, saddr, daddr, sport, dport) as get_ips_and_ports, or None if the packet is not a plain IPv4
+        TCP packet (the caller should then use dpkt)
+        addr_names and port_names are dictionaries used to convert addresses and ports only once in strings
+    """
+    ip_start = link_hdr_len
+    if len(buf) < ip_start + IP_HDR.size or struct.unpack_from('!H', buf, ip_start - 2)[0] != ETH_TYPE_IP:
+        return None
+
+    v_hl, ip_len, ip_off, proto, src, dst = IP_HDR.unpack_from(buf, ip_start)
+    hl = v_hl & 0xf
+    # Fragments and non-TCP packets are left to dpkt
+    if hl < 5 or proto != dpkt.ip.IP_PROTO_TCP or ip_off & dpkt.ip.IP_OFFMASK:
+        return None
+
+    tcp_start = ip_start + hl * 4
+    ip_end = ip_start + ip_len if ip_len else len(buf)
+    if min(ip_end, len(buf)) < tcp_start + TCP_HDR_LEN:
+        return None
+
+    ip = FastIP()
+    ip.len = ip_len
+    ip.hl = hl
+    ip.src = src
+    ip.dst = dst
+
+    tcp = FastTCP()
+    tcp.sport, tcp.dport, tcp.seq, tcp.ack, off_x2, tcp.flags = TCP_HDR.unpack_from(buf, tcp_start)
+    tcp.off = off_x2 >> 4
+    if tcp.off < 5:
+        return None
+    tcp.opts = buf[tcp_start + TCP_HDR_LEN:min(tcp_start + tcp.off * 4, ip_end)]
+    tcp._buf = buf
+    tcp._start = tcp_start + tcp.off * 4
+    tcp._end = ip_end
+
+    try:
+        saddr = addr_names[src]
+    except KeyError:
+        saddr = addr_names[src] = socket.inet_ntop(socket.AF_INET, src)
+    try:
+        daddr = addr_names[dst]
+    except KeyError:
+        daddr = addr_names[dst] = socket.inet_ntop(socket.AF_INET, dst)
+    try:
+        sport = port_names[tcp.sport]
+    except KeyError:
+        sport = port_names[tcp.sport] = str(tcp.sport)
+    try:
+        dport = port_names[tcp.dport]
+    except KeyError:
+        dport = port_names[tcp.dport] = str(tcp.dport)
+
+    return ip, tcp, saddr, daddr, sport, dport
+
+
 def detect_backup_subflow(tcp):
     """ Return True if this subflow is established with the backup bit """
     backup = False
@@ -659,17 +769,60 @@ def detect_backup_subflow(tcp):
     return backup
 
 
-def process_first_syn(ts_delta, acks, nb_acks, connections, tcp, ip, saddr, daddr, sport, dport, black_list, inverse_conns, ts_syn_timeout, ts_timeout):
+def convert_tcp_times_to_timedelta(flow_direction_attr):
+    """ Convert the timestamps in nanoseconds put in the attributes of a direction of a flow in timedelta objects """
+    for attr in TCP_TIME_ATTRS:
+        if isinstance(flow_direction_attr.get(attr), (int, long)):
+            flow_direction_attr[attr] = ns_to_timedelta(flow_direction_attr[attr])
+
+    flow_direction_attr[co.TIMESTAMP_RETRANS][:] = [tuple([ns_to_timedelta(ts) for ts in retrans])
+                                                    if isinstance(retrans[0], (int, long)) else retrans
+                                                    for retrans in flow_direction_attr[co.TIMESTAMP_RETRANS]]
+
+
+class SentSegments(object):
+
+    """ First and last times at which the segments of a direction of a TCP connection were sent, by sequence number
+        Segments are forgotten once RETRANS_HISTORY other segments have been acknowledged after them, so the memory used
+        depends on the outstanding window instead of the whole transfer
+    """
+    __slots__ = ('times', 'unacked', 'acked')
+
+    def __init__(self):
+        self.times = {}
+        # Sequence numbers of the segments not acknowledged yet, by order of (first) transmission
+        self.unacked = deque()
+        # Sequence numbers of the last acknowledged segments
+        self.acked = deque()
+
+    def __contains__(self, seq):
+        return seq in self.times
+
+    def __getitem__(self, seq):
+        """ Return [first time, last time] of the segment starting at seq (the last time can be changed) """
+        return self.times[seq]
+
+    def add(self, seq, ts):
+        """ Add the segment starting at seq sent for the first time at ts """
+        self.times[seq] = [ts, ts]
+        self.unacked.append(seq)
+
+    def ack(self, ack):
+        """ Move the segments starting before the cumulative acknowledgement ack to the history (with seq overflow) """
+        while self.unacked and 0 < (ack - self.unacked[0]) % 4294967296 < 2147483648:
+            self.acked.append(self.unacked.popleft())
+            if len(self.acked) > RETRANS_HISTORY:
+                del self.times[self.acked.popleft()]
+
+
+def process_first_syn(ts, acks, nb_acks, connections, tcp, ip, saddr, daddr, sport, dport, black_list, inverse_conns, ts_syn_timeout, ts_timeout):
     """ Processing of the first SYNs seen on a connection """
     # The sender of the first SYN is the client
     # Check if the connection is black listed or not
     conn_id = False
-    conn_candidates = inverse_conns.get((saddr, sport, daddr, dport), [])
-    min_delta = ts_syn_timeout
-    for cid in conn_candidates:
-        if abs((ts_delta - connections[cid].flow.attr[co.START]).total_seconds()) < min_delta:
-            conn_id = cid
-            min_delta = abs((ts_delta - connections[cid].flow.attr[co.START]).total_seconds())
+    conn_candidates = inverse_conns.get((saddr, sport, daddr, dport), None)
+    if conn_candidates:
+        conn_id = conn_candidates.get_closest(ts, ts_syn_timeout) or False
 
     if not conn_id:
         black_list.add((saddr, sport, daddr, dport))
@@ -683,52 +836,52 @@ def process_first_syn(ts_delta, acks, nb_acks, connections, tcp, ip, saddr, dadd
 
     backup = detect_backup_subflow(tcp)
 
-    if ((saddr, sport, daddr, dport) in acks and (ts_delta - acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT]).total_seconds() <= ts_syn_timeout
+    if ((saddr, sport, daddr, dport) in acks and ts - acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT] <= ts_syn_timeout
             and acks[saddr, sport, daddr, dport][co.S2C] == -1 and tcp.seq in acks[saddr, sport, daddr, dport][SEQ_C2S]):
         # SYN retransmission!
-        connections[conn_id].flow.attr[co.C2S][co.TIMESTAMP_RETRANS].append((ts_delta,
-                                                                             ts_delta - acks[saddr, sport, daddr, dport][HSEQ_C2S][tcp.seq][0],
-                                                                             ts_delta - acks[saddr, sport, daddr, dport][HSEQ_C2S][tcp.seq][1],
-                                                                             ts_delta - acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT]))
-        acks[saddr, sport, daddr, dport][HSEQ_C2S][tcp.seq][1] = ts_delta
+        connections[conn_id].flow.attr[co.C2S][co.TIMESTAMP_RETRANS].append((ts,
+                                                                             ts - acks[saddr, sport, daddr, dport][SEQ_C2S][tcp.seq][0],
+                                                                             ts - acks[saddr, sport, daddr, dport][SEQ_C2S][tcp.seq][1],
+                                                                             ts - acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT]))
+        acks[saddr, sport, daddr, dport][SEQ_C2S][tcp.seq][1] = ts
     else:
-        acks[saddr, sport, daddr, dport] = {co.C2S: -1, co.S2C: -1, co.TIMESTAMP: {CLIENT: ts_delta, SERVER: None}, co.CONN_ID: conn_id,
-                                            SEQ_C2S: set([tcp.seq]), SEQ_S2C: set([]), HSEQ_C2S: {tcp.seq: [ts_delta, ts_delta]}, HSEQ_S2C: {}}
+        acks[saddr, sport, daddr, dport] = {co.C2S: -1, co.S2C: -1, co.TIMESTAMP: {CLIENT: ts, SERVER: None}, co.CONN_ID: conn_id,
+                                            SEQ_C2S: SentSegments(), SEQ_S2C: SentSegments()}
+        acks[saddr, sport, daddr, dport][SEQ_C2S].add(tcp.seq, ts)
         connections[conn_id].attr[co.BACKUP] = backup
 
 
 # TODO use as standalone
-def process_syn_ack(ts_delta, acks, nb_acks, connections, tcp, ip, saddr, daddr, sport, dport, black_list, inverse_conns, ts_syn_timeout, ts_timeout):
+def process_syn_ack(ts, acks, nb_acks, connections, tcp, ip, saddr, daddr, sport, dport, black_list, inverse_conns, ts_syn_timeout, ts_timeout):
     """ Processing of SYN/ACKs seen on the connection """
     # The sender of the SYN/ACK is the server
-    if (daddr, dport, saddr, sport) in acks and ((ts_delta - acks[daddr, dport, saddr, sport][co.TIMESTAMP][CLIENT]).total_seconds() < ts_timeout
+    if (daddr, dport, saddr, sport) in acks and (ts - acks[daddr, dport, saddr, sport][co.TIMESTAMP][CLIENT] < ts_timeout
                                                  and acks[daddr, dport, saddr, sport][co.C2S] == -1):
         # Better to check, if not seen, maybe uncomplete TCP connection
         acks[daddr, dport, saddr, sport][co.C2S] = tcp.ack
-        acks[daddr, dport, saddr, sport][SEQ_S2C].add(tcp.seq)
-        acks[daddr, dport, saddr, sport][HSEQ_S2C][tcp.seq] = [ts_delta, ts_delta]
-        acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER] = ts_delta
+        acks[daddr, dport, saddr, sport][SEQ_S2C].add(tcp.seq, ts)
+        acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER] = ts
 
-    elif (daddr, dport, saddr, sport) in acks and ((ts_delta - acks[daddr, dport, saddr, sport][co.TIMESTAMP][CLIENT]).total_seconds() < ts_timeout
+    elif (daddr, dport, saddr, sport) in acks and (ts - acks[daddr, dport, saddr, sport][co.TIMESTAMP][CLIENT] < ts_timeout
                                                    and tcp.seq in acks[daddr, dport, saddr, sport][SEQ_S2C]):
         # SYN/ACK retransmission!
         conn_id = acks[daddr, dport, saddr, sport][co.CONN_ID]
-        connections[conn_id].flow.attr[co.S2C][co.TIMESTAMP_RETRANS].append((ts_delta,
-                                                                             ts_delta - acks[daddr, dport, saddr, sport][HSEQ_S2C][tcp.seq][0],
-                                                                             ts_delta - acks[daddr, dport, saddr, sport][HSEQ_S2C][tcp.seq][1],
-                                                                             ts_delta - acks[daddr, dport, saddr, sport][co.TIMESTAMP][CLIENT]))
-        acks[daddr, dport, saddr, sport][HSEQ_S2C][tcp.seq][1] = ts_delta
-        acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER] = ts_delta
+        connections[conn_id].flow.attr[co.S2C][co.TIMESTAMP_RETRANS].append((ts,
+                                                                             ts - acks[daddr, dport, saddr, sport][SEQ_S2C][tcp.seq][0],
+                                                                             ts - acks[daddr, dport, saddr, sport][SEQ_S2C][tcp.seq][1],
+                                                                             ts - acks[daddr, dport, saddr, sport][co.TIMESTAMP][CLIENT]))
+        acks[daddr, dport, saddr, sport][SEQ_S2C][tcp.seq][1] = ts
+        acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER] = ts
 
 
 # TODO use as standalone
-def process_pkt_from_client(ts_delta, acks, nb_acks, connections, tcp, ip, saddr, daddr, sport, dport, fin_flag):
+def process_pkt_from_client(ts, acks, nb_acks, connections, tcp, ip, saddr, daddr, sport, dport, fin_flag):
     """ Process a packet with ACK set from the client """
     if acks[saddr, sport, daddr, dport][co.S2C] >= 0:
         conn_id = acks[saddr, sport, daddr, dport][co.CONN_ID]
-        connections[conn_id].flow.attr[co.S2C][co.TIME_LAST_ACK_TCP] = ts_delta
+        connections[conn_id].flow.attr[co.S2C][co.TIME_LAST_ACK_TCP] = ts
         if fin_flag:
-            connections[conn_id].flow.attr[co.S2C][co.TIME_FIN_ACK_TCP] = ts_delta
+            connections[conn_id].flow.attr[co.S2C][co.TIME_FIN_ACK_TCP] = ts
 
         bytes_acked = (tcp.ack - acks[saddr, sport, daddr, dport][co.S2C]) % 4294967296
         if bytes_acked >= 2000000000:
@@ -750,33 +903,33 @@ def process_pkt_from_client(ts_delta, acks, nb_acks, connections, tcp, ip, saddr
 
         if size_payload > 0 and tcp.seq in acks[saddr, sport, daddr, dport][SEQ_C2S]:
             # This is a retransmission! (take into account the seq overflow)
-            connections[conn_id].flow.attr[co.C2S][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = ts_delta
-            connections[conn_id].flow.attr[co.C2S][co.TIMESTAMP_RETRANS].append((ts_delta,
-                                                                                 ts_delta - acks[saddr, sport, daddr, dport][HSEQ_C2S][tcp.seq][0],
-                                                                                 ts_delta - acks[saddr, sport, daddr, dport][HSEQ_C2S][tcp.seq][1],
-                                                                                 ts_delta - acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT]))
-            acks[saddr, sport, daddr, dport][HSEQ_C2S][tcp.seq][1] = ts_delta
+            connections[conn_id].flow.attr[co.C2S][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = ts
+            connections[conn_id].flow.attr[co.C2S][co.TIMESTAMP_RETRANS].append((ts,
+                                                                                 ts - acks[saddr, sport, daddr, dport][SEQ_C2S][tcp.seq][0],
+                                                                                 ts - acks[saddr, sport, daddr, dport][SEQ_C2S][tcp.seq][1],
+                                                                                 ts - acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT]))
+            acks[saddr, sport, daddr, dport][SEQ_C2S][tcp.seq][1] = ts
         elif size_payload > 0:
-            acks[saddr, sport, daddr, dport][SEQ_C2S].add(tcp.seq)
-            connections[conn_id].flow.attr[co.C2S][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = ts_delta
-            connections[conn_id].flow.attr[co.C2S][co.TIME_LAST_PAYLD_TCP] = ts_delta
-            acks[saddr, sport, daddr, dport][HSEQ_C2S][tcp.seq] = [ts_delta, ts_delta]
+            acks[saddr, sport, daddr, dport][SEQ_C2S].add(tcp.seq, ts)
+            connections[conn_id].flow.attr[co.C2S][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = ts
+            connections[conn_id].flow.attr[co.C2S][co.TIME_LAST_PAYLD_TCP] = ts
             # Don't think will face this issue
 #                                 if len(acks[saddr, sport, daddr, dport][SEQ][co.C2S]) >= 3000000:
 #                                     for x in range(50000):
 #                                         acks[saddr, sport, daddr, dport][SEQ][co.C2S].popleft()
 
     acks[saddr, sport, daddr, dport][co.S2C] = tcp.ack
-    acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT] = ts_delta
+    acks[saddr, sport, daddr, dport][SEQ_S2C].ack(tcp.ack)
+    acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT] = ts
 
 
-def process_pkt_from_server(ts_delta, acks, nb_acks, connections, tcp, ip, saddr, daddr, sport, dport, fin_flag):
+def process_pkt_from_server(ts, acks, nb_acks, connections, tcp, ip, saddr, daddr, sport, dport, fin_flag):
     """ Process a packet with ACK set from the server """
     if acks[daddr, dport, saddr, sport][co.C2S] >= 0:
         conn_id = acks[daddr, dport, saddr, sport][co.CONN_ID]
-        connections[conn_id].flow.attr[co.C2S][co.TIME_LAST_ACK_TCP] = ts_delta
+        connections[conn_id].flow.attr[co.C2S][co.TIME_LAST_ACK_TCP] = ts
         if fin_flag:
-            connections[conn_id].flow.attr[co.C2S][co.TIME_FIN_ACK_TCP] = ts_delta
+            connections[conn_id].flow.attr[co.C2S][co.TIME_FIN_ACK_TCP] = ts
 
         bytes_acked = (tcp.ack - acks[daddr, dport, saddr, sport][co.C2S]) % 4294967296
         if bytes_acked >= 2000000000:
@@ -788,88 +941,186 @@ def process_pkt_from_server(ts_delta, acks, nb_acks, connections, tcp, ip, saddr
 
         if size_payload > 0 and tcp.seq in acks[daddr, dport, saddr, sport][SEQ_S2C]:
             # This is a retransmission!
-            connections[conn_id].flow.attr[co.S2C][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = ts_delta
-            connections[conn_id].flow.attr[co.S2C][co.TIMESTAMP_RETRANS].append((ts_delta,
-                                                                                 ts_delta - acks[daddr, dport, saddr, sport][HSEQ_S2C][tcp.seq][0],
-                                                                                 ts_delta - acks[daddr, dport, saddr, sport][HSEQ_S2C][tcp.seq][1],
-                                                                                 ts_delta - acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER]))
-            acks[daddr, dport, saddr, sport][HSEQ_S2C][tcp.seq][1] = ts_delta
+            connections[conn_id].flow.attr[co.S2C][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = ts
+            connections[conn_id].flow.attr[co.S2C][co.TIMESTAMP_RETRANS].append((ts,
+                                                                                 ts - acks[daddr, dport, saddr, sport][SEQ_S2C][tcp.seq][0],
+                                                                                 ts - acks[daddr, dport, saddr, sport][SEQ_S2C][tcp.seq][1],
+                                                                                 ts - acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER]))
+            acks[daddr, dport, saddr, sport][SEQ_S2C][tcp.seq][1] = ts
         elif size_payload > 0:
-            acks[daddr, dport, saddr, sport][SEQ_S2C].add(tcp.seq)
-            connections[conn_id].flow.attr[co.S2C][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = ts_delta
-            connections[conn_id].flow.attr[co.S2C][co.TIME_LAST_PAYLD_TCP] = ts_delta
-            acks[daddr, dport, saddr, sport][HSEQ_S2C][tcp.seq] = [ts_delta, ts_delta]
+            acks[daddr, dport, saddr, sport][SEQ_S2C].add(tcp.seq, ts)
+            connections[conn_id].flow.attr[co.S2C][co.TIME_LAST_PAYLD_WITH_RETRANS_TCP] = ts
+            connections[conn_id].flow.attr[co.S2C][co.TIME_LAST_PAYLD_TCP] = ts
             # Don't think will face this issue
 #                                 if len(acks[daddr, dport, saddr, sport][SEQ][co.S2C]) >= 3000000:
 #                                     for x in range(50000):
 #                                         acks[daddr, dport, saddr, sport][SEQ][co.S2C].popleft()
 
     acks[daddr, dport, saddr, sport][co.C2S] = tcp.ack
-    acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER] = ts_delta
+    acks[daddr, dport, saddr, sport][SEQ_C2S].ack(tcp.ack)
+    acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER] = ts
 
 
-def compute_tcp_acks_retrans(pcap_filepath, connections, inverse_conns, ts_syn_timeout=6.0, ts_timeout=3600.0):
-    """ Process a tcp pcap file and returns a dictionary of the number of cases an acknowledgement of x bytes is received
-        It also compute the timestamps of retransmissions and put them in the connection
-        It computes the timestamp of the last ACK, FIN and payload sent in both directions
+def decode_tcp_packet(buf, is_sll):
+    """ Decode the packet with dpkt and return (ip, tcp, saddr, daddr, sport, dport), or None if it is not a TCP packet """
+    if is_sll:
+        eth = dpkt.sll.SLL(buf)
+    else:
+        eth = dpkt.ethernet.Ethernet(buf)
+    if type(eth.data) == dpkt.ip.IP or type(eth.data) == dpkt.ip6.IP6:
+        ip = eth.data
+        if type(ip.data) == dpkt.tcp.TCP:
+            tcp = ip.data
+            saddr, daddr, sport, dport = get_ips_and_ports(eth, ip, tcp)
+            return ip, tcp, saddr, daddr, sport, dport
+
+    return None
+
+
+def process_tcp_packets(pcap_filepath, analyzers, fast_decode=True, flow_shards=None, shard_id=None):
+    """ Read the pcap file once and give each TCP segment to all analyzers
+        An analyzer has a method process taking (ts, tcp, ip, saddr, daddr, sport, dport, fin_flag, syn_flag, rst_flag, ack_flag),
+        where ts is the timestamp in nanoseconds, and a method finish called after the last packet
+        If fast_decode is True, IPv4 TCP packets are decoded by fast_decode_tcp_packet instead of dpkt
+        If flow_shards is given (see get_flow_shards), only packets of flows in the shard shard_id are analyzed
     """
-    print("Computing TCP ack sizes for", pcap_filepath)
-    nb_acks = {co.C2S: {}, co.S2C: {}}
-    acks = {}
-    # Avoid processing packets that do not belong to any analyzed TCP connection
-    black_list = set()
-    pcap_file = open(pcap_filepath)
-    pcap = dpkt.pcap.Reader(pcap_file)
+    pcap = co.PcapReader(pcap_filepath)
+    # Check if linux cooked capture
+    is_sll = pcap.datalink() == dpkt.pcap.DLT_LINUX_SLL
+    link_hdr_len = SLL_HDR_LEN if is_sll else ETH_HDR_LEN
+    addr_names = {}
+    port_names = {}
+    process_funcs = [analyzer.process for analyzer in analyzers]
     count = 0
     try:
-        for ts, buf in pcap:
-            ts_delta = get_ts_delta(ts)
+        for ts, buf, wire_len in pcap.records():
             count += 1
             if count % 100000 == 0:
                 print(count)
-            # Check if linux cooked capture
-            if pcap.datalink() == dpkt.pcap.DLT_LINUX_SLL:
-                eth = dpkt.sll.SLL(buf)
-            else:
-                eth = dpkt.ethernet.Ethernet(buf)
-            if type(eth.data) == dpkt.ip.IP or type(eth.data) == dpkt.ip6.IP6:
-                ip = eth.data
-                if type(ip.data) == dpkt.tcp.TCP:
-                    tcp = ip.data
-                    fin_flag = (tcp.flags & dpkt.tcp.TH_FIN) != 0
-                    syn_flag = (tcp.flags & dpkt.tcp.TH_SYN) != 0
-                    rst_flag = (tcp.flags & dpkt.tcp.TH_RST) != 0
-                    ack_flag = (tcp.flags & dpkt.tcp.TH_ACK) != 0
-
-                    saddr, daddr, sport, dport = get_ips_and_ports(eth, ip, tcp)
-                    if syn_flag and not ack_flag and not fin_flag and not rst_flag:
-                        process_first_syn(ts_delta, acks, nb_acks, connections, tcp, ip, saddr, daddr, sport, dport, black_list, inverse_conns,
-                                          ts_syn_timeout, ts_timeout)
-
-                    elif (saddr, sport, daddr, dport) in black_list:
-                        continue
-
-                    elif syn_flag and ack_flag and not fin_flag and not rst_flag:
-                        process_syn_ack(ts_delta, acks, nb_acks, connections, tcp, saddr, ip, daddr, sport, dport, black_list, inverse_conns,
-                                        ts_syn_timeout, ts_timeout)
-
-                    elif not syn_flag and not rst_flag and ack_flag:
-                        if (saddr, sport, daddr, dport) in acks:
-                            process_pkt_from_client(ts_delta, acks, nb_acks, connections, tcp, ip, saddr, daddr, sport, dport, fin_flag)
-
-                        elif (daddr, dport, saddr, sport) in acks:
-                            process_pkt_from_server(ts_delta, acks, nb_acks, connections, tcp, ip, saddr, daddr, sport, dport, fin_flag)
-                        else:
-                            # Silently ignore those packets
-                            # print(saddr, sport, daddr, dport, "haven't seen beginning...")
-                            continue
+            decoded = fast_decode_tcp_packet(buf, link_hdr_len, addr_names, port_names) if fast_decode else None
+            if decoded is None:
+                decoded = decode_tcp_packet(str(buf), is_sll)
+                if decoded is None:
+                    continue
+
+            ip, tcp, saddr, daddr, sport, dport = decoded
+            if flow_shards is not None and flow_shards.get((saddr, sport, daddr, dport)) != shard_id:
+                continue
+
+            fin_flag = (tcp.flags & dpkt.tcp.TH_FIN) != 0
+            syn_flag = (tcp.flags & dpkt.tcp.TH_SYN) != 0
+            rst_flag = (tcp.flags & dpkt.tcp.TH_RST) != 0
+            ack_flag = (tcp.flags & dpkt.tcp.TH_ACK) != 0
+
+            for process in process_funcs:
+                process(ts, tcp, ip, saddr, daddr, sport, dport, fin_flag, syn_flag, rst_flag, ack_flag)
 
     except dpkt.NeedData as e:
         print(e, ": trying to continue...", file=sys.stderr)
     finally:
-        pcap_file.close()
+        pcap.close()
 
-    return nb_acks
+    for analyzer in analyzers:
+        analyzer.finish()
+
+
+class TCPAcksRetransAnalyzer(object):
+
+    """ Analyzer for process_tcp_packets computing nb_acks, the number of cases an acknowledgement of x bytes is received
+        It also compute the timestamps of retransmissions and put them in the connection
+        It computes the timestamp of the last ACK, FIN and payload sent in both directions
+        Timestamps are in nanoseconds during the processing and converted in timedelta objects by finish
+        If streaming is True, the state of connections closed (RST or FIN in both directions) for fin_timeout seconds or idle
+        for ts_timeout seconds is forgotten (and their timestamps converted), so the memory used depends on the number of
+        concurrent connections instead of all connections of the trace
+    """
+
+    def __init__(self, connections, inverse_conns, ts_syn_timeout=6.0, ts_timeout=3600.0, streaming=False,
+                 fin_timeout=FIN_TIMEOUT):
+        self.connections = connections
+        self.inverse_conns = inverse_conns
+        self.ts_syn_timeout = int(ts_syn_timeout * co.NS_PER_SEC)
+        self.ts_timeout = int(ts_timeout * co.NS_PER_SEC)
+        self.streaming = streaming
+        self.fin_timeout = int(fin_timeout * co.NS_PER_SEC)
+        self.next_eviction = 0
+        self.nb_acks = {co.C2S: {}, co.S2C: {}}
+        self.acks = {}
+        # Avoid processing packets that do not belong to any analyzed TCP connection
+        self.black_list = set()
+
+    def process_closing(self, ts, saddr, daddr, sport, dport, fin_flag, rst_flag):
+        """ Note the FIN or RST of a connection, to forget its state fin_timeout after it is closed """
+        if (saddr, sport, daddr, dport) in self.acks:
+            conn_acks, side = self.acks[saddr, sport, daddr, dport], CLIENT
+        elif (daddr, dport, saddr, sport) in self.acks:
+            conn_acks, side = self.acks[daddr, dport, saddr, sport], SERVER
+        else:
+            return
+
+        fins = conn_acks.setdefault(FINS, set())
+        if fin_flag:
+            fins.add(side)
+        if rst_flag or len(fins) == 2:
+            conn_acks[CLOSED] = ts
+
+    def evict(self, ts):
+        """ Forget the state of connections closed for fin_timeout or idle for ts_timeout and convert their timestamps """
+        for key, conn_acks in self.acks.items():
+            last_ts = max(conn_acks[co.TIMESTAMP][CLIENT], conn_acks[co.TIMESTAMP][SERVER], conn_acks.get(CLOSED, None))
+            if ts - last_ts > (self.fin_timeout if CLOSED in conn_acks else self.ts_timeout):
+                del self.acks[key]
+                for direction in co.DIRECTIONS:
+                    convert_tcp_times_to_timedelta(self.connections[conn_acks[co.CONN_ID]].flow.attr[direction])
+
+        # Packets of black listed connections without state are ignored anyway
+        self.black_list.intersection_update(self.acks)
+        self.next_eviction = ts + int(EVICTION_INTERVAL * co.NS_PER_SEC)
+
+    def process(self, ts, tcp, ip, saddr, daddr, sport, dport, fin_flag, syn_flag, rst_flag, ack_flag):
+        if self.streaming:
+            if fin_flag or rst_flag:
+                self.process_closing(ts, saddr, daddr, sport, dport, fin_flag, rst_flag)
+            if ts >= self.next_eviction:
+                self.evict(ts)
+
+        if syn_flag and not ack_flag and not fin_flag and not rst_flag:
+            process_first_syn(ts, self.acks, self.nb_acks, self.connections, tcp, ip, saddr, daddr, sport, dport, self.black_list,
+                              self.inverse_conns, self.ts_syn_timeout, self.ts_timeout)
+
+        elif (saddr, sport, daddr, dport) in self.black_list:
+            return
+
+        elif syn_flag and ack_flag and not fin_flag and not rst_flag:
+            process_syn_ack(ts, self.acks, self.nb_acks, self.connections, tcp, saddr, ip, daddr, sport, dport, self.black_list,
+                            self.inverse_conns, self.ts_syn_timeout, self.ts_timeout)
+
+        elif not syn_flag and not rst_flag and ack_flag:
+            if (saddr, sport, daddr, dport) in self.acks:
+                process_pkt_from_client(ts, self.acks, self.nb_acks, self.connections, tcp, ip, saddr, daddr, sport, dport, fin_flag)
+
+            elif (daddr, dport, saddr, sport) in self.acks:
+                process_pkt_from_server(ts, self.acks, self.nb_acks, self.connections, tcp, ip, saddr, daddr, sport, dport, fin_flag)
+
+            # Otherwise, silently ignore those packets
+            # print(saddr, sport, daddr, dport, "haven't seen beginning...")
+
+    def finish(self):
+        for conn in self.connections.itervalues():
+            for direction in co.DIRECTIONS:
+                convert_tcp_times_to_timedelta(conn.flow.attr[direction])
+
+
+def compute_tcp_acks_retrans(pcap_filepath, connections, inverse_conns, ts_syn_timeout=6.0, ts_timeout=3600.0, streaming=False):
+    """ Process a tcp pcap file and returns a dictionary of the number of cases an acknowledgement of x bytes is received
+        It also compute the timestamps of retransmissions and put them in the connection
+        It computes the timestamp of the last ACK, FIN and payload sent in both directions
+    """
+    print("Computing TCP ack sizes for", pcap_filepath)
+    analyzer = TCPAcksRetransAnalyzer(connections, inverse_conns, ts_syn_timeout=ts_syn_timeout, ts_timeout=ts_timeout,
+                                      streaming=streaming)
+    process_tcp_packets(pcap_filepath, [analyzer])
+    return analyzer.nb_acks
 
 
 def get_dss_and_data_ack(tcp):
@@ -918,19 +1169,14 @@ def get_dss_and_data_ack(tcp):
     return dss, dack, dss_is_8_bytes
 
 
-def process_mptcp_first_syn(ts_delta, acks, conn_acks, mptcp_connections, tcp, ip, saddr, daddr, sport, dport, black_list, fast_conns, ts_syn_timeout, ts_timeout):
+def process_mptcp_first_syn(ts, acks, conn_acks, mptcp_connections, tcp, ip, saddr, daddr, sport, dport, black_list, fast_conns, ts_syn_timeout, ts_timeout):
     """ Processing of the first SYNs seen on a connection for the MPTCP DSS retransmissions """
     # The sender of the first SYN is the client
     # Check if the connection is black listed or not
     conn_id = False
-    conn_candidates = fast_conns.get((saddr, daddr, sport, dport), [])
-    min_delta = ts_syn_timeout
-    for start, duration, cid, fid in conn_candidates:
-        if (co.START in mptcp_connections[cid].flows[fid].attr
-                and abs((ts_delta - mptcp_connections[cid].flows[fid].attr[co.START]).total_seconds()) < min_delta):
-            conn_id = cid
-            flow_id = fid
-            min_delta = abs((ts_delta - mptcp_connections[cid].flows[fid].attr[co.START]).total_seconds())
+    conn_candidates = fast_conns.get((saddr, daddr, sport, dport), None)
+    if conn_candidates:
+        conn_id, flow_id = conn_candidates.get_closest(ts, ts_syn_timeout) or (False, None)
 
     if not conn_id:
         black_list.add((saddr, sport, daddr, dport))
@@ -938,37 +1184,39 @@ def process_mptcp_first_syn(ts_delta, acks, conn_acks, mptcp_connections, tcp, i
     elif conn_id and (saddr, sport, daddr, dport) in black_list:
         black_list.remove((saddr, sport, daddr, dport))
 
-    if ((saddr, sport, daddr, dport) in acks and (ts_delta - acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT]).total_seconds() <= ts_syn_timeout
+    if ((saddr, sport, daddr, dport) in acks and ts - acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT] <= ts_syn_timeout
             and acks[saddr, sport, daddr, dport][co.S2C] == -1) and conn_id in conn_acks:
         # SYN retransmission! But do nothing particular
-        acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT] = ts_delta
-        conn_acks[conn_id][co.TIMESTAMP][CLIENT] = ts_delta
+        acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT] = ts
+        conn_acks[conn_id][co.TIMESTAMP][CLIENT] = ts
     else:
-        acks[saddr, sport, daddr, dport] = {co.C2S: -1, co.S2C: -1, co.TIMESTAMP: {CLIENT: ts_delta, SERVER: None}, co.CONN_ID: conn_id,
+        acks[saddr, sport, daddr, dport] = {co.C2S: -1, co.S2C: -1, co.TIMESTAMP: {CLIENT: ts, SERVER: None}, co.CONN_ID: conn_id,
                                             co.FLOW_ID: flow_id}
-        conn_acks[conn_id] = {co.C2S: -1, co.S2C: -1, co.TIMESTAMP: {CLIENT: ts_delta, SERVER: None}, SEQ_C2S: set(), SEQ_S2C: set(), HSEQ_C2S: {},
+        conn_acks[conn_id] = {co.C2S: -1, co.S2C: -1, co.TIMESTAMP: {CLIENT: ts, SERVER: None}, SEQ_C2S: set(), SEQ_S2C: set(), HSEQ_C2S: {},
                               HSEQ_S2C: {}}
 
 
-def process_mptcp_syn_ack(ts_delta, acks, conn_acks, mptcp_connections, tcp, ip, saddr, daddr, sport, dport, black_list, fast_conns, ts_syn_timeout, ts_timeout):
+def process_mptcp_syn_ack(ts, acks, conn_acks, mptcp_connections, tcp, ip, saddr, daddr, sport, dport, black_list, fast_conns, ts_syn_timeout, ts_timeout):
     """ Processing of SYN/ACKs seen on the connection for the MPTCP DSS retransmissions """
     # The sender of the SYN/ACK is the server
-    if (daddr, dport, saddr, sport) in acks and ((ts_delta - acks[daddr, dport, saddr, sport][co.TIMESTAMP][CLIENT]).total_seconds() < ts_timeout
+    if (daddr, dport, saddr, sport) in acks and (ts - acks[daddr, dport, saddr, sport][co.TIMESTAMP][CLIENT] < ts_timeout
                                                  and acks[daddr, dport, saddr, sport][co.C2S] == -1):
         # Better to check, if not seen, maybe uncomplete TCP connection
         acks[daddr, dport, saddr, sport][co.C2S] = tcp.ack
-        acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER] = ts_delta
-        conn_acks[acks[daddr, dport, saddr, sport][co.CONN_ID]][co.TIMESTAMP][SERVER] = ts_delta
+        acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER] = ts
+        conn_acks[acks[daddr, dport, saddr, sport][co.CONN_ID]][co.TIMESTAMP][SERVER] = ts
 
-    elif (daddr, dport, saddr, sport) in acks and ((ts_delta - acks[daddr, dport, saddr, sport][co.TIMESTAMP][CLIENT]).total_seconds() < ts_timeout
+    elif (daddr, dport, saddr, sport) in acks and (ts - acks[daddr, dport, saddr, sport][co.TIMESTAMP][CLIENT] < ts_timeout
                                                    and tcp.ack == acks[daddr, dport, saddr, sport][co.C2S]):
         # SYN/ACK retransmission! But don't do anything special
-        acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER] = ts_delta
-        conn_acks[acks[daddr, dport, saddr, sport][co.CONN_ID]][co.TIMESTAMP][SERVER] = ts_delta
+        acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER] = ts
+        conn_acks[acks[daddr, dport, saddr, sport][co.CONN_ID]][co.TIMESTAMP][SERVER] = ts
 
 
-def process_mptcp_pkt_from_client(ts_delta, acks, conn_acks, mptcp_connections, tcp, ip, saddr, daddr, sport, dport):
-    """ Process a packet with ACK set from the client for the MPTCP DSS retransmissions """
+def process_mptcp_pkt_from_client(ts, acks, conn_acks, mptcp_connections, tcp, ip, saddr, daddr, sport, dport, check_last_ack=True):
+    """ Process a packet with ACK set from the client for the MPTCP DSS retransmissions
+        If check_last_ack is False, retransmissions after the last TCP ACK are kept (see remove_dss_retrans_after_last_ack)
+    """
     dss, dack, dss_is_8_bytes = get_dss_and_data_ack(tcp)
     conn_id = acks[saddr, sport, daddr, dport][co.CONN_ID]
     flow_id = acks[saddr, sport, daddr, dport][co.FLOW_ID]
@@ -982,24 +1230,26 @@ def process_mptcp_pkt_from_client(ts_delta, acks, conn_acks, mptcp_connections,
         size_payload = ip.len - ip.hl * 4 - tcp.off * 4
 
         if (size_payload > 0 and dss in conn_acks[conn_id][SEQ_C2S] and (dss - conn_acks[conn_id][co.C2S]) % max_val < 2000000000
-                and (mptcp_connections[conn_id].attr[co.C2S][co.TIME_LAST_ACK_TCP] - ts_delta).total_seconds() > 0.0):
+                and (not check_last_ack or timedelta_to_ns(mptcp_connections[conn_id].attr[co.C2S][co.TIME_LAST_ACK_TCP]) > ts)):
             # This is a DSS retransmission! (take into account the seq overflow)
-            mptcp_connections[conn_id].attr[co.C2S][co.RETRANS_DSS].append((ts_delta, flow_id, dss, conn_acks[conn_id][HSEQ_C2S][dss][2],
-                                                                            ts_delta - conn_acks[conn_id][HSEQ_C2S][dss][0],
-                                                                            ts_delta - conn_acks[conn_id][HSEQ_C2S][dss][1],
-                                                                            ts_delta - conn_acks[conn_id][co.TIMESTAMP][CLIENT]))
-            conn_acks[conn_id][HSEQ_C2S][dss][1] = ts_delta
+            mptcp_connections[conn_id].attr[co.C2S][co.RETRANS_DSS].append((ts, flow_id, dss, conn_acks[conn_id][HSEQ_C2S][dss][2],
+                                                                            ts - conn_acks[conn_id][HSEQ_C2S][dss][0],
+                                                                            ts - conn_acks[conn_id][HSEQ_C2S][dss][1],
+                                                                            ts - conn_acks[conn_id][co.TIMESTAMP][CLIENT]))
+            conn_acks[conn_id][HSEQ_C2S][dss][1] = ts
         elif size_payload > 0 and dss is not False:
             conn_acks[conn_id][SEQ_C2S].add(dss)
-            conn_acks[conn_id][HSEQ_C2S][dss] = [ts_delta, ts_delta, ts_delta - conn_acks[conn_id][co.TIMESTAMP][CLIENT]]
+            conn_acks[conn_id][HSEQ_C2S][dss] = [ts, ts, ts - conn_acks[conn_id][co.TIMESTAMP][CLIENT]]
 
     conn_acks[conn_id][co.S2C] = dack
-    acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT] = ts_delta
-    conn_acks[conn_id][co.TIMESTAMP][CLIENT] = ts_delta
+    acks[saddr, sport, daddr, dport][co.TIMESTAMP][CLIENT] = ts
+    conn_acks[conn_id][co.TIMESTAMP][CLIENT] = ts
 
 
-def process_mptcp_pkt_from_server(ts_delta, acks, conn_acks, mptcp_connections, tcp, ip, saddr, daddr, sport, dport):
-    """ Process a packet with ACK set from the server for the MPTCP DSS retransmissions """
+def process_mptcp_pkt_from_server(ts, acks, conn_acks, mptcp_connections, tcp, ip, saddr, daddr, sport, dport, check_last_ack=True):
+    """ Process a packet with ACK set from the server for the MPTCP DSS retransmissions
+        If check_last_ack is False, retransmissions after the last TCP ACK are kept (see remove_dss_retrans_after_last_ack)
+    """
     dss, dack, dss_is_8_bytes = get_dss_and_data_ack(tcp)
     conn_id = acks[daddr, dport, saddr, sport][co.CONN_ID]
     flow_id = acks[daddr, dport, saddr, sport][co.FLOW_ID]
@@ -1013,109 +1263,313 @@ def process_mptcp_pkt_from_server(ts_delta, acks, conn_acks, mptcp_connections,
         size_payload = ip.len - ip.hl * 4 - tcp.off * 4
 
         if (size_payload > 0 and dss in conn_acks[conn_id][SEQ_S2C] and (dss - conn_acks[conn_id][co.S2C]) % max_val < 2000000000
-                and (mptcp_connections[conn_id].attr[co.S2C][co.TIME_LAST_ACK_TCP] - ts_delta).total_seconds() > 0.0):
+                and (not check_last_ack or timedelta_to_ns(mptcp_connections[conn_id].attr[co.S2C][co.TIME_LAST_ACK_TCP]) > ts)):
             # This is a DSS retransmission!
-            mptcp_connections[conn_id].attr[co.S2C][co.RETRANS_DSS].append((ts_delta, flow_id, dss, conn_acks[conn_id][HSEQ_S2C][dss][2],
-                                                                            ts_delta - conn_acks[conn_id][HSEQ_S2C][dss][0],
-                                                                            ts_delta - conn_acks[conn_id][HSEQ_S2C][dss][1],
-                                                                            ts_delta - conn_acks[conn_id][co.TIMESTAMP][SERVER]))
-            conn_acks[conn_id][HSEQ_S2C][dss][1] = ts_delta
+            mptcp_connections[conn_id].attr[co.S2C][co.RETRANS_DSS].append((ts, flow_id, dss, conn_acks[conn_id][HSEQ_S2C][dss][2],
+                                                                            ts - conn_acks[conn_id][HSEQ_S2C][dss][0],
+                                                                            ts - conn_acks[conn_id][HSEQ_S2C][dss][1],
+                                                                            ts - conn_acks[conn_id][co.TIMESTAMP][SERVER]))
+            conn_acks[conn_id][HSEQ_S2C][dss][1] = ts
         elif size_payload > 0 and dss is not False:
             conn_acks[conn_id][SEQ_S2C].add(dss)
-            conn_acks[conn_id][HSEQ_S2C][dss] = [ts_delta, ts_delta, ts_delta - conn_acks[conn_id][co.TIMESTAMP][SERVER]]
+            conn_acks[conn_id][HSEQ_S2C][dss] = [ts, ts, ts - conn_acks[conn_id][co.TIMESTAMP][SERVER]]
 
     conn_acks[conn_id][co.C2S] = dack
-    acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER] = ts_delta
-    conn_acks[conn_id][co.TIMESTAMP][SERVER] = ts_delta
+    acks[daddr, dport, saddr, sport][co.TIMESTAMP][SERVER] = ts
+    conn_acks[conn_id][co.TIMESTAMP][SERVER] = ts
+
+
+class MPTCPDSSRetransAnalyzer(object):
+
+    """ Analyzer for process_tcp_packets computing MPTCP DSS retransmissions (avoid taking into account spurious ones)
+        If check_last_ack is True, the TIME_LAST_ACK_TCP of MPTCP connections must be known
+        fast_conns is given by get_preprocessed_flows
+        Timestamps are in nanoseconds during the processing and converted in timedelta objects by finish
+    """
+
+    def __init__(self, mptcp_connections, fast_conns, ts_syn_timeout=6.0, ts_timeout=3600.0, check_last_ack=True):
+        self.mptcp_connections = mptcp_connections
+        self.fast_conns = fast_conns
+        self.ts_syn_timeout = int(ts_syn_timeout * co.NS_PER_SEC)
+        self.ts_timeout = int(ts_timeout * co.NS_PER_SEC)
+        self.check_last_ack = check_last_ack
+        self.acks = {}
+        self.conn_acks = {}
+        # Avoid processing packets that do not belong to any analyzed TCP connection
+        self.black_list = set()
+
+    def process(self, ts, tcp, ip, saddr, daddr, sport, dport, fin_flag, syn_flag, rst_flag, ack_flag):
+        if syn_flag and not ack_flag and not fin_flag and not rst_flag:
+            process_mptcp_first_syn(ts, self.acks, self.conn_acks, self.mptcp_connections, tcp, ip, saddr, daddr, sport, dport, self.black_list,
+                                    self.fast_conns, self.ts_syn_timeout, self.ts_timeout)
+
+        elif (saddr, sport, daddr, dport) in self.black_list:
+            return
+
+        elif syn_flag and ack_flag and not fin_flag and not rst_flag:
+            process_mptcp_syn_ack(ts, self.acks, self.conn_acks, self.mptcp_connections, tcp, ip, saddr, daddr, sport, dport, self.black_list,
+                                  self.fast_conns, self.ts_syn_timeout, self.ts_timeout)
+
+        elif not syn_flag and not rst_flag and ack_flag:
+            if (saddr, sport, daddr, dport) in self.acks:
+                process_mptcp_pkt_from_client(ts, self.acks, self.conn_acks, self.mptcp_connections, tcp, ip, saddr, daddr, sport, dport,
+                                              check_last_ack=self.check_last_ack)
+
+            elif (daddr, dport, saddr, sport) in self.acks:
+                process_mptcp_pkt_from_server(ts, self.acks, self.conn_acks, self.mptcp_connections, tcp, ip, saddr, daddr, sport, dport,
+                                              check_last_ack=self.check_last_ack)
+
+            # Otherwise, silently ignore those packets
+            # print(saddr, sport, daddr, dport, "haven't seen beginning...")
+
+    def finish(self):
+        for conn in self.mptcp_connections.itervalues():
+            for direction in co.DIRECTIONS:
+                # (ts, flow_id, dss, idle time, time since first sent, time since last sent, time since last packet)
+                conn.attr[direction][co.RETRANS_DSS][:] = [(ns_to_timedelta(ts), flow_id, dss, ns_to_timedelta(idle), ns_to_timedelta(first),
+                                                            ns_to_timedelta(last), ns_to_timedelta(last_all))
+                                                           if isinstance(ts, (int, long)) else (ts, flow_id, dss, idle, first, last, last_all)
+                                                           for ts, flow_id, dss, idle, first, last, last_all in conn.attr[direction][co.RETRANS_DSS]]
+
+
+def remove_dss_retrans_after_last_ack(mptcp_connections):
+    """ Remove DSS retransmissions found with check_last_ack set to False that are not before the last TCP ACK
+        With packets in chronological order, this gives the same result as checking it during the processing:
+        before the last ACK, the check is always true, and after it, no retransmission is kept
+    """
+    for conn_id, conn in mptcp_connections.iteritems():
+        for direction in co.DIRECTIONS:
+            last_ack = conn.attr[direction][co.TIME_LAST_ACK_TCP]
+            conn.attr[direction][co.RETRANS_DSS] = [retrans for retrans in conn.attr[direction][co.RETRANS_DSS]
+                                                    if (last_ack - retrans[0]).total_seconds() > 0.0]
 
 
 def compute_mptcp_dss_retransmissions(pcap_filepath, mptcp_connections, fast_conns, ts_syn_timeout=6.0, ts_timeout=3600.0):
     """ Compute MPTCP DSS retransmissions (avoid taking into account spurious ones) """
     print("Computing MPTCP DSS retransmissions for", pcap_filepath)
-    acks = {}
-    conn_acks = {}
-    # Avoid processing packets that do not belong to any analyzed TCP connection
-    black_list = set()
-    pcap_file = open(pcap_filepath)
-    pcap = dpkt.pcap.Reader(pcap_file)
-    count = 0
-    for ts, buf in pcap:
-        ts_delta = get_ts_delta(ts)
-        count += 1
-        if count % 100000 == 0:
-            print(count)
-        eth = dpkt.ethernet.Ethernet(buf)
-        if type(eth.data) == dpkt.ip.IP or type(eth.data) == dpkt.ip6.IP6:
-            ip = eth.data
-            if type(ip.data) == dpkt.tcp.TCP:
-                tcp = ip.data
-                fin_flag = (tcp.flags & dpkt.tcp.TH_FIN) != 0
-                syn_flag = (tcp.flags & dpkt.tcp.TH_SYN) != 0
-                rst_flag = (tcp.flags & dpkt.tcp.TH_RST) != 0
-                ack_flag = (tcp.flags & dpkt.tcp.TH_ACK) != 0
-
-                saddr, daddr, sport, dport = get_ips_and_ports(eth, ip, tcp)
-
-                if syn_flag and not ack_flag and not fin_flag and not rst_flag:
-                    process_mptcp_first_syn(ts_delta, acks, conn_acks, mptcp_connections, tcp, ip, saddr, daddr, sport, dport, black_list, fast_conns,
-                                            ts_syn_timeout, ts_timeout)
-
-                elif (saddr, sport, daddr, dport) in black_list:
-                    continue
+    analyzer = MPTCPDSSRetransAnalyzer(mptcp_connections, fast_conns, ts_syn_timeout=ts_syn_timeout, ts_timeout=ts_timeout)
+    process_tcp_packets(pcap_filepath, [analyzer])
 
-                elif syn_flag and ack_flag and not fin_flag and not rst_flag:
-                    process_mptcp_syn_ack(ts_delta, acks, conn_acks, mptcp_connections, tcp, ip, saddr, daddr, sport, dport, black_list, fast_conns,
-                                          ts_syn_timeout, ts_timeout)
 
-                elif not syn_flag and not rst_flag and ack_flag:
-                    if (saddr, sport, daddr, dport) in acks:
-                        process_mptcp_pkt_from_client(ts_delta, acks, conn_acks, mptcp_connections, tcp, ip, saddr, daddr, sport, dport)
+##################################################
+#            SHARDED PROCESSING OF TRACE         #
+##################################################
 
-                    elif (daddr, dport, saddr, sport) in acks:
-                        process_mptcp_pkt_from_server(ts_delta, acks, conn_acks, mptcp_connections, tcp, ip, saddr, daddr, sport, dport)
-                    else:
-                        # Silently ignore those packets
-                        # print(saddr, sport, daddr, dport, "haven't seen beginning...")
-                        continue
 
-    pcap_file.close()
+def create_retrans_analyzers(connections, inverse_conns, mptcp_connections=None, fast_conns=None, streaming=False):
+    """ Return the analyzers computing TCP ack sizes and retransmissions, and MPTCP DSS retransmissions (without the
+        check of the last TCP ACK) if mptcp_connections is given, with the dictionary of ack sizes they will fill
+        streaming is given to TCPAcksRetransAnalyzer
+    """
+    tcp_analyzer = TCPAcksRetransAnalyzer(connections, inverse_conns, streaming=streaming)
+    analyzers = [tcp_analyzer]
+    if mptcp_connections:
+        analyzers.append(MPTCPDSSRetransAnalyzer(mptcp_connections, fast_conns, check_last_ack=False))
 
+    return analyzers, tcp_analyzer.nb_acks
+
+
+def get_flow_key(flow):
+    """ Return the (saddr, sport, daddr, dport) of the flow """
+    return (flow.attr[co.SADDR], flow.attr[co.SPORT], flow.attr[co.DADDR], flow.attr[co.DPORT])
 
-def process_trace(pcap_filepath, graph_dir_exp, stat_dir_exp, failed_conns_dir_exp, acksize_tcp_dir_exp, tcpcsm, mptcp_connections=None, print_out=sys.stdout, light=False, return_dict=False):
-    """ Process a tcp pcap file and generate stats of its connections """
-    cmd = ['tstat', '-s', os.path.basename(pcap_filepath[:-5]), pcap_filepath]
+
+def get_flow_shards(connections, mptcp_connections, nb_shards):
+    """ Return a dictionary giving the shard of each (saddr, sport, daddr, dport) of the flows, in both directions
+        Connections with the same ports and all subflows of a MPTCP connection are in the same shard
+        Shards are balanced on the number of packets of their connections
+    """
+    # Flows that must be in the same shard form a group; each flow points to another flow of its group
+    groups = {}
+    weights = {}
+
+    def add_flow(key):
+        key = min(key, (key[2], key[3], key[0], key[1]))
+        if key not in groups:
+            groups[key] = key
+            weights[key] = 0
+        return key
+
+    def find_group(key):
+        while groups[key] != key:
+            groups[key] = groups[groups[key]]
+            key = groups[key]
+        return key
+
+    for conn in connections.itervalues():
+        key = add_flow(get_flow_key(conn.flow))
+        weights[key] += conn.flow.attr[co.C2S].get(co.PACKS, 0) + conn.flow.attr[co.S2C].get(co.PACKS, 0)
+
+    if mptcp_connections:
+        for conn in mptcp_connections.itervalues():
+            keys = [add_flow(get_flow_key(flow)) for flow in conn.flows.itervalues()]
+            for key in keys[1:]:
+                groups[find_group(key)] = find_group(keys[0])
+
+    group_weights = {}
+    for key in groups:
+        group = find_group(key)
+        group_weights[group] = group_weights.get(group, 0) + weights[key]
+
+    # Give the heaviest groups first to the least loaded shard
+    loads = [0] * nb_shards
+    group_shards = {}
+    for group in sorted(group_weights, key=lambda group: group_weights[group], reverse=True):
+        shard_id = loads.index(min(loads))
+        group_shards[group] = shard_id
+        loads[shard_id] += group_weights[group]
+
+    flow_shards = {}
+    for key in groups:
+        flow_shards[key] = flow_shards[(key[2], key[3], key[0], key[1])] = group_shards[find_group(key)]
+
+    return flow_shards
+
+
+def process_tcp_packets_shard(pcap_filepath, shard_id, flow_shards, connections, inverse_conns, mptcp_connections, fast_conns,
+                              streaming, result_queue):
+    """ Body of a process analyzing the flows of the shard shard_id
+        Report on result_queue (shard_id, info of its TCP connections, ack sizes, DSS retransmissions of its MPTCP connections)
+    """
+    analyzers, nb_acks = create_retrans_analyzers(connections, inverse_conns, mptcp_connections=mptcp_connections, fast_conns=fast_conns,
+                                                  streaming=streaming)
+    process_tcp_packets(pcap_filepath, analyzers, flow_shards=flow_shards, shard_id=shard_id)
+
+    tcp_info = {}
+    for conn_id, conn in connections.iteritems():
+        if flow_shards[get_flow_key(conn.flow)] == shard_id:
+            tcp_info[conn_id] = (conn.attr, conn.flow.attr)
+
+    mptcp_info = {}
+    if mptcp_connections:
+        for conn_id, conn in mptcp_connections.iteritems():
+            if conn.flows and flow_shards[get_flow_key(conn.flows.values()[0])] == shard_id:
+                mptcp_info[conn_id] = dict([(direction, conn.attr[direction][co.RETRANS_DSS]) for direction in co.DIRECTIONS])
+
+    result_queue.put((shard_id, tcp_info, nb_acks, mptcp_info))
+
+
+def compute_sharded_retransmissions(pcap_filepath, nb_shards, connections, inverse_conns, mptcp_connections=None, fast_conns=None,
+                                    streaming=False):
+    """ Compute the information of create_retrans_analyzers with nb_shards processes, each of them analyzing the packets
+        of a shard of the flows, and merge their results in connections and mptcp_connections
+        If a process fails, the trace is processed again without sharding
+        Return the ack sizes of the TCP connections
+    """
+    print("Computing TCP ack sizes and retransmissions with", nb_shards, "shards for", pcap_filepath)
+    flow_shards = get_flow_shards(connections, mptcp_connections, nb_shards)
+    result_queue = Queue()
+    processes = []
+    for shard_id in range(nb_shards):
+        processes.append(Process(target=process_tcp_packets_shard, args=(pcap_filepath, shard_id, flow_shards, connections, inverse_conns,
+                                                                          mptcp_connections, fast_conns, streaming, result_queue)))
+        processes[-1].start()
+
+    # Get results before joining processes, otherwise a process with a large result could never end
+    results = []
+    failed = False
+    while len(results) < nb_shards and not failed:
+        try:
+            results.append(result_queue.get(timeout=SHARD_POLL_DELAY))
+        except Empty:
+            # A process that ended correctly has sent its result
+            failed = any(process.exitcode not in (None, 0) for process in processes)
+
+    for process in processes:
+        if failed and process.is_alive():
+            process.terminate()
+        process.join()
+
+    if failed:
+        print("Error when processing a shard of " + pcap_filepath + ": process it again without sharding", file=sys.stderr)
+        analyzers, nb_acks = create_retrans_analyzers(connections, inverse_conns, mptcp_connections=mptcp_connections, fast_conns=fast_conns,
+                                                      streaming=streaming)
+        process_tcp_packets(pcap_filepath, analyzers)
+        return nb_acks
+
+    nb_acks = {co.C2S: {}, co.S2C: {}}
+    for shard_id, tcp_info, shard_nb_acks, mptcp_info in results:
+        for conn_id, (attr, flow_attr) in tcp_info.iteritems():
+            connections[conn_id].attr = attr
+            connections[conn_id].flow.attr = flow_attr
+
+        for direction in co.DIRECTIONS:
+            nb_acks[direction].update(shard_nb_acks[direction])
+
+        for conn_id, retrans_dss in mptcp_info.iteritems():
+            for direction in co.DIRECTIONS:
+                mptcp_connections[conn_id].attr[direction][co.RETRANS_DSS] = retrans_dss[direction]
+
+    return nb_acks
+
+
+def process_trace(pcap_filepath, graph_dir_exp, stat_dir_exp, failed_conns_dir_exp, acksize_tcp_dir_exp, tcpcsm, mptcp_connections=None, print_out=sys.stdout, light=False, return_dict=False, nb_shards=1, overlap_tools=False, tools=None, streaming=False):
+    """ Process a tcp pcap file and generate stats of its connections
+        If nb_shards > 1, packets are analyzed by nb_shards processes, each of them with a shard of the flows
+        If overlap_tools is True, the external tools analyze the trace at the same time
+        tools are the external tools already started by launch_tools, if any
+        If streaming is True, the state of closed or idle connections is forgotten during the analysis of packets (see
+        TCPAcksRetransAnalyzer)
+    """
+    if not tools:
+        # With overlap_tools, tcpcsm analyzes the trace at the same time as tstat
+        tools = launch_tools(pcap_filepath, tcpcsm and overlap_tools)
 
     keep_tstat_log = False if return_dict else True
 
     try:
-        connections = process_tstat_cmd(cmd, pcap_filepath, keep_log=keep_tstat_log, graph_dir_exp=graph_dir_exp)
+        connections = process_tstat(tools[TSTAT], pcap_filepath, keep_log=keep_tstat_log, graph_dir_exp=graph_dir_exp)
     except TstatError as e:
         print(str(e) + ": skip process", file=sys.stderr)
+        kill_tools(pcap_filepath, tools)
         return
 
     # Directory containing all TCPConnections that tried to be MPTCP subflows, but failed to
     failed_conns = {}
 
     if tcpcsm:
-        retransmissions_tcpcsm(pcap_filepath, connections)
+        retransmissions_tcpcsm(pcap_filepath, connections, tcpcsm_process=tools.get(TCPCSM, None))
 
     acksize_all = {co.C2S: {}, co.S2C: {}}
 
-    if not light:
+    if not light and not mptcp_connections:
         inverse_conns = create_inverse_tcp_dictionary(connections)
 
-        acksize_all = compute_tcp_acks_retrans(pcap_filepath, connections, inverse_conns)
+        if nb_shards > 1:
+            acksize_all = compute_sharded_retransmissions(pcap_filepath, nb_shards, connections, inverse_conns, streaming=streaming)
+        else:
+            acksize_all = compute_tcp_acks_retrans(pcap_filepath, connections, inverse_conns, streaming=streaming)
 
     acksize_all_mptcp = {co.C2S: {}, co.S2C: {}}
 
     if mptcp_connections:
         fast_conns = get_preprocessed_connections(mptcp_connections)
-        for flow_id in connections:
-            # Copy info to mptcp connections
-            copy_info_to_mptcp_connections(connections, mptcp_connections, failed_conns, acksize_all, acksize_all_mptcp, flow_id,
-                                           fast_conns=fast_conns)
+        # Copy info to mptcp connections (needed for the MPTCP processing of packets)
+        matches = {}
+        for flow_name in connections:
+            matches[flow_name] = copy_info_to_mptcp_connections(connections, mptcp_connections, failed_conns, acksize_all, acksize_all_mptcp,
+                                                                flow_name, fast_conns=fast_conns)
 
         if not light:
+            # Compute TCP ack sizes and retransmissions and MPTCP DSS retransmissions with a single read of the trace
+            # The last TCP ACK of MPTCP connections is only known at the end, so check DSS retransmissions afterwards
+            inverse_conns = create_inverse_tcp_dictionary(connections)
+            fast_flows = get_preprocessed_flows(mptcp_connections)
+            if nb_shards > 1:
+                acksize_all = compute_sharded_retransmissions(pcap_filepath, nb_shards, connections, inverse_conns,
+                                                              mptcp_connections=mptcp_connections, fast_conns=fast_flows, streaming=streaming)
+            else:
+                print("Computing TCP ack sizes and MPTCP DSS retransmissions for", pcap_filepath)
+                analyzers, acksize_all = create_retrans_analyzers(connections, inverse_conns, mptcp_connections=mptcp_connections,
+                                                                  fast_conns=fast_flows, streaming=streaming)
+                process_tcp_packets(pcap_filepath, analyzers)
+
+            # Copy again info computed from the trace
+            for flow_name, (conn_id, flow_id) in matches.iteritems():
+                if isinstance(conn_id, (int, long)):
+                    copy_trace_info_to_mptcp_flow(connections, mptcp_connections, acksize_all, acksize_all_mptcp, flow_name, conn_id,
+                                                  flow_id)
+
             for conn_id, conn in mptcp_connections.iteritems():
                 for direction in co.DIRECTIONS:
                     max_ack = timedelta(0)
@@ -1130,10 +1584,7 @@ def process_trace(pcap_filepath, graph_dir_exp, stat_dir_exp, failed_conns_dir_e
                     mptcp_connections[conn_id].attr[direction][co.TIME_LAST_ACK_TCP] = max_ack
                     mptcp_connections[conn_id].attr[direction][co.TIME_LAST_PAYLD_TCP] = max_payload
 
-            try:
-                compute_mptcp_dss_retransmissions(pcap_filepath, mptcp_connections, fast_conns)
-            except dpkt.NeedData as e:
-                print(e, ": trying to continue...", file=sys.stderr)
+            remove_dss_retrans_after_last_ack(mptcp_connections)
 
     if return_dict:
         if mptcp_connections:
@@ -1149,3 +1600,4 @@ def process_trace(pcap_filepath, graph_dir_exp, stat_dir_exp, failed_conns_dir_e
         else:
             co.save_data(pcap_filepath, acksize_tcp_dir_exp, acksize_all)
             co.save_data(pcap_filepath, stat_dir_exp, connections)
+            co.save_columns(pcap_filepath, stat_dir_exp, connections)